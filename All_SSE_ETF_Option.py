@@ -3,12 +3,36 @@ import pandas as pd
 import akshare as ak
 import datetime
 import time
-import requests
-import base64
 import os
 import threading
-from concurrent.futures import ThreadPoolExecutor, as_completed
 from dateutil.relativedelta import relativedelta
+from http_session import configure_http_pool, install_akshare_http_pool, get_http_pool_stats
+from option_premium import (
+    split_call_put, parse_option_quote, select_option_price, calculate_premium_row, PREMIUM_COLUMNS,
+    QUOTE_WINDOW_ALL, QUOTE_WINDOW_MODES, QUOTE_WINDOW_STRIKES, QUOTE_WINDOW_PERCENT, get_quote_window
+)
+from quote_archive import archive_refresh_in_background, get_archive_status
+from alert_rules import evaluate_alerts
+from snapshot_api import start_snapshot_api, publish_snapshot, get_snapshot_api_address, get_snapshot_api_error
+from refresh_profiler import profile_refresh, format_profile_artifact
+from option_board import BOARD_FETCH_WORKERS, get_option_board, get_board_cache_status
+from history_charts import downsample_rollup, downsample_strike_series
+from premium_rollup import build_daily_rollup, build_strike_index
+from refresh_deadline import (
+    REFRESH_DEADLINE_SECONDS, REFRESH_STAGE_WORKERS, STAGE_GROUP, configure_fetch_pool, run_with_deadline, run_stage,
+    get_last_known, prune_last_known, get_fetch_status
+)
+from arbitrage_scanner import DEFAULT_FEE_PER_CONTRACT, DEFAULT_RISK_FREE_RATE, scan_arbitrage
+from warm_start import load_warm_start, save_option_mapping, save_warm_start
+from option_mapping import get_option_mapping, clear_option_mapping
+from intraday_stats import update_intraday_stats, previous_close_from_history, get_intraday_stats_status
+from snapshot_worker import configure_snapshot_worker, start_snapshot_worker, seed_snapshot, request_refresh, get_worker_status
+from save_queue import fetch_history, fetch_rollup, fetch_strike_index, expand_history, configure_save_queue, enqueue_save, start_uploader, get_save_queue_status
+from underlying_registry import get_board_symbols, get_spot_codes, get_spot_code, get_display_names, get_refresh_budgets, normalize_board, reload_registry
+from trading_calendar import (
+    BEIJING_TZ, is_trading_time, get_previous_trade_dates, get_current_trade_date, get_refresh_interval,
+    get_next_refresh_time, describe_trading_sessions
+)
 
 # 页面配置
 st.set_page_config(
@@ -23,333 +47,108 @@ GITHUB_REPO = "SSEOptions"
 GITHUB_FILE_PATH = "All_SSE_ETF_Option_Premium_Log.csv"
 GITHUB_TOKEN = st.secrets["GT"]
 
-# 全局变量存储最新的计算结果
+# 贴水计算的并发线程数
+PREMIUM_MAX_WORKERS = 10
+# 连接池大小按同时发请求的线程数：贴水计算线程池 + 板块数据线程池 + 刷新步骤线程池 + 后台快照线程和保存上传线程
+HTTP_POOL_MAXSIZE = PREMIUM_MAX_WORKERS + BOARD_FETCH_WORKERS + REFRESH_STAGE_WORKERS + 2
+# 后台刷新的实时报价范围（all/strikes/percent）：后台刷新由进程内所有会话共用，范围由部署统一设置，
+# 不随某个会话的页面设置变化；范围外的行权价使用板块价格，页面上的范围设置只筛选显示
+REFRESH_QUOTE_WINDOW = {
+    'all': QUOTE_WINDOW_ALL, 'strikes': QUOTE_WINDOW_STRIKES, 'percent': QUOTE_WINDOW_PERCENT
+}.get(os.environ.get("QUOTE_WINDOW", "all"), QUOTE_WINDOW_ALL)
+REFRESH_QUOTE_WINDOW_STRIKES = int(os.environ.get("QUOTE_WINDOW_STRIKES", "5"))
+REFRESH_QUOTE_WINDOW_PERCENT = float(os.environ.get("QUOTE_WINDOW_PERCENT", "5.0"))
+# 页面检查后台刷新进度和新快照的间隔（秒）
+SNAPSHOT_POLL_SECONDS = 2
+
+# 所有上游请求共用带keep-alive的连接池（在启动任何后台线程之前设置，线程创建的Session使用最终的池大小）
+configure_http_pool(HTTP_POOL_MAXSIZE)
+install_akshare_http_pool(
+    ak.option_finance_board,
+    ak.option_risk_indicator_sse,
+    ak.option_sse_spot_price_sina,
+    ak.option_sse_underlying_spot_price_sina,
+    ak.tool_trade_date_hist_sina
+)
+
+# 贴水计算使用进程内常驻的线程池，超过截止时间的任务在后台继续执行
+configure_fetch_pool(PREMIUM_MAX_WORKERS)
+
+# 保存请求写入本地日志，由后台线程上传（也会上传进程重启前遗留的待上传数据）
+configure_save_queue(GITHUB_OWNER, GITHUB_REPO, GITHUB_FILE_PATH, GITHUB_TOKEN)
+start_uploader()
+
+# 供下游系统轮询的只读快照API（JSON/Arrow）
+start_snapshot_api()
+
+# 数据获取和贴水计算在后台线程中执行，页面只显示最新的快照，不等待刷新
+start_snapshot_worker()
+
+# 进程启动后加载上一次保存的快照、期权代码映射和板块缓存，页面不必等待完整获取
+warm_df, warm_time = load_warm_start()
+if warm_df is not None:
+    seed_snapshot({'premium_df': warm_df, 'refreshed_at': warm_time, 'warm': True})
+    publish_snapshot(warm_df, warm_time or datetime.datetime.now(BEIJING_TZ))
+
+# 全局变量存储本会话正在显示的快照数据（保存按钮使用）
 if 'latest_premium_data' not in st.session_state:
     st.session_state.latest_premium_data = None
 
-# 从GitHub读取数据的函数
-def read_data_from_github(debug_mode=False):
-    """从GitHub仓库读取CSV数据"""
-    try:
-        url = f"https://api.github.com/repos/{GITHUB_OWNER}/{GITHUB_REPO}/contents/{GITHUB_FILE_PATH}"
-        headers = {"Authorization": f"token {GITHUB_TOKEN}"}
-        response = requests.get(url, headers=headers)
-        
-        if response.status_code == 200:
-            # 文件存在，获取内容
-            file_info = response.json()
-            
-            # 添加详细的调试信息 - 检查原始响应
-            if debug_mode:
-                st.info(f"📡 GitHub API响应状态: {response.status_code}")
-                st.info(f"📄 文件信息键: {list(file_info.keys())}")
-                if 'size' in file_info:
-                    st.info(f"📏 GitHub文件大小: {file_info['size']} 字节")
-                if 'content' in file_info:
-                    raw_content = file_info['content']
-                    st.info(f"📦 Base64内容长度: {len(raw_content)} 字符")
-                    st.info(f"📝 Base64内容预览: {raw_content[:100]}...")
-            
-            # 优先尝试使用download_url获取内容（更可靠）
-            if 'download_url' in file_info and file_info['download_url']:
-                if debug_mode:
-                    st.info(f"🔗 优先使用下载URL获取内容: {file_info['download_url']}")
-                try:
-                    download_response = requests.get(file_info['download_url'])
-                    if download_response.status_code == 200:
-                        content = download_response.text
-                        if debug_mode:
-                            st.success(f"✅ 通过下载URL成功获取内容，长度: {len(content)} 字符")
-                            st.info(f"📖 内容预览: {content[:200]}")
-                        else:
-                            st.info(f"📁 通过下载URL读取文件，内容长度: {len(content)} 字符")
-                        
-                        # 直接处理获取的内容，跳过Base64解码
-                        if not content or content.strip() == "":
-                            if debug_mode:
-                                st.warning("⚠️ 下载的文件内容为空")
-                            return pd.DataFrame(), file_info.get('sha')
-                        
-                        # 解析CSV
-                        from io import StringIO
-                        try:
-                            df = pd.read_csv(StringIO(content))
-                            if debug_mode:
-                                st.info(f"📊 CSV解析成功: {len(df)}行 x {len(df.columns)}列")
-                                if len(df.columns) > 0:
-                                    st.info(f"📋 列名: {list(df.columns)}")
-                            
-                            if df.empty and len(df.columns) == 0:
-                                if debug_mode:
-                                    st.warning("⚠️ CSV文件解析后没有任何列")
-                                return pd.DataFrame(), file_info.get('sha')
-                            else:
-                                if not debug_mode and not df.empty:
-                                    st.info(f"📁 读取到历史数据: {len(df)}条记录")
-                                return df, file_info.get('sha')
-                                
-                        except Exception as csv_error:
-                            st.error(f"❌ CSV解析失败: {str(csv_error)}")
-                            if debug_mode:
-                                st.error(f"内容预览: {content[:200]}")
-                            return pd.DataFrame(), file_info.get('sha')
-                            
-                except Exception as download_error:
-                    st.warning(f"⚠️ 下载URL获取失败: {str(download_error)}")
-                    if debug_mode:
-                        st.info("💡 回退到Base64解码方式")
-            
-            # 如果download_url失败或不存在，尝试Base64解码
-            if 'content' not in file_info:
-                st.error("❌ GitHub API响应中没有'content'字段且无法通过下载URL获取")
-                return pd.DataFrame(), file_info.get('sha')
-            
-            # 尝试解码内容
-            try:
-                raw_content = file_info['content']
-                # 移除可能的换行符和空格
-                raw_content = raw_content.replace('\n', '').replace('\r', '').replace(' ', '')
-                
-                if debug_mode:
-                    st.info(f"🧹 清理后Base64长度: {len(raw_content)} 字符")
-                
-                # 尝试Base64解码
-                decoded_bytes = base64.b64decode(raw_content)
-                
-                if debug_mode:
-                    st.info(f"🔓 解码后字节长度: {len(decoded_bytes)} 字节")
-                
-                # 尝试多种编码方式解码
-                content = None
-                encodings = ['utf-8-sig', 'utf-8', 'gbk', 'gb2312', 'latin1']
-                
-                for encoding in encodings:
-                    try:
-                        content = decoded_bytes.decode(encoding)
-                        if debug_mode:
-                            st.info(f"✅ 使用 {encoding} 编码成功解码")
-                        break
-                    except UnicodeDecodeError:
-                        if debug_mode:
-                            st.warning(f"⚠️ {encoding} 编码解码失败，尝试下一个")
-                        continue
-                
-                if content is None:
-                    st.error("❌ 所有编码方式都无法解码文件内容")
-                    return pd.DataFrame(), file_info.get('sha')
-                    
-            except Exception as decode_error:
-                st.error(f"❌ Base64解码失败: {str(decode_error)}")
-                if debug_mode:
-                    st.error(f"原始content前100字符: {file_info.get('content', '')[:100]}")
-                return pd.DataFrame(), file_info.get('sha')
-            
-            # 添加详细的调试信息
-            content_length = len(content) if content else 0
-            content_preview = content[:200] if content else "无内容"
-            
-            if debug_mode:
-                st.info(f"📁 最终解码内容长度: {content_length} 字符")
-                st.info(f"📖 内容预览: {content_preview}")
-            else:
-                st.info(f"📁 读取GitHub文件，内容长度: {content_length} 字符")
-            
-            # 检查内容是否为空或只包含空白字符
-            if not content or content.strip() == "":
-                if debug_mode:
-                    st.warning("⚠️ GitHub上的文件完全为空，将创建新的数据文件")
-                return pd.DataFrame(), file_info['sha']
-            
-            # 从字符串创建DataFrame
-            from io import StringIO
-            try:
-                df = pd.read_csv(StringIO(content))
-                
-                # 添加详细的数据信息
-                if debug_mode:
-                    st.info(f"📊 成功解析CSV数据: {len(df)}行 x {len(df.columns)}列")
-                    if len(df.columns) > 0:
-                        st.info(f"📋 列名: {list(df.columns)}")
-                
-                # 只有在真正没有数据时才返回空DataFrame
-                if df.empty and len(df.columns) == 0:
-                    if debug_mode:
-                        st.warning("⚠️ CSV文件解析后没有任何列，将创建新的数据文件")
-                    return pd.DataFrame(), file_info['sha']
-                elif df.empty:
-                    if debug_mode:
-                        st.info("📝 CSV文件有列名但没有数据行，这是正常的，将追加新数据")
-                    return df, file_info['sha']  # 返回有列名的空DataFrame
-                else:
-                    if debug_mode:
-                        st.success(f"✅ 成功读取历史数据: {len(df)}条记录")
-                    else:
-                        st.info(f"📁 读取到历史数据: {len(df)}条记录")
-                    return df, file_info['sha']
-                    
-            except pd.errors.EmptyDataError:
-                if debug_mode:
-                    st.warning("⚠️ CSV文件完全为空（无列名无数据），将创建新的数据文件")
-                return pd.DataFrame(), file_info['sha']
-            except Exception as parse_error:
-                st.error(f"❌ 解析CSV文件时出错: {str(parse_error)}")
-                if debug_mode:
-                    st.error(f"文件内容预览: {content_preview}")
-                st.warning("将尝试创建新的数据文件")
-                return pd.DataFrame(), file_info['sha']
-                
-        elif response.status_code == 404:
-            # 文件不存在，返回空的DataFrame
-            st.info("📂 GitHub上的文件不存在，将创建新的数据文件")
-            return pd.DataFrame(), None
-        else:
-            # 其他错误
-            st.error(f"❌ 访问GitHub文件失败: {response.status_code} - {response.text}")
-            return pd.DataFrame(), None
-            
-    except Exception as e:
-        st.error(f"❌ 从GitHub读取数据时出错: {str(e)}")
-        return pd.DataFrame(), None
+# 整理要保存的数据（页面保存按钮和后台"刷新并保存"共用）
+def prepare_save_data(premium_df, board_keys=None):
+    """返回(要保存的DataFrame, 记录日期, 板块合约键)
+
+    board_keys为快照获取到的板块合约[(ETF类型, 合约月份, 行权价)]，换成简称后用于判断合约是否下架；
+    没有时（热启动的快照）为None，不写删除标记。
+    """
+    # 准备要保存的数据
+    data_to_save = premium_df.copy()
+    
+    # 对数值列进行4位小数格式化
+    if '贴水价值' in data_to_save.columns:
+        data_to_save['贴水价值'] = data_to_save['贴水价值'].round(4)
+    if '年化贴水率' in data_to_save.columns:
+        data_to_save['年化贴水率'] = data_to_save['年化贴水率'].round(4)
+    if '行权价' in data_to_save.columns:
+        data_to_save['行权价'] = data_to_save['行权价'].round(4)
+    if '剩余天数' in data_to_save.columns:
+        data_to_save['剩余天数'] = data_to_save['剩余天数'].astype(int)  # 只保留整数部分
+    
+    # 添加当前日期列
+    current_date = datetime.date.today().strftime('%Y-%m-%d')
+    data_to_save['记录日期'] = current_date
+    
+    # 重新排列列的顺序，将日期放在最后（保持与现有格式一致）
+    # ETF价格只用于计算日度汇总表中的平值贴水，不写入贴水日志
+    columns_order = ['ETF类型', '合约月份', '行权价', '贴水价值', '年化贴水率', '剩余天数', '记录日期', 'ETF价格']
+    data_to_save = data_to_save.reindex(columns=columns_order)
+    
+    # 改进的ETF类型名称显示
+    etf_display_names = get_display_names()
+    
+    # 替换ETF类型名称为简化版本
+    data_to_save['ETF类型'] = data_to_save['ETF类型'].map(etf_display_names)
+    listed = None
+    if board_keys is not None:
+        listed = [[etf_display_names.get(etf_type, etf_type), month, strike] for etf_type, month, strike in board_keys]
+    return data_to_save, current_date, listed
 
 # 保存数据到GitHub的函数
 def save_data_to_github():
-    """保存当前数据到GitHub仓库"""
+    """保存当前数据到GitHub仓库（写入本地保存队列，后台上传）"""
     if st.session_state.latest_premium_data is None or st.session_state.latest_premium_data.empty:
         st.error("没有可保存的数据，请先运行数据获取")
         return False
     
     try:
-        # 准备要保存的数据
-        data_to_save = st.session_state.latest_premium_data.copy()
-        
-        # 对数值列进行4位小数格式化
-        if '贴水价值' in data_to_save.columns:
-            data_to_save['贴水价值'] = data_to_save['贴水价值'].round(4)
-        if '年化贴水率' in data_to_save.columns:
-            data_to_save['年化贴水率'] = data_to_save['年化贴水率'].round(4)
-        if '行权价' in data_to_save.columns:
-            data_to_save['行权价'] = data_to_save['行权价'].round(4)
-        if '剩余天数' in data_to_save.columns:
-            data_to_save['剩余天数'] = data_to_save['剩余天数'].astype(int)  # 只保留整数部分
-        
-        # 添加当前日期列
-        current_date = datetime.date.today().strftime('%Y-%m-%d')
-        data_to_save['记录日期'] = current_date
-        
-        # 重新排列列的顺序，将日期放在最后（保持与现有格式一致）
-        columns_order = ['ETF类型', '合约月份', '行权价', '贴水价值', '年化贴水率', '剩余天数', '记录日期']
-        data_to_save = data_to_save[columns_order]
+        data_to_save, current_date, listed = prepare_save_data(
+            st.session_state.latest_premium_data, st.session_state.get('latest_board_keys')
+        )
         
-        # 改进的ETF类型名称显示
-        etf_display_names = {
-            "华泰柏瑞沪深300ETF期权": "300ETF",
-            "南方中证500ETF期权": "500ETF", 
-            "华夏上证50ETF期权": "50ETF",
-            "华夏科创50ETF期权": "科创50ETF",
-            "易方达科创50ETF期权": "科创板50ETF"
-        }
-        
-        # 替换ETF类型名称为简化版本
-        data_to_save['ETF类型'] = data_to_save['ETF类型'].map(etf_display_names)
-        
-        # 从GitHub读取现有数据
-        # 获取debug_mode状态，默认为False
-        debug_mode = st.session_state.get('debug_mode', False)
-        existing_data, sha = read_data_from_github(debug_mode=debug_mode)
-        
-        # 简化的数据合并信息
-        if not existing_data.empty:
-            # 检查是否有今日数据需要替换
-            today_records = existing_data[existing_data['记录日期'] == current_date] if '记录日期' in existing_data.columns else pd.DataFrame()
-            if not today_records.empty:
-                existing_data = existing_data[existing_data['记录日期'] != current_date]
-            
-            # 合并数据
-            final_data = pd.concat([existing_data, data_to_save], ignore_index=True)
-            st.success(f"✅ 数据已合并到历史文件，总计 {len(final_data)} 条记录")
-        else:
-            # 没有现有数据，使用新数据
-            final_data = data_to_save
-            st.info(f"📝 创建新的数据文件，包含 {len(data_to_save)} 条记录")
-        
-        # 按日期排序
-        final_data = final_data.sort_values('记录日期', ascending=False)
-        
-        # 将DataFrame转换为CSV字符串
-        csv_content = final_data.to_csv(index=False, encoding='utf-8-sig')
-        
-        # 编码内容
-        encoded_content = base64.b64encode(csv_content.encode('utf-8-sig')).decode()
-        
-        # 准备提交数据
-        payload = {
-            "message": f"Update {GITHUB_FILE_PATH} via API - {current_date}",
-            "content": encoded_content
-        }
-        
-        # 如果文件已存在且有SHA值，添加sha（用于更新现有文件）
-        if sha:
-            payload["sha"] = sha
-        
-        # 如果没有SHA但尝试更新文件时失败，尝试重新获取SHA
-        if not sha:
-            # 再次尝试获取文件信息，防止并发操作导致的问题
-            try:
-                url_check = f"https://api.github.com/repos/{GITHUB_OWNER}/{GITHUB_REPO}/contents/{GITHUB_FILE_PATH}"
-                headers_check = {"Authorization": f"token {GITHUB_TOKEN}"}
-                response_check = requests.get(url_check, headers=headers_check)
-                if response_check.status_code == 200:
-                    file_info_check = response_check.json()
-                    sha = file_info_check.get('sha')
-                    if sha:
-                        payload["sha"] = sha
-            except Exception as sha_retry_error:
-                pass  # 静默处理SHA重试错误
-        
-        # 提交到GitHub
-        url = f"https://api.github.com/repos/{GITHUB_OWNER}/{GITHUB_REPO}/contents/{GITHUB_FILE_PATH}"
-        headers = {"Authorization": f"token {GITHUB_TOKEN}"}
-        response = requests.put(url, json=payload, headers=headers)
-        
-        if response.status_code in [200, 201]:
-            st.success(f"✅ 数据已保存到GitHub仓库，共 {len(data_to_save)} 条记录")
-            return True
-        elif response.status_code == 422:
-            # 422错误通常是SHA问题，尝试强制刷新
-            try:
-                error_info = response.json()
-                if "sha" in str(error_info).lower():
-                    # 强制重新获取最新的文件状态
-                    time.sleep(1)  # 短暂等待
-                    fresh_data, fresh_sha = read_data_from_github()
-                    
-                    if fresh_sha and fresh_sha != sha:
-                        # 使用最新的SHA重新尝试
-                        payload["sha"] = fresh_sha
-                        
-                        response_retry = requests.put(url, json=payload, headers=headers)
-                        if response_retry.status_code in [200, 201]:
-                            st.success(f"✅ 数据已保存到GitHub仓库，共 {len(data_to_save)} 条记录")
-                            return True
-                        else:
-                            st.error(f"保存失败: {response_retry.status_code}")
-                            return False
-                    else:
-                        st.error("无法获取有效的SHA值进行重试")
-                        return False
-                else:
-                    st.error(f"保存失败: 422错误")
-                    return False
-            except Exception as retry_error:
-                st.error(f"保存过程中出现异常: {str(retry_error)}")
-                return False
-        else:
-            try:
-                error_detail = response.json()
-                st.error(f"保存到GitHub失败: {response.status_code} - {error_detail}")
-            except:
-                st.error(f"保存到GitHub失败: {response.status_code} - {response.text}")
-            return False
+        # 写入本地保存队列后立即返回，由后台线程合并并上传到GitHub
+        pending_count = enqueue_save(data_to_save, current_date, listed)
+        st.success(f"✅ 已加入保存队列（{len(data_to_save)} 条记录），后台将自动上传到GitHub，当前待上传 {pending_count} 批")
+        return True
         
     except Exception as e:
         st.error(f"保存数据时出错: {str(e)}")
@@ -358,7 +157,7 @@ def save_data_to_github():
 # 标题和说明
 st.title("All SSE ETF Options Premium Dashboard")
 st.markdown("""
-本仪表板展示全部上交所ETF期权的贴水分析数据，每5分钟自动刷新一次。
+本仪表板展示沪深两市ETF期权的贴水分析数据，交易时间内自动刷新。
 数据将保存到GitHub仓库中。
 """)
 
@@ -460,66 +259,38 @@ with col2:
 with col3:
     refresh_and_save_button = st.button("🔄💾 刷新并保存", help="先刷新数据，然后自动保存到GitHub")
 with col4:
-    auto_refresh = st.checkbox("启用自动刷新(每5分钟，仅交易时间9:30-15:15)", value=True)
+    auto_refresh = st.checkbox(f"启用自动刷新(开盘/收盘前后每1分钟，盘中每5分钟，仅交易时间{describe_trading_sessions()})", value=True)
 with col5:
     debug_mode = st.checkbox("🐛 调试模式", value=False, help="显示详细的数据处理信息")
     # 将debug_mode状态存储到session_state
     st.session_state['debug_mode'] = debug_mode
+    # 调试模式下可以对下一次刷新做性能分析
+    profile_next_refresh = debug_mode and st.checkbox("⏱️ 性能分析", value=False, help="对下一次数据刷新采集CPU采样和内存分配数据")
+
+# 显示范围：只显示平值附近的行权价（只影响本会话的显示，后台刷新的范围见REFRESH_QUOTE_WINDOW）
+with st.sidebar.expander("🎯 显示范围", expanded=False):
+    quote_window_mode = st.radio("显示的行权价", QUOTE_WINDOW_MODES, index=0, key="quote_window_mode")
+    quote_window_strikes = st.number_input("平值上下档数N", min_value=1, max_value=30, value=5, step=1, key="quote_window_strikes")
+    quote_window_percent = st.number_input("平值上下幅度X(%)", min_value=0.5, max_value=50.0, value=5.0, step=0.5, key="quote_window_percent")
 
-# 上次更新时间显示
-last_update = st.empty()
+# 套利扫描：用快照的买卖价检查盒式价差和蝶式凸性，利润需覆盖手续费（按本会话的设置在显示时扫描）
+with st.sidebar.expander("🔍 套利扫描设置", expanded=False):
+    arbitrage_fee = st.number_input("每张手续费(元)", min_value=0.0, max_value=50.0, value=DEFAULT_FEE_PER_CONTRACT, step=0.1, key="arbitrage_fee")
+    arbitrage_rate = st.number_input("无风险利率(%)", min_value=0.0, max_value=10.0, value=DEFAULT_RISK_FREE_RATE * 100, step=0.1, key="arbitrage_rate")
 
 # 获取上一个交易日的函数
 def get_previous_trade_date():
-    """获取上一个交易日的日期"""
-    today = datetime.date.today()
-    # 如果今天是周一，上一个交易日是上周五
-    if today.weekday() == 0:  # 周一
-        previous_date = today - datetime.timedelta(days=3)
-    # 如果今天是周日，上一个交易日是上周五
-    elif today.weekday() == 6:  # 周日
-        previous_date = today - datetime.timedelta(days=2)
-    # 其他情况，上一个交易日是昨天
-    else:
-        previous_date = today - datetime.timedelta(days=1)
-    
-    return previous_date.strftime("%Y%m%d")
+    """获取上一个交易日的日期（按交易日历，跳过周末和节假日）"""
+    return get_previous_trade_dates(1)[0].strftime("%Y%m%d")
 
-# 检查是否在交易时间的函数
-def is_trading_time():
-    """检查当前是否为交易时间（工作日9:30-15:15，北京时间UTC+8）"""
-    # 获取北京时间（UTC+8）
-    beijing_tz = datetime.timezone(datetime.timedelta(hours=8))
-    now = datetime.datetime.now(beijing_tz)
-    
-    # 检查是否为工作日（周一到周五）
-    if now.weekday() >= 5:  # 周六=5, 周日=6
-        return False
-    
-    # 检查时间是否在9:30-15:15之间
-    trading_start = now.replace(hour=9, minute=30, second=0, microsecond=0)
-    trading_end = now.replace(hour=15, minute=15, second=0, microsecond=0)
-    
-    return trading_start <= now <= trading_end
-
-# 建立期权代码映射关系
-@st.cache_data(ttl=43200)  # 缓存12小时
-def get_option_code_mapping():
+# 建立期权代码映射关系（由option_mapping在进程内缓存12小时）
+def fetch_option_code_mapping():
     """建立CONTRACT_ID到SECURITY_ID的映射关系"""
     mapping = {}
     
     def get_previous_working_days(num_days=10):
-        """获取上一个工作日开始的日期列表，排除周六周日"""
-        dates = []
-        current_date = datetime.date.today()
-        
-        while len(dates) < num_days:
-            current_date -= datetime.timedelta(days=1)
-            # 跳过周六(5)和周日(6)
-            if current_date.weekday() < 5:  # 0-4是周一到周五
-                dates.append(current_date.strftime("%Y%m%d"))
-        
-        return dates
+        """获取上一个交易日开始的日期列表，排除周末和节假日"""
+        return [date.strftime("%Y%m%d") for date in get_previous_trade_dates(num_days)]
     
     try:
         # 获取最近的工作日列表
@@ -565,475 +336,692 @@ def get_option_code_mapping():
             except Exception as row_error:
                 continue
         
+        # 保存到本地，供进程重启后使用
+        try:
+            if mapping:
+                save_option_mapping(mapping)
+        except Exception as save_error:
+            pass  # 保存失败不影响本次使用
+        
         return mapping
         
     except Exception as e:
         return {}
 
-# 获取实时期权价格
-def get_real_time_option_price(security_id, option_type):
-    """获取实时期权价格，Call使用卖价，Put使用买价"""
+# 获取实时期权报价
+def get_real_time_option_quote(security_id):
+    """获取实时期权报价（买卖价、最新价、买卖量），失败返回None"""
     try:
         option_data = ak.option_sse_spot_price_sina(symbol=security_id)
-        
-        if option_type == 'C':  # Call期权使用卖价
-            try:
-                price = float(option_data[option_data['字段'] == '卖价']['值'].iloc[0])
-                if price <= 0:  # 如果卖价为0或负数，使用最新价
-                    price = float(option_data[option_data['字段'] == '最新价']['值'].iloc[0])
-            except (IndexError, KeyError, ValueError):
-                # 如果卖价不可用，尝试最新价
-                price = float(option_data[option_data['字段'] == '最新价']['值'].iloc[0])
-        else:  # Put期权使用买价
-            try:
-                price = float(option_data[option_data['字段'] == '买价']['值'].iloc[0])
-                if price <= 0:  # 如果买价为0或负数，使用最新价
-                    price = float(option_data[option_data['字段'] == '最新价']['值'].iloc[0])
-            except (IndexError, KeyError, ValueError):
-                # 如果买价不可用，尝试最新价
-                price = float(option_data[option_data['字段'] == '最新价']['值'].iloc[0])
-            
-        return round(price, 4) if price > 0 else None  # 保留4位小数
-        
+        return parse_option_quote(option_data)
     except Exception as e:
         return None
 
-# 获取基础期权数据（缓存12小时）
-@st.cache_data(ttl=43200)
-def get_basic_option_data():
-    """获取基础期权数据，缓存12小时"""
-    etf_symbols = [
-        "华泰柏瑞沪深300ETF期权",      # 300ETF
-        "南方中证500ETF期权",          # 500ETF
-        "华夏上证50ETF期权",           # 50ETF
-        "华夏科创50ETF期权",           # 科创50ETF
-        "易方达科创50ETF期权"          # 科创板50ETF
-    ]
+# 盘中统计列（年化贴水率的开盘/最高/最低/EWMA和较昨收，百分比显示）
+INTRADAY_DISPLAY_COLUMNS = ['开盘', '最高', '最低', 'EWMA', '较昨收']
+
+# 按(ETF, 合约月份)分列显示贴水表，intraday_stats为各行的盘中统计（索引与premium_df相同）
+def display_premium_tables(premium_df, intraday_stats=None):
+    # 改进的ETF类型名称显示
+    etf_display_names = get_display_names()
     
-    # 自动获取合约月份
-    contract_months = get_contract_months()
+    # 计算需要的列数
+    unique_combinations = premium_df.groupby(['ETF类型', '合约月份']).size()
+    num_combinations = len(unique_combinations)
     
-    all_option_data = []
-    for symbol in etf_symbols:
-        for month in contract_months:
-            try:
-                option_data = ak.option_finance_board(symbol=symbol, end_month=month)
-                if not option_data.empty:
-                    option_data['ETF类型'] = symbol
-                    all_option_data.append(option_data)
-            except Exception as e:
-                st.warning(f"获取 {symbol} {month} 月合约失败: {str(e)}")
-                continue
+    # 动态调整列数，最多4列
+    num_cols = min(4, num_combinations)
+    cols = st.columns(num_cols)
+    
+    for i, ((etf_type, month), group) in enumerate(premium_df.groupby(['ETF类型', '合约月份'])):
+        with cols[i % num_cols]:  # 循环使用列
+            # 替换ETF类型名称
+            display_name = etf_display_names.get(etf_type, etf_type)
+            st.subheader(f"{display_name} - {month}月合约")
+            
+            # 复制一份数据避免修改原始数据
+            display_df = group.copy()
+            stats_columns = []
+            if intraday_stats is not None:
+                display_df = display_df.join(intraday_stats[INTRADAY_DISPLAY_COLUMNS] * 100)
+                stats_columns = INTRADAY_DISPLAY_COLUMNS
+            # 将年化贴水率转换为百分比格式前先排序
+            display_df = display_df.sort_values('年化贴水率', ascending=True)
+            # 将年化贴水率转换为百分比格式，保留4位小数
+            display_df['年化贴水率'] = (display_df['年化贴水率'] * 100).round(4).astype(str) + '%'
+            # 未在截止时间内完成的行权价显示上一次的值，标记⏳
+            if '过期' in display_df.columns:
+                display_df.loc[display_df['过期'].fillna(False).astype(bool), '年化贴水率'] += ' ⏳'
+            # 热启动的旧快照可能没有反向贴水和价差宽度，补为空列
+            display_df = display_df.reindex(columns=display_df.columns.union(['反向年化贴水率', '价差宽度'], sort=False))
+            # 反向年化贴水率以百分比数值显示，没有完整买卖报价时为空
+            display_df['反向年化贴水率'] = display_df['反向年化贴水率'].astype(float) * 100
+            # 对其他数值列进行4位小数格式化
+            if '贴水价值' in display_df.columns:
+                display_df['贴水价值'] = display_df['贴水价值'].round(4)
+            if '行权价' in display_df.columns:
+                display_df['行权价'] = display_df['行权价'].round(4)
+            if '剩余天数' in display_df.columns:
+                display_df['剩余天数'] = display_df['剩余天数'].astype(int)  # 只保留整数部分
+            # 设置紧凑布局
+            st.dataframe(
+                display_df[['行权价', '贴水价值', '年化贴水率'] + stats_columns + ['反向年化贴水率', '价差宽度', '剩余天数']],
+                use_container_width=True,
+                height=300,  # 调整高度适应更多数据
+                hide_index=True,  # 隐藏索引
+                column_config={
+                    "行权价": st.column_config.NumberColumn(width="small", format="%.4f"),
+                    "贴水价值": st.column_config.NumberColumn(width="small", format="%.4f"),
+                    "年化贴水率": st.column_config.TextColumn(width="small"),
+                    **{column: st.column_config.NumberColumn(width="small", format="%.4f%%") for column in stats_columns},
+                    "反向年化贴水率": st.column_config.NumberColumn(width="small", format="%.4f%%"),
+                    "价差宽度": st.column_config.NumberColumn(width="small", format="%.4f"),
+                    "剩余天数": st.column_config.NumberColumn(width="small", format="%d")  # 整数格式
+                }
+            )
+
+# 显示套利扫描结果
+def display_arbitrage(arbitrage):
+    violations, stats, elapsed = arbitrage
+    etf_display_names = get_display_names()
+    with st.expander(f"🔍 套利扫描：{len(violations)} 个扣除手续费后仍有利润的组合", expanded=False):
+        st.caption(
+            f"{stats['expiries']} 个到期月份，{stats['pairs']:,} 个行权价对（盒式），"
+            f"{stats['triples']:,} 个行权价三元组（蝶式），耗时 {elapsed * 1000:.0f}ms；"
+            f"只使用实时报价范围内的买卖价，净利润按每组计"
+            + (f"；{stats['adjusted']} 个分红调整合约（合约单位非标准）未参与扫描" if stats.get('adjusted') else "")
+        )
+        if not violations.empty:
+            st.dataframe(
+                violations.head(200).assign(ETF类型=violations['ETF类型'].map(etf_display_names).fillna(violations['ETF类型'])),
+                use_container_width=True,
+                hide_index=True,
+            )
+
+# 获取单个品种、单个月份的板块数据
+def fetch_option_board(symbol, month):
+    """获取一个(期权品种, 合约月份)的板块数据"""
+    option_data = ak.option_finance_board(symbol=symbol, end_month=month)
+    if option_data.empty:
+        # akshare不支持的品种也返回空表，作为获取失败提示，不缓存空数据
+        raise ValueError(f"{symbol} {month}月板块数据为空")
+    # 深交所品种的板块数据统一为上交所格式（只保留本品种、本月份的合约）
+    option_data = normalize_board(option_data, symbol, month)
+    option_data['ETF类型'] = symbol
+    return option_data
+
+# 获取基础期权数据（按品种和月份分别缓存，合约集合变化时才失效）
+def get_basic_option_data(warnings, timeout=None):
+    """获取基础期权数据，缺失的(品种, 月份)并行获取（最多等待timeout秒），当前价在后台定期刷新；获取失败的提示加入warnings"""
+    # 期权品种来自注册表（underlyings.json），合约月份自动计算
+    option_finance_board_df, errors = get_option_board(get_board_symbols(), get_contract_months(), fetch_option_board, timeout)
+    for (symbol, month), e in errors:
+        warnings.append(f"获取 {symbol} {month} 月合约失败: {str(e)}")
     
-    if not all_option_data:
+    if option_finance_board_df.empty:
         return pd.DataFrame()
     
-    option_finance_board_df = pd.concat(all_option_data)
     # 从合约交易代码中提取月份信息
     option_finance_board_df['合约月份'] = option_finance_board_df['合约交易代码'].str[7:11]
     
     return option_finance_board_df
 
+# 获取单个标的的实时价格
+def fetch_etf_price(symbol):
+    spot_price_df = ak.option_sse_underlying_spot_price_sina(symbol=symbol)
+    current_price = float(spot_price_df.loc[spot_price_df['字段'] == '最近成交价', '值'].iloc[0])
+    return round(current_price, 4)  # 保留4位小数
+
 # 获取实时ETF价格（不缓存，每次都获取最新价格）
-def get_real_time_etf_prices():
-    """获取实时ETF价格"""
-    etf_config = {
-        "sh510300": {"name": "300ETF", "keywords": ["沪深300", "300ETF"]},
-        "sh510500": {"name": "500ETF", "keywords": ["中证500", "500ETF"]},
-        "sh510050": {"name": "50ETF", "keywords": ["上证50", "50ETF"]},
-        "sh588000": {"name": "科创50ETF", "keywords": ["华夏科创50", "科创50ETF"]},
-        "sh588080": {"name": "科创板50ETF", "keywords": ["易方达科创50", "科创板50ETF", "易方达"]}
-    }
+def get_real_time_etf_prices(warnings, timeout=REFRESH_DEADLINE_SECONDS):
+    """并行获取实时ETF价格，最多等待timeout秒，超时的标的使用最近一次的价格；获取失败的提示加入warnings"""
+    # 标的现价代码来自注册表（underlyings.json）
+    etf_config = {symbol: {"name": name} for symbol, name in get_spot_codes().items()}
     
     etf_prices = {}
-    for symbol, config in etf_config.items():
+    
+    def on_price_done(key, future, _reused):
+        symbol = key[0]
         try:
-            spot_price_df = ak.option_sse_underlying_spot_price_sina(symbol=symbol)
-            current_price = float(spot_price_df.loc[spot_price_df['字段'] == '最近成交价', '值'].iloc[0])
-            etf_prices[symbol] = round(current_price, 4)  # 保留4位小数
+            etf_prices[symbol] = future.result()
         except Exception as e:
-            st.warning(f"获取 {config['name']} 价格失败: {str(e)}")
+            warnings.append(f"获取 {etf_config[symbol]['name']} 价格失败: {str(e)}")
             etf_prices[symbol] = 0.0  # 设置默认值
     
+    timed_out, _ = run_with_deadline(
+        [((symbol,), symbol) for symbol in etf_config], fetch_etf_price, deadline=timeout, on_done=on_price_done, group='spot'
+    )
+    for key in timed_out:
+        symbol = key[0]
+        last_price, fetched_at = get_last_known(key, 'spot')
+        etf_prices[symbol] = last_price or 0.0
+        if last_price is not None:
+            warnings.append(f"⏳ {etf_config[symbol]['name']} 价格未在截止时间内获取完成，使用{time.time() - fetched_at:.0f}秒前的价格")
+        else:
+            warnings.append(f"获取 {etf_config[symbol]['name']} 价格超时")
+    
     return etf_config, etf_prices
 
-# 主数据获取和展示函数
-def get_and_display_data():
-    # 创建进度条
-    progress_bar = st.progress(0)
-    progress_text = st.empty()
-    # 添加期权合约计算进度显示
-    contract_progress_text = st.empty()
+# 主数据获取函数（在后台快照线程中执行，不调用Streamlit界面函数）
+def build_snapshot(params, set_progress):
+    """获取数据并计算贴水，返回快照dict；提示信息收集到快照的warnings中，由页面显示"""
+    warnings = []
+    
+    # 品种配置文件修改后在刷新开始时重新加载，刷新过程中的查找不再检查文件
+    try:
+        reload_registry()
+    except Exception as registry_error:
+        warnings.append(f"品种配置重新加载失败，继续使用已加载的配置: {str(registry_error)}")
+    
+    # 整次刷新共用一个截止时间，每一步只使用剩余的时间，超时的步骤使用最近一次的结果
+    deadline_at = time.monotonic() + REFRESH_DEADLINE_SECONDS
+    
+    def remaining_time():
+        return max(deadline_at - time.monotonic(), 0)
     
     # 更新进度函数
     def update_progress(progress, text):
-        progress_bar.progress(progress / 100)
-        progress_text.text(f"🔄 {text} ({progress}%)")
+        set_progress(progress, text)
     
-    # 更新合约计算进度函数
+    # 更新合约计算进度函数（贴水计算占55%-80%）
     def update_contract_progress(current, total, etf_type="", month=""):
         if total > 0:
             percentage = (current / total) * 100
-            contract_progress_text.text(f"📊 期权合约计算进度: {current}/{total} ({percentage:.1f}%) - 当前: {etf_type} {month}月")
+            set_progress(55 + 25 * current // total, f"期权合约计算进度: {current}/{total} ({percentage:.1f}%) - 当前: {etf_type} {month}月")
     
-    try:
-        # 步骤1: 获取期权代码映射关系（缓存12小时）- 10%
-        update_progress(5, "正在获取期权代码映射关系...")
-        option_mapping = get_option_code_mapping()
-        update_progress(10, "期权代码映射关系获取完成")
-        
-        # 步骤2: 获取基础期权数据（缓存12小时）- 30%
-        update_progress(15, "正在获取基础期权数据...")
-        option_finance_board_df = get_basic_option_data()
-        update_progress(30, "基础期权数据获取完成")
-        
-        if option_finance_board_df.empty:
-            st.error("未能获取任何有效的期权数据")
-            update_progress(100, "数据获取失败")
+    # 步骤1: 获取期权代码映射关系（缓存12小时）- 10%
+    update_progress(5, "正在获取期权代码映射关系...")
+    # 获取结果为空时返回None，不作为"最近一次的映射"
+    option_mapping, mapping_timed_out = run_stage(
+        'option_mapping', lambda: get_option_mapping(fetch_option_code_mapping) or None, remaining_time()
+    )
+    if mapping_timed_out:
+        warnings.append("⏳ 期权代码映射未在截止时间内获取完成，使用上一次的映射，后台继续获取")
+    option_mapping = option_mapping or {}
+    update_progress(10, "期权代码映射关系获取完成")
+    
+    # 步骤2: 获取基础期权数据（按品种和月份缓存）- 30%
+    update_progress(15, "正在获取基础期权数据...")
+    option_finance_board_df = get_basic_option_data(warnings, remaining_time())
+    update_progress(30, "基础期权数据获取完成")
+    
+    if option_finance_board_df.empty:
+        raise RuntimeError("未能获取任何有效的期权数据")
+    
+    # 步骤3: 获取实时ETF价格 - 50%
+    update_progress(35, "正在获取实时ETF价格...")
+    etf_config, etf_prices = get_real_time_etf_prices(warnings, remaining_time())
+    update_progress(50, "实时ETF价格获取完成")
+    
+    # 统计实时价格获取情况
+    real_time_count = {'call_success': 0, 'put_success': 0, 'call_total': 0, 'put_total': 0}
+    
+    def get_etf_price(etf_type_name):
+        """根据ETF类型名称获取对应的ETF价格（注册表直接查找标的代码）"""
+        return etf_prices.get(get_spot_code(etf_type_name), 0.0)
+    
+    # 简化ETF类型名称显示的映射
+    etf_display_names = get_display_names()
+    
+    # 步骤4: 开始计算贴水 - 60%
+    update_progress(55, "正在计算期权贴水... (使用10线程并行计算)")
+    
+    # 获取所有需要计算的组合
+    grouped_data = option_finance_board_df.groupby(['ETF类型', '合约月份', '行权价'])
+    group_list = [(key, group) for key, group in grouped_data]
+    # 板块中的全部行权价（包括实时报价范围外的），用于清理已到期或下架合约的最近结果
+    board_keys = [key for key, _ in group_list]
+    
+    # 按平值附近范围筛选需要实时报价的行权价
+    strikes_by_group = {}
+    for (etf_type, month, strike), _ in group_list:
+        strikes_by_group.setdefault((etf_type, month), []).append(strike)
+    quote_window = get_quote_window(
+        strikes_by_group,
+        {etf_type: get_etf_price(etf_type) for etf_type, _ in strikes_by_group},
+        REFRESH_QUOTE_WINDOW, REFRESH_QUOTE_WINDOW_STRIKES, REFRESH_QUOTE_WINDOW_PERCENT
+    )
+    
+    def in_quote_window(etf_type, month, strike):
+        return quote_window is None or strike in quote_window[(etf_type, month)][0]
+    
+    # 实时报价范围的说明和各合约的范围表，随快照一起显示
+    quote_window_info = None
+    if quote_window is not None:
+        all_strike_count = len(group_list)
+        in_window_count = sum(1 for (key, _) in group_list if in_quote_window(*key))
+        window_desc = (
+            f"±{REFRESH_QUOTE_WINDOW_STRIKES}档" if REFRESH_QUOTE_WINDOW == QUOTE_WINDOW_STRIKES else f"±{REFRESH_QUOTE_WINDOW_PERCENT}%"
+        )
+        quote_window_info = (
+            f"🎯 实时报价范围: 平值附近{window_desc}，{in_window_count}/{all_strike_count}个行权价请求实时报价，范围外使用板块价格",
+            pd.DataFrame([
+                {
+                    'ETF类型': etf_display_names.get(etf_type, etf_type), '合约月份': month,
+                    'ETF价格': get_etf_price(etf_type), '行权价下限': lower, '行权价上限': upper,
+                    '实时报价档数': len(selected), '总档数': len(set(strikes_by_group[(etf_type, month)]))
+                }
+                for (etf_type, month), (selected, lower, upper) in sorted(quote_window.items())
+            ])
+        )
+    total_groups = len(group_list)
+    
+    # 线程安全的进度计数器
+    progress_lock = threading.Lock()
+    completed_count = [0]  # 使用列表以便在函数内修改
+    
+    # 初始化结果列表（线程安全）
+    premium_results = []
+    results_lock = threading.Lock()
+    # 本次刷新获取到的原始报价，用于归档；由使用结果的刷新写入（复用上一次刷新的任务时报价归入本次）
+    quote_records = []
+    
+    def collect_result(output, stale=False):
+        """记录一个任务的输出：贴水结果、原始报价和实时价格计数；stale为True时结果标记为过期"""
+        if output is None:
             return
+        if output['result'] is not None:
+            premium_results.append({**output['result'], '过期': stale})
+        quote_records.extend(output['quotes'])
+        real_time_count['call_total'] += 1
+        real_time_count['put_total'] += 1
+        if output['call_success']:
+            real_time_count['call_success'] += 1
+        if output['put_success']:
+            real_time_count['put_success'] += 1
+    
+    # 计算贴水的工作函数，返回{'result', 'quotes', 'call_success', 'put_success'}，不修改本次刷新的状态
+    def calculate_premium_worker(group_data):
+        (etf_type, month, strike), group = group_data
         
-        # 步骤3: 获取实时ETF价格 - 50%
-        update_progress(35, "正在获取实时ETF价格...")
-        etf_config, etf_prices = get_real_time_etf_prices()
-        update_progress(50, "实时ETF价格获取完成")
-        
-        # 显示ETF价格（多列布局）
-        price_cols = st.columns(len(etf_config))
-        for i, (symbol, config) in enumerate(etf_config.items()):
-            with price_cols[i]:
-                price = etf_prices.get(symbol, 0.0)
-                if price > 0:
-                    st.metric(f"{config['name']}价格", f"{price:.4f}")
-                else:
-                    st.metric(f"{config['name']}价格", "获取失败", delta="❌")
-        
-        # 统计实时价格获取情况
-        real_time_count = {'call_success': 0, 'put_success': 0, 'call_total': 0, 'put_total': 0}
-        
-        # 改进的ETF类型识别函数
-        def get_etf_price(etf_type_name):
-            """根据ETF类型名称获取对应的ETF价格"""
-            # 创建所有可能的匹配项，按关键词长度降序排列
-            matches = []
-            for symbol, config in etf_config.items():
-                for keyword in config['keywords']:
-                    if keyword in etf_type_name:
-                        matches.append((len(keyword), symbol, keyword))
+        pair = split_call_put(group)
+        if pair is not None:
+            call_row, put_row = pair
             
-            # 按关键词长度降序排序，优先匹配更具体的关键词
-            matches.sort(reverse=True)
+            # 获取Call期权实时价格（使用卖价）
+            call_contract_code = call_row['合约交易代码']
             
-            if matches:
-                return etf_prices.get(matches[0][1], 0.0)
+            # 板块数据自带合约编码（深交所）时直接使用，否则用合约交易代码作为CONTRACT_ID在映射中查找
+            call_security_id = call_row.get('security_id') if pd.notna(call_row.get('security_id')) else None
+            if call_security_id is None and call_contract_code in option_mapping:
+                call_security_id = option_mapping[call_contract_code]['security_id']
             
-            # 默认返回300ETF价格
-            return etf_prices.get("sh510300", 0.0)
-        
-        # 步骤4: 开始计算贴水 - 60%
-        update_progress(55, "正在计算期权贴水... (使用10线程并行计算)")
-        
-        # 获取所有需要计算的组合
-        grouped_data = option_finance_board_df.groupby(['ETF类型', '合约月份', '行权价'])
-        group_list = [(key, group) for key, group in grouped_data]
-        total_groups = len(group_list)
-        
-        # 线程安全的进度计数器
-        progress_lock = threading.Lock()
-        completed_count = [0]  # 使用列表以便在函数内修改
-        
-        # 初始化结果列表（线程安全）
-        premium_results = []
-        results_lock = threading.Lock()
-        
-        # 简化ETF类型名称显示的映射
-        etf_display_names = {
-            "华泰柏瑞沪深300ETF期权": "300ETF",
-            "南方中证500ETF期权": "500ETF", 
-            "华夏上证50ETF期权": "50ETF",
-            "华夏科创50ETF期权": "科创50ETF",
-            "易方达科创50ETF期权": "科创板50ETF"
-        }
-        
-        # 计算贴水的工作函数
-        def calculate_premium_worker(group_data):
-            (etf_type, month, strike), group = group_data
+            # 获取Put期权实时价格（使用买价）
+            put_contract_code = put_row['合约交易代码']
             
-            calls = group[group['合约交易代码'].str.contains('C')]
-            puts = group[group['合约交易代码'].str.contains('P')]
+            # 板块数据自带合约编码（深交所）时直接使用，否则用合约交易代码作为CONTRACT_ID在映射中查找
+            put_security_id = put_row.get('security_id') if pd.notna(put_row.get('security_id')) else None
+            if put_security_id is None and put_contract_code in option_mapping:
+                put_security_id = option_mapping[put_contract_code]['security_id']
             
-            if len(calls) > 0 and len(puts) > 0:
-                # 获取Call期权实时价格（使用卖价）
-                call_contract_code = calls.iloc[0]['合约交易代码']
-                call_strike = calls.iloc[0]['行权价']
-                
-                # 直接使用合约交易代码作为CONTRACT_ID在映射中查找
-                call_security_id = None
-                if call_contract_code in option_mapping:
-                    call_security_id = option_mapping[call_contract_code]['security_id']
-                
-                # 获取Put期权实时价格（使用买价）
-                put_contract_code = puts.iloc[0]['合约交易代码']
-                put_strike = puts.iloc[0]['行权价']
-                
-                # 直接使用合约交易代码作为CONTRACT_ID在映射中查找
-                put_security_id = None
-                if put_contract_code in option_mapping:
-                    put_security_id = option_mapping[put_contract_code]['security_id']
-                
-                # 获取实时价格
-                call_success = False
-                put_success = False
-                
-                if call_security_id:
-                    call_price = get_real_time_option_price(call_security_id, 'C')
-                    if call_price is not None:
-                        call_success = True
-                else:
-                    call_price = calls.iloc[0]['当前价']  # fallback到原有数据
-                
-                if put_security_id:
-                    put_price = get_real_time_option_price(put_security_id, 'P')
-                    if put_price is not None:
-                        put_success = True
-                else:
-                    put_price = puts.iloc[0]['当前价']  # fallback到原有数据
-                
-                # 如果无法获取实时价格，使用原有数据
-                if call_price is None:
-                    call_price = calls.iloc[0]['当前价']
-                if put_price is None:
-                    put_price = puts.iloc[0]['当前价']
-                
-                strike_price = calls.iloc[0]['行权价']
-                
-                # 使用改进的ETF价格获取函数
-                etf_price = get_etf_price(etf_type)
-                if etf_price <= 0:
-                    return None  # 如果ETF价格获取失败，跳过计算
-                    
-                synthetic_price = call_price - put_price + strike_price
-                premium_value = synthetic_price - etf_price
-                
-                # 精确计算剩余天数（每月第4个星期三到期）
-                expiry_date_str = calls.iloc[0]['合约交易代码'][7:11]  # 格式如"2506"
-                year = 2000 + int(expiry_date_str[:2])  # 前两位是年份
-                month_num = int(expiry_date_str[2:4])       # 后两位是月份
-                first_day = datetime.date(year, month_num, 1)
-                # 计算第一个星期三
-                first_wednesday = first_day + datetime.timedelta(days=(2 - first_day.weekday()) % 7)
-                # 第四个星期三 = 第一个星期三 + 3周
-                expiry_date = first_wednesday + datetime.timedelta(weeks=3)
-                days_to_maturity = (expiry_date - datetime.date.today()).days
-                
-                # 线程安全地更新计数器
-                with progress_lock:
-                    completed_count[0] += 1
-                    real_time_count['call_total'] += 1
-                    real_time_count['put_total'] += 1
-                    if call_success:
-                        real_time_count['call_success'] += 1
-                    if put_success:
-                        real_time_count['put_success'] += 1
-                
-                return {
-                    'ETF类型': etf_type,
-                    '合约月份': month,
-                    '行权价': strike,
-                    '贴水价值': round(premium_value, 4),
-                    '年化贴水率': round((premium_value / etf_price) * (365 / max(days_to_maturity, 1)), 4),  # 避免除以0
-                    '剩余天数': int(days_to_maturity)  # 只保留整数部分
+            # 获取实时报价（范围外的行权价直接使用板块价格）
+            quote_live = in_quote_window(etf_type, month, strike)
+            call_quote = get_real_time_option_quote(call_security_id) if call_security_id and quote_live else None
+            put_quote = get_real_time_option_quote(put_security_id) if put_security_id and quote_live else None
+            
+            call_price = select_option_price(call_quote, 'C')
+            put_price = select_option_price(put_quote, 'P')
+            call_success = call_price is not None
+            put_success = put_price is not None
+            
+            # 如果无法获取实时价格，使用原有数据
+            if call_price is None:
+                call_price = call_row['当前价']
+            if put_price is None:
+                put_price = put_row['当前价']
+            
+            # 使用改进的ETF价格获取函数，同一次报价同时计算正向、反向贴水和价差宽度
+            result = calculate_premium_row(
+                etf_type, month, strike, call_price, put_price, get_etf_price(etf_type),
+                call_quote=call_quote, put_quote=put_quote
+            )
+            
+            quotes = [
+                {
+                    'ETF类型': etf_type, '合约月份': month, '行权价': strike,
+                    '合约交易代码': contract_code, '期权类型': option_type,
+                    'security_id': security_id, **quote
                 }
-            else:
-                # 即使没有计算结果，也要更新进度
-                with progress_lock:
-                    completed_count[0] += 1
-                return None
-        
-        # 方案1：尝试多线程计算
-        try:
-            # 使用线程池并行计算
-            max_workers = 10  # 使用10个线程
-            with ThreadPoolExecutor(max_workers=max_workers) as executor:
-                # 提交所有任务
-                future_to_group = {executor.submit(calculate_premium_worker, group_data): group_data for group_data in group_list}
-                
-                # 收集结果并在主线程中更新进度
-                completed_tasks = 0
-                for future in as_completed(future_to_group):
-                    try:
-                        result = future.result()
-                        completed_tasks += 1
-                        
-                        # 在主线程中更新进度显示
-                        group_data = future_to_group[future]
-                        (etf_type, month, strike) = group_data[0]
-                        display_name = etf_display_names.get(etf_type, etf_type)
-                        update_contract_progress(completed_tasks, total_groups, display_name, month)
-                        
-                        if result is not None:
-                            premium_results.append(result)
-                            
-                    except Exception as e:
-                        # 记录详细的错误信息但继续处理
-                        st.warning(f"单个期权计算失败: {str(e)}")
-                        completed_tasks += 1
-                        
-        except Exception as main_error:
-            # 如果多线程失败，回退到单线程模式
-            st.warning(f"多线程计算失败，回退到单线程模式: {str(main_error)}")
-            update_progress(55, "正在计算期权贴水... (单线程模式)")
+                for option_type, contract_code, security_id, quote in [
+                    ('C', call_contract_code, call_security_id, call_quote),
+                    ('P', put_contract_code, put_security_id, put_quote)
+                ]
+                if quote is not None
+            ]
             
-            # 单线程计算
-            for i, group_data in enumerate(group_list):
-                try:
-                    (etf_type, month, strike) = group_data[0]
-                    display_name = etf_display_names.get(etf_type, etf_type)
-                    update_contract_progress(i + 1, total_groups, display_name, month)
-                    
-                    result = calculate_premium_worker(group_data)
-                    if result is not None:
-                        premium_results.append(result)
-                except Exception as e:
-                    st.warning(f"计算期权 {group_data[0]} 失败: {str(e)}")
-                    continue
-        
-        # 将结果转换为DataFrame
-        premium_df = pd.DataFrame(premium_results)
-        update_progress(80, "期权贴水计算完成")
-        # 清除合约进度显示
-        contract_progress_text.empty()
-        
-        # 确保合约月份列存在后再进行后续操作
-        if '合约月份' not in option_finance_board_df.columns:
-            st.error("无法从合约交易代码中提取月份信息")
-            update_progress(100, "数据处理失败")
-            return
-        
-        # 步骤5: 数据处理和展示准备 - 90%
-        update_progress(85, "正在处理数据...")
-        
-        # 移除空值行
-        premium_df = premium_df.dropna()
+            # 线程安全地更新计数器
+            with progress_lock:
+                completed_count[0] += 1
+            
+            return {'result': result, 'quotes': quotes, 'call_success': call_success, 'put_success': put_success}
+        else:
+            # 即使没有计算结果，也要更新进度
+            with progress_lock:
+                completed_count[0] += 1
+            return None
+    
+    # 方案1：多线程计算（常驻线程池，整次刷新和每个标的都有等待时间上限）
+    try:
+        completed_tasks = [0]
+        reused_count = [0]
         
-        # 改进的ETF类型名称显示
-        etf_display_names = {
-            "华泰柏瑞沪深300ETF期权": "300ETF",
-            "南方中证500ETF期权": "500ETF", 
-            "华夏上证50ETF期权": "50ETF",
-            "华夏科创50ETF期权": "科创50ETF",
-            "易方达科创50ETF期权": "科创板50ETF"
-        }
+        # 在主线程中收集结果并更新进度
+        # 复用上一次刷新仍在执行的任务时，结果是按上一次的ETF价格和板块数据计算的，标记为过期
+        def on_task_done(key, future, reused):
+            completed_tasks[0] += 1
+            (etf_type, month, strike) = key
+            display_name = etf_display_names.get(etf_type, etf_type)
+            update_contract_progress(completed_tasks[0], total_groups, display_name, month)
+            try:
+                collect_result(future.result(), stale=reused)
+                if reused:
+                    reused_count[0] += 1
+            except Exception as e:
+                # 记录详细的错误信息但继续处理
+                warnings.append(f"单个期权计算失败: {str(e)}")
         
-        # 步骤6: 显示数据 - 100%
-        update_progress(95, "正在生成数据展示...")
+        timed_out, timed_out_by_etf = run_with_deadline(
+            [(group_data[0], group_data) for group_data in group_list],
+            calculate_premium_worker, get_refresh_budgets(), remaining_time(), on_task_done
+        )
         
-        # 显示数据 - 使用更灵活的列布局
-        if not premium_df.empty:
-            # 计算需要的列数
-            unique_combinations = premium_df.groupby(['ETF类型', '合约月份']).size()
-            num_combinations = len(unique_combinations)
-            
-            # 动态调整列数，最多4列
-            num_cols = min(4, num_combinations)
-            cols = st.columns(num_cols)
-            
-            for i, ((etf_type, month), group) in enumerate(premium_df.groupby(['ETF类型', '合约月份'])):
-                with cols[i % num_cols]:  # 循环使用列
-                    # 替换ETF类型名称
-                    display_name = etf_display_names.get(etf_type, etf_type)
-                    st.subheader(f"{display_name} - {month}月合约")
+        # 超时的行权价显示最近一次的结果并标记为过期，任务在后台继续执行，完成后供下一次刷新使用
+        for key in timed_out:
+            last_output, _ = get_last_known(key)
+            if last_output is not None and last_output['result'] is not None:
+                premium_results.append({**last_output['result'], '过期': True})
+        if timed_out:
+            timed_out_desc = "，".join(
+                f"{etf_display_names.get(etf_type, etf_type)} {count}个" for etf_type, count in timed_out_by_etf.items()
+            )
+            warnings.append(f"⏳ {len(timed_out)}个行权价未在截止时间内完成（{timed_out_desc}），显示上一次的值并标记⏳，已开始的任务在后台继续获取")
+        if reused_count[0]:
+            warnings.append(f"⏳ {reused_count[0]}个行权价使用上一次刷新仍在执行的任务的结果（按上一次的ETF价格计算），标记⏳")
                     
-                    # 复制一份数据避免修改原始数据
-                    display_df = group.copy()
-                    # 将年化贴水率转换为百分比格式前先排序
-                    display_df = display_df.sort_values('年化贴水率', ascending=True)
-                    # 将年化贴水率转换为百分比格式，保留4位小数
-                    display_df['年化贴水率'] = (display_df['年化贴水率'] * 100).round(4).astype(str) + '%'
-                    # 对其他数值列进行4位小数格式化
-                    if '贴水价值' in display_df.columns:
-                        display_df['贴水价值'] = display_df['贴水价值'].round(4)
-                    if '行权价' in display_df.columns:
-                        display_df['行权价'] = display_df['行权价'].round(4)
-                    if '剩余天数' in display_df.columns:
-                        display_df['剩余天数'] = display_df['剩余天数'].astype(int)  # 只保留整数部分
-                    # 设置紧凑布局
-                    st.dataframe(
-                        display_df[['行权价', '贴水价值', '年化贴水率', '剩余天数']],
-                        use_container_width=True,
-                        height=300,  # 调整高度适应更多数据
-                        hide_index=True,  # 隐藏索引
-                        column_config={
-                            "行权价": st.column_config.NumberColumn(width="small", format="%.4f"),
-                            "贴水价值": st.column_config.NumberColumn(width="small", format="%.4f"),
-                            "年化贴水率": st.column_config.TextColumn(width="small"),
-                            "剩余天数": st.column_config.NumberColumn(width="small", format="%d")  # 整数格式
-                        }
-                    )
-        else:
-            st.warning("未能计算出任何有效的贴水数据")
+    except Exception as main_error:
+        # 如果多线程失败，回退到单线程模式
+        warnings.append(f"多线程计算失败，回退到单线程模式: {str(main_error)}")
+        update_progress(55, "正在计算期权贴水... (单线程模式)")
         
-        # 完成
-        update_progress(100, "数据刷新完成！")
-        
-        # 更新最后刷新时间
-        beijing_tz = datetime.timezone(datetime.timedelta(hours=8))
-        beijing_time = datetime.datetime.now(beijing_tz)
-        last_update.text(f"最后更新时间: {beijing_time.strftime('%Y-%m-%d %H:%M:%S')} (北京时间)")
+        # 单线程计算
+        for i, group_data in enumerate(group_list):
+            try:
+                (etf_type, month, strike) = group_data[0]
+                display_name = etf_display_names.get(etf_type, etf_type)
+                update_contract_progress(i + 1, total_groups, display_name, month)
+                
+                collect_result(calculate_premium_worker(group_data))
+            except Exception as e:
+                warnings.append(f"计算期权 {group_data[0]} 失败: {str(e)}")
+                continue
+    
+    # 已到期或下架的行权价不再保留最近一次的结果
+    prune_last_known(board_keys)
+    
+    # 将结果转换为DataFrame
+    # 没有任何结果时（ETF价格全部获取失败或全部超时且没有上一次的值）也保留完整的列
+    premium_df = pd.DataFrame(premium_results, columns=PREMIUM_COLUMNS + ['过期'])
+    update_progress(80, "期权贴水计算完成")
+    
+    # 确保合约月份列存在后再进行后续操作
+    if '合约月份' not in option_finance_board_df.columns:
+        raise RuntimeError("无法从合约交易代码中提取月份信息")
+    
+    # 步骤5: 数据处理和展示准备 - 90%
+    update_progress(85, "正在处理数据...")
+    
+    # 归档本次刷新的原始输入，供公式调整后离线重算（在后台线程写入，不等待）
+    archive_status = get_archive_status()
+    if archive_status['last_error']:
+        warnings.append(f"原始行情归档失败: {archive_status['last_error']}")
+    try:
+        spot_records = []
+        for etf_type in option_finance_board_df['ETF类型'].unique():
+            spot_symbol = get_spot_code(etf_type)
+            spot_records.append({'ETF类型': etf_type, '标的代码': spot_symbol, 'ETF价格': etf_prices.get(spot_symbol, 0.0)})
+        archive_refresh_in_background(
+            option_finance_board_df, quote_records, spot_records,
+            datetime.datetime.now(datetime.timezone(datetime.timedelta(hours=8)))
+        )
+    except Exception as archive_error:
+        warnings.append(f"原始行情归档失败: {str(archive_error)}")
+    
+    # 移除空值行（反向贴水和价差宽度在缺少完整买卖报价时允许为空）
+    premium_df = premium_df.dropna(subset=['贴水价值', '年化贴水率', '剩余天数'])
+    
+    # 盘中统计（开盘/最高/最低/EWMA/较昨收）按行权价增量更新，昨收每个交易日从贴水日志读取一次
+    # 读取使用刷新剩余的时间，超时在后台继续读取，之后的快照取到后再补填
+    def load_previous_close(trading_date):
+        loaded, _ = get_last_known('previous_close', STAGE_GROUP)
+        if loaded is None or loaded[0] != trading_date:
+            try:
+                loaded, _ = run_stage(
+                    'previous_close',
+                    lambda: (trading_date, previous_close_from_history(
+                        fetch_history()[0], get_previous_trade_dates(1, before=trading_date)[0], get_display_names()
+                    )),
+                    remaining_time()
+                )
+            except Exception as history_error:
+                warnings.append(f"读取昨收失败，今天不显示较昨收: {str(history_error)}")
+                return {}
+        if loaded is None or loaded[0] != trading_date:
+            warnings.append("⏳ 昨收未在截止时间内读取完成，后台继续读取，之后的刷新再显示较昨收")
+            return None
+        return loaded[1]
+    
+    intraday_stats = None
+    try:
+        intraday_stats = update_intraday_stats(premium_df, get_current_trade_date(), load_previous_close)
+    except Exception as stats_error:
+        warnings.append(f"盘中统计更新失败: {str(stats_error)}")
+    
+    # 对新快照评估告警规则（规则文件见alert_rules.example.json），页面第一次显示该快照时提示
+    fired_alerts = []
+    try:
+        fired_alerts = evaluate_alerts(premium_df)
+    except Exception as alert_error:
+        warnings.append(f"告警规则评估失败: {str(alert_error)}")
+    
+    # 完成
+    update_progress(100, "数据刷新完成！")
+    beijing_time = datetime.datetime.now(BEIJING_TZ)
+    
+    # 发布到快照API，下游无需触发页面刷新即可读取
+    publish_snapshot(premium_df, beijing_time)
+    # 写入本地热启动文件，进程重启后先显示这份快照
+    try:
+        save_warm_start(premium_df, beijing_time)
+    except Exception as warm_error:
+        warnings.append(f"热启动快照保存失败: {str(warm_error)}")
+    
+    return {
+        'premium_df': premium_df,
+        'refreshed_at': beijing_time,
+        'etf_prices': [(config['name'], etf_prices.get(symbol, 0.0)) for symbol, config in etf_config.items()],
+        'quote_window_info': quote_window_info,
+        'intraday_stats': intraday_stats,
+        'quote_records': quote_records,  # 页面按各自的手续费设置扫描套利
+        'board_keys': board_keys,  # 保存时判断合约是否下架
+        'alerts': fired_alerts,
+        'warnings': warnings,
+    }
 
-        # 将结果存储到全局变量中
-        st.session_state.latest_premium_data = premium_df
-        
-    except Exception as e:
-        st.error(f"数据获取过程中出现错误: {str(e)}")
-        update_progress(100, "数据获取失败")
-    finally:
-        # 延迟一下让用户看到100%完成状态
-        time.sleep(0.5)
-        progress_bar.empty()
-        progress_text.empty()
-        contract_progress_text.empty()
+# 后台快照线程执行的刷新：按请求的设置做性能分析、刷新完成后保存
+def compute_snapshot(params, set_progress):
+    if params['profile']:
+        snapshot, snapshot_profile = profile_refresh(build_snapshot, params, set_progress)
+        snapshot['profile_report'] = snapshot_profile
+    else:
+        snapshot = build_snapshot(params, set_progress)
+    # "刷新并保存"：保存这一次刷新的结果，发起请求的页面在快照完成后提示
+    if params['save']:
+        try:
+            data_to_save, record_date, listed = prepare_save_data(snapshot['premium_df'], snapshot.get('board_keys'))
+            pending_count = enqueue_save(data_to_save, record_date, listed)
+            snapshot['save_result'] = (True, f"✅ 数据刷新完成，已加入保存队列（{len(data_to_save)} 条记录），后台将自动上传到GitHub，当前待上传 {pending_count} 批")
+        except Exception as e:
+            snapshot['save_result'] = (False, f"保存数据时出错: {str(e)}")
+    return snapshot
+
+configure_snapshot_worker(compute_snapshot)
+
+# 请求一次后台刷新（立即返回，不等待结果）
+def request_data_refresh(save=False, clear_mapping=False):
+    st.session_state.last_refresh_time = time.time()
+    # 手动刷新时清除期权代码映射缓存以强制重新获取，自动刷新沿用缓存（板块数据按合约集合自动失效，无需清除）
+    if clear_mapping:
+        clear_option_mapping()
+    # 后台刷新由所有会话共用，只使用进程统一的设置，不带本会话的页面设置
+    ticket = request_refresh({}, save=save, profile=profile_next_refresh)
+    if save:
+        st.session_state.save_ticket = ticket  # 该请求完成后提示保存结果
+    return ticket
+
+# 上一次刷新的时间：最近一次后台刷新的开始时间，还没有刷新过时为快照时间（热启动）
+def get_last_refresh_at(status):
+    if status['started_at'] is not None:
+        return datetime.datetime.fromtimestamp(status['started_at'], BEIJING_TZ)
+    if status['snapshot'] is not None:
+        return status['snapshot'].get('refreshed_at')
+    return None
+
+# 数据状态（定时重跑的片段）：显示数据时间和后台刷新进度，按刷新节奏请求自动刷新，
+# 新快照完成后重跑整个页面更新显示；片段只重跑自身，不影响按钮等其他部分的响应
+@st.fragment(run_every=SNAPSHOT_POLL_SECONDS)
+def display_refresh_status(auto_refresh, displayed_version):
+    now = datetime.datetime.now(BEIJING_TZ)
+    status = get_worker_status()
+    
+    # 自动刷新只在交易时间，所有会话共用后台线程的快照，按上一次刷新的时间计算下一次
+    last_refresh_at = get_last_refresh_at(status)
+    next_refresh_at = get_next_refresh_time(now, last_refresh_at) if last_refresh_at is not None else now
+    auto_refresh_active = auto_refresh and is_trading_time(now) and next_refresh_at is not None
+    if auto_refresh_active and now >= next_refresh_at and not status['running'] and status['pending'] is None:
+        request_data_refresh()
+        status = get_worker_status()
+    
+    # 新快照完成，或本会话等待的"刷新并保存"已完成时，重跑页面显示结果
+    save_ticket = st.session_state.get('save_ticket')
+    if status['version'] != displayed_version or (save_ticket is not None and status['completed'] >= save_ticket):
+        st.session_state.snapshot_rerun = True
+        st.rerun()
+    
+    snapshot = status['snapshot']
+    refreshed_at = snapshot.get('refreshed_at') if snapshot is not None else None
+    if refreshed_at is not None:
+        age = (now - refreshed_at).total_seconds()
+        age_desc = f"{age:.0f}秒" if age < 60 else f"{age / 60:.0f}分钟" if age < 3600 else f"{age / 3600:.1f}小时"
+        warm_desc = "，进程重启前保存的数据" if snapshot.get('warm') else ""
+        st.text(f"最后更新时间: {refreshed_at.strftime('%Y-%m-%d %H:%M:%S')} (北京时间)，数据距今{age_desc}{warm_desc}")
+    if status['running']:
+        percent, text = status['progress']
+        current_desc = "，下方为上一次的数据" if snapshot is not None else ""
+        st.progress(percent / 100, text=f"🔄 后台刷新中: {text} ({percent}%){current_desc}")
+    elif status['pending'] is not None:
+        st.text("🔄 已请求刷新，等待后台开始...")
+    elif status['last_error']:
+        st.error(f"数据获取过程中出现错误: {status['last_error']}")
+    
+    if auto_refresh_active and not status['running'] and status['pending'] is None:
+        remaining_time = max(0, (next_refresh_at - now).total_seconds())
+        minutes, seconds = divmod(int(remaining_time), 60)
+        st.info(f"⏱️ 下次自动刷新倒计时: {minutes}分{seconds}秒（{next_refresh_at.strftime('%H:%M:%S')}）")
+        st.info("💡 您也可以随时点击'手动刷新数据'按钮获取最新数据")
+
+# 按本会话的显示范围筛选行权价（后台刷新始终计算全部行权价）
+def filter_display_window(premium_df):
+    if quote_window_mode == QUOTE_WINDOW_ALL or 'ETF价格' not in premium_df.columns:
+        return premium_df
+    strikes_by_group = {key: group['行权价'].tolist() for key, group in premium_df.groupby(['ETF类型', '合约月份'])}
+    window = get_quote_window(
+        strikes_by_group, premium_df.groupby('ETF类型')['ETF价格'].last().to_dict(),
+        quote_window_mode, quote_window_strikes, quote_window_percent
+    )
+    keep = [
+        strike in window[(etf_type, month)][0]
+        for etf_type, month, strike in zip(premium_df['ETF类型'], premium_df['合约月份'], premium_df['行权价'])
+    ]
+    return premium_df[keep]
+
+# 按本会话的手续费和利率扫描快照的报价，同一快照和设置只扫描一次
+def get_arbitrage(snapshot):
+    cache_key = (snapshot.get('refreshed_at'), arbitrage_fee, arbitrage_rate)
+    cached = st.session_state.get('arbitrage_scan')
+    if cached is None or cached[0] != cache_key:
+        scan_start = time.time()
+        violations, scan_stats = scan_arbitrage(snapshot['quote_records'], arbitrage_fee, arbitrage_rate / 100)
+        st.session_state.arbitrage_scan = (cache_key, (violations, scan_stats, time.time() - scan_start))
+    return st.session_state.arbitrage_scan[1]
+
+# 显示一个快照：ETF价格、刷新提示、贴水表和套利扫描结果
+def display_snapshot(snapshot):
+    # 显示ETF价格（多列布局）
+    etf_prices = snapshot.get('etf_prices')
+    if etf_prices:
+        price_cols = st.columns(len(etf_prices))
+        for i, (name, price) in enumerate(etf_prices):
+            with price_cols[i]:
+                if price > 0:
+                    st.metric(f"{name}价格", f"{price:.4f}")
+                else:
+                    st.metric(f"{name}价格", "获取失败", delta="❌")
+    
+    for warning in snapshot.get('warnings', []):
+        st.warning(warning)
+    
+    quote_window_info = snapshot.get('quote_window_info')
+    if quote_window_info is not None:
+        info_text, window_table = quote_window_info
+        st.info(info_text)
+        with st.expander("🎯 各合约的实时报价行权价范围", expanded=False):
+            st.dataframe(window_table, use_container_width=True, hide_index=True)
+    
+    premium_df = snapshot['premium_df']
+    if not premium_df.empty:
+        display_premium_tables(filter_display_window(premium_df), snapshot.get('intraday_stats'))
+    else:
+        st.warning("未能计算出任何有效的贴水数据")
+    
+    if snapshot.get('quote_records') is not None:
+        try:
+            display_arbitrage(get_arbitrage(snapshot))
+        except Exception as scan_error:
+            st.warning(f"套利扫描失败: {str(scan_error)}")
 
 # 处理保存按钮点击
 if save_button:
     save_data_to_github()
 
-# 处理"刷新并保存"按钮点击 - 设置标记
-if refresh_and_save_button:
-    st.session_state.last_refresh_time = time.time()
-    st.session_state.manual_refresh_triggered = True
-    st.session_state.refresh_and_save_triggered = True  # 设置刷新后保存的标记
-    # 清除缓存以强制重新获取数据
-    get_option_code_mapping.clear()
-    get_basic_option_data.clear()
-    st.rerun()
-
 # 主要的数据显示逻辑
 # 初始化会话状态
 if 'last_refresh_time' not in st.session_state:
     st.session_state.last_refresh_time = time.time()
 
-# 检查是否需要刷新数据
-current_time = time.time()
-time_since_refresh = current_time - st.session_state.last_refresh_time
+# 距离本会话上一次请求刷新的时间
+time_since_refresh = time.time() - st.session_state.last_refresh_time
+
+# 处理"刷新并保存"按钮点击：后台刷新完成后保存这一次的结果
+if refresh_and_save_button:
+    request_data_refresh(save=True, clear_mapping=True)
+    st.info("🔄💾 刷新并保存已提交，后台刷新完成后自动保存到GitHub")
 
 # 手动刷新按钮逻辑
 if refresh_button:
-    st.session_state.last_refresh_time = time.time()
-    st.session_state.manual_refresh_triggered = True  # 设置手动刷新标记
-    # 清除缓存以强制重新获取数据
-    get_option_code_mapping.clear()
-    get_basic_option_data.clear()
-    st.rerun()  # 立即刷新
+    request_data_refresh(clear_mapping=True)
+    st.info("🔄 手动刷新已提交，后台正在获取数据")
 
 # 获取当前时间状态（确保整个处理过程中时间判断一致）
 # 获取北京时间（UTC+8）
-beijing_tz = datetime.timezone(datetime.timedelta(hours=8))
-current_time = datetime.datetime.now(beijing_tz)
-is_trading = is_trading_time()
+current_time = datetime.datetime.now(BEIJING_TZ)
+is_trading = is_trading_time(current_time)
 weekday = current_time.weekday()  # 0=周一, 6=周日
 
-# 检查是否有手动刷新标记
-manual_refresh = st.session_state.get('manual_refresh_triggered', False)
+# 根据交易日历和分时段刷新节奏计算下一次自动刷新时间
+worker_status = get_worker_status()
+last_refresh_at = get_last_refresh_at(worker_status)
+refresh_interval = get_refresh_interval(current_time)
+next_refresh_at = get_next_refresh_time(current_time, last_refresh_at) if last_refresh_at is not None else None
 
 # 调试信息（折叠显示）
 with st.sidebar.expander("🔧 调试信息", expanded=False):
@@ -1042,128 +1030,204 @@ with st.sidebar.expander("🔧 调试信息", expanded=False):
     st.write(f"星期: {['周一', '周二', '周三', '周四', '周五', '周六', '周日'][weekday]}")
     st.write(f"是否工作日: {weekday < 5}")
     st.write(f"是否交易时间: {is_trading}")
-    st.write(f"交易时间段: 9:30-15:15")
+    st.write(f"交易时间段: {describe_trading_sessions()}")
+    st.write(f"当前刷新间隔: {f'{refresh_interval}秒' if refresh_interval else '休市'}")
+    st.write(f"下次计划刷新: {next_refresh_at.strftime('%Y-%m-%d %H:%M:%S') if next_refresh_at else '未知'}")
     
     st.write("### 刷新状态")
     st.write(f"自动刷新开启: {auto_refresh}")
     st.write(f"手动刷新按钮: {refresh_button}")
-    st.write(f"手动刷新标记: {manual_refresh}")
-    st.write(f"距离上次刷新: {time_since_refresh:.1f}秒")
-    
-    st.write("### 数据获取逻辑")
-    st.write(f"手动刷新: {refresh_button}")
-    st.write(f"手动刷新标记: {manual_refresh}")
-    st.write(f"自动刷新且在交易时间: {auto_refresh and is_trading}")
-    st.write(f"关闭自动刷新: {not auto_refresh}")
-
-# 自动刷新检查 - 如果到时间且在交易时间就立即刷新
-if auto_refresh and time_since_refresh >= 300 and is_trading:
-    st.session_state.last_refresh_time = time.time()
-    # 清除缓存以强制重新获取数据
-    get_option_code_mapping.clear()
-    get_basic_option_data.clear()
-    st.rerun()  # 立即刷新
-
-# 清除手动刷新标记（使用后立即清除）
-if manual_refresh:
-    st.session_state.manual_refresh_triggered = False
+    st.write(f"距离本会话上次请求刷新: {time_since_refresh:.1f}秒")
+    
+    st.write("### 后台刷新")
+    st.write(f"正在刷新: {worker_status['running']}")
+    st.write(f"快照版本: {worker_status['version']}")
+    st.write(f"请求编号: 最新{worker_status['requested']}，已完成{worker_status['completed']}")
+    if worker_status['last_error']:
+        st.write(f"最近错误: {worker_status['last_error']}")
+    
+    st.write("### 保存队列")
+    save_status = get_save_queue_status()
+    st.write(f"待上传批数: {save_status['pending']}")
+    st.write(f"正在上传: {save_status['uploading']}")
+    st.write(f"上次上传成功: {save_status['last_success'] or '无'}")
+    st.write(f"SHA冲突次数: {save_status['conflicts']}")
+    if save_status['last_error']:
+        st.write(f"最近错误: {save_status['last_error']}")
+    
+    st.write("### 快照API")
+    st.write(f"地址: {get_snapshot_api_address() or f'未启动（{get_snapshot_api_error()}）'}")
+    
+    st.write("### 板块数据缓存")
+    board_status = get_board_cache_status()
+    st.write(f"缓存键数: {board_status['keys']}")
+    st.write(f"后台刷新中: {board_status['refreshing']}")
+    if board_status['oldest_age'] is not None:
+        st.write(f"最旧数据: {board_status['oldest_age']:.0f}秒前")
+    
+    st.write("### 连接池")
+    pool_stats = get_http_pool_stats()
+    st.write(f"请求总数: {pool_stats['requests']}")
+    st.write(f"新建连接数: {pool_stats['connections']}")
+    st.write(f"连接复用率: {pool_stats['reuse_rate'] * 100:.1f}%")
+    st.write(f"连接池大小: {pool_stats['pool_maxsize']}")
+    
+    st.write("### 盘中统计")
+    intraday_status = get_intraday_stats_status()
+    st.write(f"交易日: {intraday_status['trading_date'] or '无'}")
+    st.write(f"行权价数: {intraday_status['strikes']}")
+    st.write(f"今日快照数: {intraday_status['snapshots']}")
+    
+    st.write("### 刷新截止时间")
+    fetch_status = get_fetch_status()
+    st.write(f"截止时间: {REFRESH_DEADLINE_SECONDS:.0f}秒")
+    st.write(f"后台执行中的任务: {fetch_status['in_flight']}")
+    st.write(f"有最近结果的行权价: {fetch_status['last_known']}")
 
-# 检查是否是"刷新并保存"操作
-refresh_and_save = st.session_state.get('refresh_and_save_triggered', False)
+# 最近一次性能分析结果（勾选"性能分析"时请求的刷新由后台线程采集）
+profile_report = worker_status['snapshot'].get('profile_report') if worker_status['snapshot'] is not None else None
+if debug_mode and profile_report is not None:
+    with st.sidebar.expander("⏱️ 性能分析结果", expanded=True):
+        st.write(f"刷新耗时: {profile_report['elapsed']:.2f}秒，采样数: {profile_report['samples']}，内存峰值: {profile_report['peak_kb']}KB")
+        st.write("#### 热点函数")
+        st.dataframe(pd.DataFrame(profile_report['top_functions']), hide_index=True, use_container_width=True)
+        st.write("#### 内存分配热点")
+        st.dataframe(pd.DataFrame(profile_report['top_allocations']), hide_index=True, use_container_width=True)
+        st.download_button(
+            "📥 下载性能分析文件",
+            data=format_profile_artifact(profile_report),
+            file_name=f"refresh_profile_{profile_report['created_at']}.txt",
+            mime="text/plain"
+        )
 
-# 显示数据 - 手动刷新任何时候都可以，自动刷新只在交易时间
-should_get_data = manual_refresh or refresh_and_save or (auto_refresh and is_trading) or not auto_refresh
+# 本次运行是否由数据状态片段发现新快照触发：这种运行只更新显示，不再请求刷新
+snapshot_rerun = st.session_state.pop('snapshot_rerun', False)
+button_refresh = refresh_button or refresh_and_save_button
 
-if should_get_data:
-    if refresh_and_save:
-        st.info("🔄💾 刷新并保存操作触发，正在获取数据...")
-    elif manual_refresh:
-        st.info("🔄 手动刷新触发，正在获取数据")
-    elif auto_refresh and is_trading:
-        st.info("✅ 交易时间内，正在获取实时数据")
-    elif not auto_refresh:
-        st.info("📱 自动刷新已关闭，正在获取数据")
-    get_and_display_data()
-    
-    # 如果是"刷新并保存"操作，在数据获取完成后自动保存
-    if refresh_and_save:
-        st.info("💾 数据刷新完成，正在自动保存到GitHub...")
-        save_data_to_github()
-        st.session_state.refresh_and_save_triggered = False  # 清除标记
-else:
+# 请求刷新 - 手动刷新任何时候都可以（上面已处理）；关闭自动刷新时每次运行都请求一次，
+# 开启时由数据状态片段只在交易时间按刷新节奏请求
+if not auto_refresh and not snapshot_rerun and not button_refresh:
+    request_data_refresh()
+    st.info("📱 自动刷新已关闭，后台正在获取数据")
+elif auto_refresh and not is_trading and not button_refresh:
     # 这种情况下是：启用了自动刷新但不在交易时间，且没有手动刷新
-    st.info("📅 当前不在交易时间（工作日9:30-15:15，北京时间），自动刷新已暂停")
+    st.info(f"📅 当前不在交易时间（交易日{describe_trading_sessions()}，北京时间），自动刷新已暂停")
     st.info("💡 您可以点击'手动刷新数据'按钮随时获取最新数据")
     st.info(f"⏰ 北京时间: {current_time.strftime('%Y-%m-%d %H:%M:%S')}")
-    
-    # 显示上次的数据（如果有的话）
-    if st.session_state.latest_premium_data is not None and not st.session_state.latest_premium_data.empty:
-        st.info("📊 以下显示最后一次获取的数据：")
-        
-        # 显示数据的简化版本
-        premium_df = st.session_state.latest_premium_data
-        
-        # 改进的ETF类型名称显示
-        etf_display_names = {
-            "华泰柏瑞沪深300ETF期权": "300ETF",
-            "南方中证500ETF期权": "500ETF", 
-            "华夏上证50ETF期权": "50ETF",
-            "华夏科创50ETF期权": "科创50ETF",
-            "易方达科创50ETF期权": "科创板50ETF"
-        }
-        
-        # 计算需要的列数
-        unique_combinations = premium_df.groupby(['ETF类型', '合约月份']).size()
-        num_combinations = len(unique_combinations)
-        
-        # 动态调整列数，最多4列
-        num_cols = min(4, num_combinations)
-        cols = st.columns(num_cols)
-        
-        for i, ((etf_type, month), group) in enumerate(premium_df.groupby(['ETF类型', '合约月份'])):
-            with cols[i % num_cols]:  # 循环使用列
-                # 替换ETF类型名称
-                display_name = etf_display_names.get(etf_type, etf_type)
-                st.subheader(f"{display_name} - {month}月合约")
-                
-                # 复制一份数据避免修改原始数据
-                display_df = group.copy()
-                # 将年化贴水率转换为百分比格式前先排序
-                display_df = display_df.sort_values('年化贴水率', ascending=True)
-                # 将年化贴水率转换为百分比格式，保留4位小数
-                display_df['年化贴水率'] = (display_df['年化贴水率'] * 100).round(4).astype(str) + '%'
-                # 设置紧凑布局
-                st.dataframe(
-                    display_df[['行权价', '贴水价值', '年化贴水率', '剩余天数']],
-                    use_container_width=True,
-                    height=300,
-                    hide_index=True,
-                    column_config={
-                        "行权价": st.column_config.NumberColumn(width="small", format="%.4f"),
-                        "贴水价值": st.column_config.NumberColumn(width="small", format="%.4f"),
-                        "年化贴水率": st.column_config.TextColumn(width="small"),
-                        "剩余天数": st.column_config.NumberColumn(width="small", format="%d")
-                    }
-                )
+    if next_refresh_at is not None:
+        st.info(f"📆 下次计划刷新: {next_refresh_at.strftime('%Y-%m-%d %H:%M')}")
 
-# 自动刷新状态显示和控制
-if auto_refresh and is_trading:
-    remaining_time = max(0, 300 - time_since_refresh)
-    if remaining_time > 0:
-        minutes, seconds = divmod(int(remaining_time), 60)
-        st.info(f"⏱️ 下次自动刷新倒计时: {minutes}分{seconds}秒")
-        st.info("💡 您也可以随时点击'手动刷新数据'按钮获取最新数据")
-        
-        # 使用更宽松的检查策略，确保能够自动刷新
-        if remaining_time <= 60:
-            # 最后1分钟，每10秒检查一次
-            time.sleep(10)
-            st.rerun()
-        else:
-            # 其他时候，每60秒检查一次（频率相对较低）
-            time.sleep(60)
-            st.rerun()
+# "刷新并保存"请求完成后提示保存结果
+worker_status = get_worker_status()
+latest_snapshot = worker_status['snapshot']
+save_ticket = st.session_state.get('save_ticket')
+if save_ticket is not None and worker_status['completed'] >= save_ticket:
+    del st.session_state['save_ticket']
+    save_result = None
+    if latest_snapshot is not None and latest_snapshot.get('ticket', 0) >= save_ticket:
+        save_result = latest_snapshot.get('save_result')
+    if save_result is None:
+        st.error("数据刷新失败，未保存到GitHub")
+    elif save_result[0]:
+        st.success(save_result[1])
+    else:
+        st.error(save_result[1])
+
+# 数据时间和后台刷新进度（定时更新）
+display_refresh_status(auto_refresh, worker_status['version'])
+
+# 立即显示最新的快照，后台刷新完成后页面自动更新
+if latest_snapshot is not None:
+    # 新快照触发的告警（会话第一次显示的快照不再提示）
+    displayed_version = st.session_state.get('displayed_version')
+    if displayed_version is not None and displayed_version != worker_status['version']:
+        fired_alerts = latest_snapshot.get('alerts', [])
+        for alert in fired_alerts[:10]:
+            st.toast(f"🚨 {alert['ETF类型']} {alert['合约月份']}月 行权价{alert['行权价']}: {alert['message'] or alert['rule_id']} ({alert['metric']}={alert['value']})")
+        if len(fired_alerts) > 10:
+            st.warning(f"🚨 本次刷新共触发 {len(fired_alerts)} 条告警，详见告警输出")
+    st.session_state.displayed_version = worker_status['version']
+    st.session_state.latest_premium_data = latest_snapshot['premium_df']
+    st.session_state.latest_board_keys = latest_snapshot.get('board_keys')
+    display_snapshot(latest_snapshot)
+elif not worker_status['running'] and worker_status['pending'] is None:
+    st.info("💡 暂无数据，请点击'手动刷新数据'按钮获取")
+
+# 历史日志（缓存1小时）：原始日志用cache_resource避免每次读取都复制上百万行数据
+@st.cache_resource(ttl=3600, show_spinner="正在加载历史数据...")
+def load_premium_history():
+    """读取GitHub上的历史日志，并按(ETF类型, 合约月份, 行权价)建立行下标索引"""
+    history, _ = fetch_history()
+    if history.empty:
+        return history, {}
+    # 日志只保存变化超过阈值的行，先前向填充还原每个记录日期的完整数据
+    history = expand_history(history)
+    history['ETF类型'] = history['ETF类型'].astype('category')
+    history['合约月份'] = history['合约月份'].astype(str)
+    history = history.sort_values('记录日期', ignore_index=True)
+    row_index = history.groupby(['ETF类型', '合约月份', '行权价'], observed=True).indices
+    return history, row_index
+
+# 日度汇总表（缓存1小时）
+@st.cache_data(ttl=3600)
+def get_history_rollup():
+    """读取保存时维护的日度汇总表；汇总文件还未生成时由历史日志聚合"""
+    rollup, _ = fetch_rollup()
+    if rollup.empty:
+        history, _ = load_premium_history()
+        rollup = build_daily_rollup(history)
+    rollup['合约月份'] = rollup['合约月份'].astype(str)
+    return rollup
+
+# 行权价索引（缓存1小时）：只用于行权价选择，不加载贴水日志
+@st.cache_data(ttl=3600)
+def get_strike_index():
+    """读取保存时维护的行权价索引；索引文件还未生成时由历史日志生成"""
+    strike_index, _ = fetch_strike_index()
+    if strike_index.empty:
+        history, _ = load_premium_history()
+        strike_index = build_strike_index(history)
+    strike_index['合约月份'] = strike_index['合约月份'].astype(str)
+    return strike_index
+
+# 历史走势图
+def display_history_charts():
+    rollup = get_history_rollup()
+    if rollup.empty:
+        st.info("📂 暂无历史数据")
+        return
+    
+    chart_cols = st.columns([1, 1, 1.5, 1.5])
+    with chart_cols[0]:
+        etf_type = st.selectbox("ETF", sorted(rollup['ETF类型'].unique()), key="history_etf")
+    with chart_cols[1]:
+        months = sorted(rollup.loc[rollup['ETF类型'] == etf_type, '合约月份'].unique())
+        month = st.selectbox("合约月份", months, index=len(months) - 1, key="history_month")
+    strike_index = get_strike_index()
+    strikes = sorted(strike_index.loc[
+        (strike_index['ETF类型'] == etf_type) & (strike_index['合约月份'] == month), '行权价'
+    ].astype(float).unique())
+    with chart_cols[2]:
+        strike = st.selectbox("行权价", ["全部行权价（最小/中位数/最大）"] + strikes, key="history_strike")
+    with chart_cols[3]:
+        # 每个像素最多一个点，浏览器不会收到超过图表宽度的数据点
+        chart_width = st.slider("图表宽度(像素)", min_value=300, max_value=2000, value=900, step=100, key="history_width")
+    
+    if isinstance(strike, str):
+        group = rollup[(rollup['ETF类型'] == etf_type) & (rollup['合约月份'] == month)]
+        chart_df = downsample_rollup(group, chart_width) * 100
+        st.caption(f"{etf_type} {month}月 全部行权价的年化贴水率(%)，{len(group)}个交易日 → {len(chart_df)}个点")
     else:
-        st.info("🔄 自动刷新时间已到，正在刷新数据...")
-        # 时间已到，立即触发刷新
-        st.rerun()
\ No newline at end of file
+        # 选中单个行权价时才加载贴水日志
+        history, row_index = load_premium_history()
+        rows = row_index.get((etf_type, month, strike))
+        if rows is None:
+            st.info(f"📂 {etf_type} {month}月 行权价{strike} 暂无历史数据")
+            return
+        series = history.iloc[rows]
+        chart_df = downsample_strike_series(series, chart_width) * 100
+        st.caption(f"{etf_type} {month}月 行权价{strike} 的年化贴水率(%)，{len(series)}条记录 → {len(chart_df)}个点")
+    st.line_chart(chart_df, width=chart_width, height=350)
+
+if st.checkbox("📈 显示历史贴水率走势", value=False, key="show_history_charts"):
+    display_history_charts()
@@ -0,0 +1,306 @@
+# 贴水告警规则引擎
+# 规则从JSON文件加载，按(ETF, 合约月份)建立索引；每次刷新后对新的premium_df
+# 按分组一次性计算"行 x 规则"的布尔矩阵，不逐条规则、逐行循环。
+# 触发的告警经过去重和冷却后发送到可插拔的输出（文件、本地webhook）。
+# webhook在后台线程中发送，不占用刷新时间。
+import datetime
+import json
+import os
+import queue
+import threading
+
+import numpy as np
+import pandas as pd
+
+from http_session import get_http_session
+from underlying_registry import get_display_names
+
+ALERT_RULES_FILE = os.environ.get("ALERT_RULES_FILE", "alert_rules.json")
+
+# 支持的指标：快照中的原始列，以及相对上一次快照的变化
+ALERT_METRICS = ['年化贴水率', '贴水价值', '年化贴水率变化bp', '贴水价值变化']
+# 支持的比较方式
+ALERT_OPS = ['<', '>', 'abs>']
+# 合约月份的相对写法：按当前快照中该ETF的合约月份排序取第N个
+RELATIVE_MONTHS = {'front': 0, 'next': 1, 'quarter': 2, 'next_quarter': 3}
+
+DEFAULT_COOLDOWN_SECONDS = 1800
+# 规则必须包含的字段
+REQUIRED_RULE_FIELDS = ['id', 'metric', 'op', 'threshold']
+# webhook发送队列最多积压的批数，超过时丢弃新的告警批次（webhook不可用时不无限堆积）
+WEBHOOK_QUEUE_SIZE = 100
+
+SNAPSHOT_KEY = ['ETF类型', '合约月份', '行权价']
+
+
+class FileAlertSink:
+    """把告警逐行追加写入JSONL文件"""
+
+    def __init__(self, path="alerts.jsonl"):
+        self.path = path
+
+    def send(self, alerts):
+        with open(self.path, 'a', encoding='utf-8') as f:
+            for alert in alerts:
+                f.write(json.dumps(alert, ensure_ascii=False) + "\n")
+
+
+class WebhookAlertSink:
+    """把一批告警以JSON POST到webhook地址（如本地转发服务）；send只放入队列，由后台线程发送"""
+
+    def __init__(self, url="http://127.0.0.1:8765/alerts", timeout=3):
+        self.url = url
+        self.timeout = timeout
+        self.dropped = 0
+        self.failed = 0
+        self._queue = queue.Queue(maxsize=WEBHOOK_QUEUE_SIZE)
+        self._thread = None
+        self._thread_lock = threading.Lock()
+
+    def send(self, alerts):
+        with self._thread_lock:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name="alert-webhook", daemon=True)
+                self._thread.start()
+        try:
+            self._queue.put_nowait(alerts)
+        except queue.Full:
+            self.dropped += 1
+
+    def _run(self):
+        while True:
+            alerts = self._queue.get()
+            try:
+                get_http_session().post(self.url, json={'alerts': alerts}, timeout=self.timeout)
+            except Exception:
+                self.failed += 1
+            finally:
+                self._queue.task_done()
+
+
+ALERT_SINK_TYPES = {
+    'file': FileAlertSink,
+    'webhook': WebhookAlertSink,
+}
+
+
+def _normalize_etf(name):
+    """规则中的ETF可以写全称或简称，统一为简称"""
+    return get_display_names().get(name, name)
+
+
+class AlertEngine:
+    """编译后的规则集合，保存上一次快照和冷却状态"""
+
+    def __init__(self, rules, sinks):
+        self.rules = pd.DataFrame(rules)
+        self.sinks = sinks
+        self.previous_snapshot = None
+        self.last_fired = {}
+        self._lock = threading.Lock()
+        self._compile()
+
+    def _compile(self):
+        rules = self.rules
+        if rules.empty:
+            self.index = {}
+            return
+        self._validate(rules)
+        for column, default in [('etf', '*'), ('month', '*'), ('strike', np.nan),
+                                ('cooldown_seconds', DEFAULT_COOLDOWN_SECONDS), ('message', '')]:
+            if column not in rules.columns:
+                rules[column] = default
+        rules['etf'] = rules['etf'].fillna('*').map(_normalize_etf)
+        rules['month'] = rules['month'].fillna('*').astype(str)
+        rules['cooldown_seconds'] = rules['cooldown_seconds'].fillna(DEFAULT_COOLDOWN_SECONDS)
+        rules['id'] = rules['id'].astype(str)
+
+        # 规则的数值化表示，评估时直接按下标取用
+        self.metric_idx = rules['metric'].map(ALERT_METRICS.index).to_numpy()
+        self.op_lt = (rules['op'] == '<').to_numpy()
+        self.op_abs = (rules['op'] == 'abs>').to_numpy()
+        self.thresholds = rules['threshold'].astype(float).to_numpy()
+        self.strikes = rules['strike'].astype(float).to_numpy()
+
+        # 按(ETF, 月份)建立规则下标索引，"*"表示任意
+        self.index = {}
+        for i, (etf, month) in enumerate(zip(rules['etf'], rules['month'])):
+            self.index.setdefault((etf, month), []).append(i)
+
+    @staticmethod
+    def _validate(rules):
+        """加载时检查规则：必需字段齐全、id不重复、指标和比较方式有效、阈值为数值"""
+        for field in REQUIRED_RULE_FIELDS:
+            if field not in rules.columns:
+                rules[field] = np.nan
+        missing = rules[REQUIRED_RULE_FIELDS].isna()
+        if missing.to_numpy().any():
+            details = [
+                f"第{i + 1}条缺少{'、'.join(missing.columns[missing.loc[i]])}" for i in rules.index[missing.any(axis=1)]
+            ]
+            raise ValueError(f"告警规则缺少字段: {'; '.join(details)}")
+        duplicated = rules['id'].astype(str).duplicated()
+        if duplicated.any():
+            raise ValueError(f"告警规则id重复: {rules.loc[duplicated, 'id'].tolist()}")
+        invalid = (
+            ~rules['metric'].isin(ALERT_METRICS) | ~rules['op'].isin(ALERT_OPS)
+            | pd.to_numeric(rules['threshold'], errors='coerce').isna()
+        )
+        if invalid.any():
+            raise ValueError(f"无效的告警规则: {rules.loc[invalid, 'id'].tolist()}")
+
+    def _rules_for(self, etf, month, month_rank):
+        """查找适用于某个(ETF, 月份)分组的全部规则下标"""
+        relative = [name for name, rank in RELATIVE_MONTHS.items() if rank == month_rank]
+        indices = []
+        for etf_key in (etf, '*'):
+            for month_key in [month, '*'] + relative:
+                indices.extend(self.index.get((etf_key, month_key), []))
+        return np.unique(np.array(indices, dtype=int))
+
+    def _metric_matrix(self, snapshot):
+        """计算快照每一行的全部指标，返回 行 x 指标 的矩阵"""
+        metrics = snapshot[['年化贴水率', '贴水价值']].to_numpy(dtype=float)
+        if self.previous_snapshot is not None and not self.previous_snapshot.empty:
+            previous = snapshot[SNAPSHOT_KEY].merge(
+                self.previous_snapshot[SNAPSHOT_KEY + ['年化贴水率', '贴水价值']],
+                on=SNAPSHOT_KEY, how='left'
+            )[['年化贴水率', '贴水价值']].to_numpy(dtype=float)
+        else:
+            previous = np.full_like(metrics, np.nan)
+        changes = metrics - previous
+        changes[:, 0] *= 10000  # 年化贴水率变化以bp计
+        return np.hstack([metrics, changes])
+
+    def evaluate(self, snapshot, now=None):
+        """对新快照评估全部规则，返回经过去重和冷却后的告警列表"""
+        if self.rules.empty or snapshot is None or snapshot.empty:
+            return []
+        now = now or datetime.datetime.now()
+
+        with self._lock:
+            snapshot = snapshot.reset_index(drop=True)
+            snapshot = snapshot.assign(
+                ETF简称=snapshot['ETF类型'].map(_normalize_etf),
+                合约月份=snapshot['合约月份'].astype(str)
+            )
+            metric_matrix = self._metric_matrix(snapshot)
+
+            alerts = []
+            for etf, etf_group in snapshot.groupby('ETF简称'):
+                months = sorted(etf_group['合约月份'].unique())
+                for month, group in etf_group.groupby('合约月份'):
+                    rule_idx = self._rules_for(etf, month, months.index(month))
+                    if len(rule_idx) == 0:
+                        continue
+                    rows = group.index.to_numpy()
+
+                    # 行 x 规则：取出每条规则对应的指标列
+                    values = metric_matrix[rows][:, self.metric_idx[rule_idx]]
+                    thresholds = self.thresholds[rule_idx]
+                    mask = np.where(
+                        self.op_abs[rule_idx], np.abs(values) > thresholds,
+                        np.where(self.op_lt[rule_idx], values < thresholds, values > thresholds)
+                    )
+                    # 指定了行权价的规则只匹配该行权价
+                    strikes = self.strikes[rule_idx]
+                    strike_ok = np.isnan(strikes) | np.isclose(group['行权价'].to_numpy(dtype=float)[:, None], strikes)
+                    mask &= strike_ok & ~np.isnan(values)
+
+                    for row_pos, rule_pos in zip(*np.nonzero(mask)):
+                        alerts.append(self._build_alert(
+                            rule_idx[rule_pos], snapshot.loc[rows[row_pos]], values[row_pos, rule_pos], now
+                        ))
+
+            self.previous_snapshot = snapshot[SNAPSHOT_KEY + ['年化贴水率', '贴水价值']]
+            fired = self._apply_cooldown(alerts, now)
+            self._prune_last_fired(snapshot)
+
+        if fired:
+            for sink in self.sinks:
+                try:
+                    sink.send(fired)
+                except Exception:
+                    continue
+        return fired
+
+    def _build_alert(self, rule_i, row, value, now):
+        rule = self.rules.iloc[rule_i]
+        return {
+            'rule_id': rule['id'],
+            'ETF类型': row['ETF简称'],
+            '合约月份': row['合约月份'],
+            '行权价': float(row['行权价']),
+            'metric': rule['metric'],
+            'value': round(float(value), 4),
+            'threshold': float(rule['threshold']),
+            'message': rule['message'],
+            'time': now.isoformat(timespec='seconds'),
+            '_cooldown': float(rule['cooldown_seconds']),
+        }
+
+    def _apply_cooldown(self, alerts, now):
+        """同一规则、同一合约在冷却时间内只告警一次"""
+        fired = []
+        seen = set()
+        for alert in alerts:
+            key = (alert['rule_id'], alert['ETF类型'], alert['合约月份'], alert['行权价'])
+            cooldown = alert.pop('_cooldown')
+            if key in seen:
+                continue
+            seen.add(key)
+            last = self.last_fired.get(key)
+            if last is not None and (now - last).total_seconds() < cooldown:
+                continue
+            self.last_fired[key] = now
+            fired.append(alert)
+        return fired
+
+    def _prune_last_fired(self, snapshot):
+        """冷却状态只保留当前规则、当前快照中仍有的合约，下架的合约和删除的规则不再占用内存"""
+        contracts = set(zip(snapshot['ETF简称'], snapshot['合约月份'], snapshot['行权价'].astype(float)))
+        rule_ids = set(self.rules['id'])
+        self.last_fired = {
+            key: fired_at for key, fired_at in self.last_fired.items()
+            if key[0] in rule_ids and key[1:] in contracts
+        }
+
+
+def load_alert_engine(path=ALERT_RULES_FILE):
+    """从规则文件构建告警引擎，文件不存在时返回None"""
+    if not os.path.exists(path):
+        return None
+    with open(path, encoding='utf-8') as f:
+        config = json.load(f)
+    sinks = []
+    for sink_config in config.get('sinks', [{'type': 'file'}]):
+        sink_config = dict(sink_config)
+        sink_type = sink_config.pop('type')
+        sinks.append(ALERT_SINK_TYPES[sink_type](**sink_config))
+    return AlertEngine(config.get('rules', []), sinks)
+
+
+_engine_cache = {'engine': None, 'mtime': None}
+_engine_cache_lock = threading.Lock()
+
+
+def get_alert_engine(path=ALERT_RULES_FILE):
+    """进程内共享的告警引擎，规则文件修改后自动重新加载（保留冷却状态）"""
+    mtime = os.path.getmtime(path) if os.path.exists(path) else None
+    with _engine_cache_lock:
+        if mtime != _engine_cache['mtime']:
+            previous = _engine_cache['engine']
+            engine = load_alert_engine(path) if mtime is not None else None
+            if engine is not None and previous is not None:
+                engine.previous_snapshot = previous.previous_snapshot
+                engine.last_fired = previous.last_fired
+            _engine_cache.update(engine=engine, mtime=mtime)
+        return _engine_cache['engine']
+
+
+def evaluate_alerts(premium_df, path=ALERT_RULES_FILE):
+    """对新快照评估告警规则，未配置规则文件时返回空列表"""
+    engine = get_alert_engine(path)
+    if engine is None:
+        return []
+    return engine.evaluate(premium_df)
@@ -0,0 +1,123 @@
+# 盒式价差与蝶式价差套利扫描
+# 输入为本次刷新已经获取的逐合约买卖价（与归档的quotes表相同），不额外请求行情。
+# 每个(ETF, 合约月份)把行权价排序后转成NumPy数组，一次性计算全部行权价对（盒式）和
+# 行权价三元组（蝶式凸性），扣除手续费后仍有利润的组合才报告，不逐个组合循环。
+import datetime
+
+import numpy as np
+import pandas as pd
+
+from option_premium import get_expiry_date
+
+# 合约单位（每张期权对应的ETF份数）：只适用于标准合约。标的分红后交易所调整的合约
+# （合约交易代码中以A代替M，如510050C2612A02750）合约单位和行权价都不是标准值，
+# 与标准合约组合会算出虚假的价差，扫描时排除
+CONTRACT_MULTIPLIER = 10000
+DEFAULT_FEE_PER_CONTRACT = 2.0  # 元/张，含经手费、结算费和佣金
+DEFAULT_RISK_FREE_RATE = 0.02
+
+RESULT_COLUMNS = ['ETF类型', '合约月份', '策略', '行权价', '剩余天数', '净价差', '手续费', '净利润(元)']
+
+
+def _quote_arrays(group):
+    """把一个(ETF, 合约月份)的报价整理为按行权价排序的Call/Put买卖价数组，缺失为NaN"""
+    table = group.pivot_table(index='行权价', columns='期权类型', values=['bid', 'ask'], aggfunc='first')
+    table = table.sort_index()
+    strikes = table.index.to_numpy(dtype=float)
+
+    def column(field, option_type):
+        if (field, option_type) not in table.columns:
+            return np.full(len(strikes), np.nan)
+        values = table[(field, option_type)].to_numpy(dtype=float)
+        return np.where(values > 0, values, np.nan)  # 买卖价为0表示没有挂单
+
+    return strikes, column('bid', 'C'), column('ask', 'C'), column('bid', 'P'), column('ask', 'P')
+
+
+def scan_boxes(strikes, call_bid, call_ask, put_bid, put_ask, discount):
+    """全部行权价对(K1<K2)的盒式价差：到期收益固定为K2-K1
+
+    买入盒式：买C1卖C2、买P2卖P1，成本低于折现后的K2-K1即有利润；
+    卖出盒式：反向操作，收入高于折现后的K2-K1即有利润。
+    返回[(策略, 行权价下标元组, 扣费前净价差数组, 每组合约张数)]
+    """
+    i, j = np.triu_indices(len(strikes), k=1)
+    payoff = (strikes[j] - strikes[i]) * discount
+    long_cost = call_ask[i] - call_bid[j] + put_ask[j] - put_bid[i]
+    short_credit = call_bid[i] - call_ask[j] + put_bid[j] - put_ask[i]
+    return [
+        ('盒式-买入', (i, j), payoff - long_cost, 4),
+        ('盒式-卖出', (i, j), short_credit - payoff, 4),
+    ]
+
+
+def scan_butterflies(strikes, call_bid, call_ask, put_bid, put_ask):
+    """全部行权价三元组(K1<K2<K3)的蝶式凸性：到期收益非负
+
+    买入w份K1、(1-w)份K3并卖出1份K2（w=(K3-K2)/(K3-K1)），建仓能收到权利金即违反凸性，
+    每组共2张合约。返回格式同scan_boxes。
+    """
+    n = len(strikes)
+    index = np.arange(n)
+    i, j, k = np.nonzero((index[:, None, None] < index[None, :, None]) & (index[None, :, None] < index[None, None, :]))
+    weight = (strikes[k] - strikes[j]) / (strikes[k] - strikes[i])
+    return [
+        (name, (i, j, k), bid[j] - weight * ask[i] - (1 - weight) * ask[k], 2)
+        for name, bid, ask in [('蝶式-Call', call_bid, call_ask), ('蝶式-Put', put_bid, put_ask)]
+    ]
+
+
+def scan_arbitrage(quotes, fee_per_contract=DEFAULT_FEE_PER_CONTRACT, risk_free_rate=DEFAULT_RISK_FREE_RATE, as_of=None):
+    """扫描全部(ETF, 合约月份)的盒式和蝶式套利机会
+
+    quotes: 逐合约报价（ETF类型, 合约月份, 行权价, 期权类型, bid, ask）
+    返回(按净利润降序的违例DataFrame, 统计信息)；分红调整合约不参与扫描，数量计入统计信息
+    """
+    stats = {'expiries': 0, 'pairs': 0, 'triples': 0, 'adjusted': 0}
+    if quotes is None or len(quotes) == 0:
+        return pd.DataFrame(columns=RESULT_COLUMNS), stats
+    quotes = pd.DataFrame(quotes)
+    as_of = as_of or datetime.date.today()
+    if '合约交易代码' in quotes.columns:
+        adjusted = quotes['合约交易代码'].fillna('').astype(str).str.contains('A')
+        stats['adjusted'] = int(adjusted.sum())
+        quotes = quotes[~adjusted]
+
+    violations = []
+    for (etf_type, month), group in quotes.groupby(['ETF类型', '合约月份']):
+        strikes, call_bid, call_ask, put_bid, put_ask = _quote_arrays(group)
+        n = len(strikes)
+        if n < 2:
+            continue
+        days = max((get_expiry_date(str(month)) - as_of).days, 0)
+        discount = 1 / (1 + risk_free_rate * days / 365)
+        stats['expiries'] += 1
+        stats['pairs'] += n * (n - 1) // 2
+        stats['triples'] += n * (n - 1) * (n - 2) // 6
+
+        checks = scan_boxes(strikes, call_bid, call_ask, put_bid, put_ask, discount)
+        if n >= 3:
+            checks += scan_butterflies(strikes, call_bid, call_ask, put_bid, put_ask)
+        for name, legs, edge, contracts in checks:
+            fee = contracts * fee_per_contract
+            profit = edge * CONTRACT_MULTIPLIER - fee
+            # NaN（缺少报价）的比较结果为False，自然被排除
+            hit = np.nonzero(profit > 0)[0]
+            if len(hit) == 0:
+                continue
+            leg_strikes = np.column_stack([strikes[leg[hit]] for leg in legs])
+            violations.append(pd.DataFrame({
+                'ETF类型': etf_type,
+                '合约月份': month,
+                '策略': name,
+                '行权价': ['/'.join(f"{strike:g}" for strike in row) for row in leg_strikes],
+                '剩余天数': days,
+                '净价差': np.round(edge[hit], 4),
+                '手续费': fee,
+                '净利润(元)': np.round(profit[hit], 2),
+            }))
+
+    if not violations:
+        return pd.DataFrame(columns=RESULT_COLUMNS), stats
+    result = pd.concat(violations, ignore_index=True)
+    return result.sort_values('净利润(元)', ascending=False, ignore_index=True), stats
@@ -0,0 +1,312 @@
+# 贴水历史存储的规模基准测试
+# 按当前日志格式（ETF类型, 合约月份, 行权价, 贴水价值, 年化贴水率, 剩余天数, 记录日期）生成多年的合成数据，
+# 分别测量各存储后端的保存/追加、全量读取、按(ETF, 合约月份)过滤读取、合并+排序的耗时和峰值内存：
+#   - csv:     当前路径（save_queue.py）：整表CSV，每次保存读回全表、merge_history合并后整表重写并base64编码上传
+#   - parquet: Parquet + zstd，保存只写入当天的新文件（与quote_archive.py的归档方式相同），
+#              已结束的月份合并为一个按(ETF类型, 合约月份)排序的月文件，过滤读取可按行组统计跳过
+# 每个测量在独立的子进程中运行，峰值内存为测量期间子进程最大常驻内存相对开始时的增量；
+# 子进程内存不足或超时记为失败，用来提前发现当前方案在多大规模时不再可用。
+#
+# 用法: python benchmark_history_store.py --rows 1000000 5000000 20000000 50000000 --years 5
+import argparse
+import base64
+import datetime
+import json
+import multiprocessing
+import os
+import resource
+import shutil
+import tempfile
+import time
+from io import StringIO
+
+import numpy as np
+import pandas as pd
+
+from option_premium import get_expiry_date
+from save_queue import HISTORY_COLUMNS, merge_history
+from underlying_registry import get_display_names
+
+STORE_BACKENDS = ['csv', 'parquet']
+OPERATIONS = ['save', 'full_load', 'filtered_read', 'merge_sort']
+
+# 每个ETF同时挂牌的合约月份数
+MONTHS_PER_DAY = 4
+# 每个交易日的行数超过该值时分块写入，避免生成数据时占用过多内存
+GENERATE_CHUNK_ROWS = 2_000_000
+PARQUET_COMPRESSION = "zstd"
+PARQUET_ROW_GROUP_ROWS = 50_000
+# GitHub单个文件的大小上限，CSV整表上传超过后无法保存
+GITHUB_FILE_LIMIT_MB = 100
+
+
+def get_etf_names():
+    """注册表中全部ETF简称"""
+    return list(dict.fromkeys(get_display_names().values()))
+
+
+def get_trade_days(years, end=None):
+    """合成数据使用的交易日（工作日）"""
+    end = end or datetime.date.today()
+    start = end - datetime.timedelta(days=int(years * 365))
+    return [day.date() for day in pd.bdate_range(start, end)]
+
+
+def get_strikes_per_month(rows, num_days, num_etfs):
+    """按目标行数反推每个合约月份的行权价档数"""
+    return max(1, int(np.ceil(rows / (num_days * num_etfs * MONTHS_PER_DAY))))
+
+
+def _contract_months(day):
+    """某天挂牌的合约月份（未到期的最近MONTHS_PER_DAY个月）及剩余天数"""
+    months = []
+    year, month = day.year, day.month
+    while len(months) < MONTHS_PER_DAY:
+        code = f"{year % 100:02d}{month:02d}"
+        days_left = (get_expiry_date(code) - day).days
+        if days_left >= 0:
+            months.append((code, days_left))
+        year, month = (year + 1, 1) if month == 12 else (year, month + 1)
+    return months
+
+
+def generate_day(day, etf_names, strikes_per_month, rng):
+    """生成一个交易日的合成快照"""
+    months = _contract_months(day)
+    groups = len(etf_names) * len(months)
+    etf_col = np.repeat(np.array(etf_names, dtype=object), len(months) * strikes_per_month)
+    month_col = np.tile(np.repeat(np.array([code for code, _ in months], dtype=object), strikes_per_month), len(etf_names))
+    days_col = np.tile(np.repeat(np.array([days for _, days in months]), strikes_per_month), len(etf_names))
+
+    # 每个ETF的价格在1~6之间，行权价以1%为间隔分布在平值两侧
+    spot = np.repeat(1 + 5 * rng.random(len(etf_names)), len(months) * strikes_per_month)
+    offsets = np.tile(np.arange(strikes_per_month) - strikes_per_month // 2, groups)
+    strike_col = np.round(spot * (1 + 0.01 * offsets), 3)
+    premium = np.round(rng.normal(0, 0.01, groups * strikes_per_month) * spot, 4)
+    annualized = np.round(premium / spot * 365 / np.maximum(days_col, 1), 4)
+
+    return pd.DataFrame({
+        'ETF类型': etf_col,
+        '合约月份': month_col,
+        '行权价': strike_col,
+        '贴水价值': premium,
+        '年化贴水率': annualized,
+        '剩余天数': days_col,
+        '记录日期': day.strftime('%Y-%m-%d'),
+    }, columns=HISTORY_COLUMNS)
+
+
+def _write_parquet(store_dir, name, df):
+    """写入一个Parquet文件（先写临时文件再改名），返回文件大小"""
+    final_path = os.path.join(store_dir, f"{name}.parquet")
+    tmp_path = final_path + ".tmp"
+    df = df.sort_values(['ETF类型', '合约月份', '记录日期', '行权价'])
+    df.to_parquet(tmp_path, compression=PARQUET_COMPRESSION, index=False, row_group_size=PARQUET_ROW_GROUP_ROWS)
+    os.replace(tmp_path, final_path)
+    return os.path.getsize(final_path)
+
+
+def build_stores(work_dir, rows, years, seed=0):
+    """按目标行数生成合成历史，同时写出CSV和Parquet两种存储，返回数据集信息"""
+    etf_names = get_etf_names()
+    days = get_trade_days(years)
+    strikes_per_month = get_strikes_per_month(rows, len(days), len(etf_names))
+    rng = np.random.default_rng(seed)
+
+    csv_path = os.path.join(work_dir, "history.csv")
+    parquet_dir = os.path.join(work_dir, "parquet")
+    os.makedirs(parquet_dir, exist_ok=True)
+
+    # 与GitHub上的日志一致：最新日期在前，带BOM
+    total_rows = 0
+    current_month = days[-1].strftime('%Y-%m')
+    month_frames = {}
+    with open(csv_path, 'w', encoding='utf-8-sig', newline='') as csv_file:
+        csv_file.write(",".join(HISTORY_COLUMNS) + "\n")
+        chunk = []
+        chunk_rows = 0
+        for day in reversed(days):
+            day_df = generate_day(day, etf_names, strikes_per_month, rng)
+            month = day.strftime('%Y-%m')
+            if month == current_month:
+                # 当月按天存放，已结束的月份合并为月文件
+                _write_parquet(parquet_dir, day_df['记录日期'].iloc[0], day_df)
+            else:
+                if month_frames and month not in month_frames:
+                    # 按日期倒序生成，出现新的月份说明上一个月份已经完整
+                    finished, frames = month_frames.popitem()
+                    _write_parquet(parquet_dir, finished, pd.concat(frames))
+                month_frames.setdefault(month, []).append(day_df)
+            chunk.append(day_df)
+            chunk_rows += len(day_df)
+            total_rows += len(day_df)
+            if chunk_rows >= GENERATE_CHUNK_ROWS:
+                pd.concat(chunk).to_csv(csv_file, index=False, header=False)
+                chunk, chunk_rows = [], 0
+        if chunk:
+            pd.concat(chunk).to_csv(csv_file, index=False, header=False)
+    for month, frames in month_frames.items():
+        _write_parquet(parquet_dir, month, pd.concat(frames))
+
+    return {
+        'rows': total_rows,
+        'days': len(days),
+        'strikes_per_month': strikes_per_month,
+        'next_day': (days[-1] + datetime.timedelta(days=1)).isoformat(),
+        'filter': (etf_names[0], _contract_months(days[-1])[0][0]),
+        'csv_path': csv_path,
+        'parquet_dir': parquet_dir,
+        'csv_mb': os.path.getsize(csv_path) / 1024 / 1024,
+        'parquet_mb': sum(
+            os.path.getsize(os.path.join(parquet_dir, name)) for name in os.listdir(parquet_dir)
+        ) / 1024 / 1024,
+    }
+
+
+def load_csv(csv_path):
+    """当前路径：读取整个CSV文本后解析（与save_queue.fetch_history相同）"""
+    with open(csv_path, encoding='utf-8-sig') as f:
+        content = f.read()
+    return pd.read_csv(StringIO(content))
+
+
+def load_parquet(parquet_dir, filters=None):
+    """读取Parquet存储（可按列值过滤）"""
+    import pyarrow.parquet as pq
+    return pq.read_table(parquet_dir, filters=filters).to_pandas()
+
+
+def _new_entry(dataset):
+    """保存操作写入的新一天快照（与enqueue_save的日志条目格式相同）"""
+    day = datetime.date.fromisoformat(dataset['next_day'])
+    day_df = generate_day(day, get_etf_names(), dataset['strikes_per_month'], np.random.default_rng(1))
+    return {'record_date': dataset['next_day'], 'rows': day_df.to_dict('records')}, day_df
+
+
+def _reset_peak_rss():
+    """重置进程的常驻内存峰值（Linux），返回当前常驻内存KB"""
+    try:
+        with open('/proc/self/clear_refs', 'w') as f:
+            f.write('5')
+    except OSError:
+        pass
+    return _read_rss_kb('VmRSS')
+
+
+def _read_rss_kb(field):
+    """从/proc/self/status读取VmRSS/VmHWM；不可用时退化为getrusage的最大常驻内存"""
+    try:
+        with open('/proc/self/status') as f:
+            for line in f:
+                if line.startswith(field + ':'):
+                    return int(line.split()[1])
+    except OSError:
+        pass
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+
+def _run_operation(backend, operation, dataset, result_queue):
+    """在子进程中执行一次测量，把(耗时秒, 峰值内存增量MB, 附加信息)放入result_queue"""
+    entry, day_df = _new_entry(dataset)
+    baseline_kb = _reset_peak_rss()
+    etf, month = dataset['filter']
+    extra = {}
+
+    start = time.perf_counter()
+    if backend == 'csv':
+        if operation == 'save':
+            # upload_pending的本地部分：读回全表、合并、整表重写并编码为contents API的请求体
+            merged = merge_history(load_csv(dataset['csv_path']), [entry])
+            payload = base64.b64encode(merged.to_csv(index=False, encoding='utf-8-sig').encode('utf-8-sig'))
+            extra['payload_mb'] = round(len(payload) / 1024 / 1024, 2)
+        elif operation == 'full_load':
+            extra['rows'] = len(load_csv(dataset['csv_path']))
+        elif operation == 'filtered_read':
+            history = load_csv(dataset['csv_path'])
+            extra['rows'] = len(history[(history['ETF类型'] == etf) & (history['合约月份'].astype(str) == month)])
+    else:
+        if operation == 'save':
+            # 只写入当天的新文件，已有文件不变
+            extra['payload_mb'] = round(_write_parquet(dataset['parquet_dir'], dataset['next_day'], day_df) / 1024 / 1024, 2)
+        elif operation == 'full_load':
+            extra['rows'] = len(load_parquet(dataset['parquet_dir']))
+        elif operation == 'filtered_read':
+            extra['rows'] = len(load_parquet(dataset['parquet_dir'], [('ETF类型', '=', etf), ('合约月份', '=', month)]))
+
+    if operation == 'merge_sort':
+        # 只计合并和排序本身，读取时间见full_load
+        history = load_csv(dataset['csv_path']) if backend == 'csv' else load_parquet(dataset['parquet_dir'])
+        baseline_kb = _reset_peak_rss()
+        start = time.perf_counter()
+        extra['rows'] = len(merge_history(history, [entry]))
+    elapsed = time.perf_counter() - start
+
+    peak_mb = (_read_rss_kb('VmHWM') - baseline_kb) / 1024
+    if backend == 'parquet' and operation == 'save':
+        # 还原存储，后续测量使用同样的数据
+        os.remove(os.path.join(dataset['parquet_dir'], f"{dataset['next_day']}.parquet"))
+    result_queue.put((elapsed, peak_mb, extra))
+
+
+def measure(backend, operation, dataset, timeout):
+    """在新的子进程中执行一次测量，失败（内存不足被杀、超时、异常）时返回错误信息"""
+    context = multiprocessing.get_context('spawn')
+    result_queue = context.Queue()
+    process = context.Process(target=_run_operation, args=(backend, operation, dataset, result_queue))
+    process.start()
+    try:
+        elapsed, peak_mb, extra = result_queue.get(timeout=timeout)
+    except Exception:
+        process.kill()
+        process.join()
+        if process.exitcode is not None and process.exitcode < 0:
+            return {'error': f"子进程被信号{-process.exitcode}终止（通常是内存不足）"}
+        return {'error': f"超时或异常退出（exitcode={process.exitcode}）"}
+    process.join()
+    return {'ms': round(elapsed * 1000, 1), 'peak_mb': round(peak_mb, 1), **extra}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="贴水历史存储规模基准测试（合成数据）")
+    parser.add_argument("--rows", type=int, nargs="+", default=[1_000_000, 5_000_000], help="目标行数（可多个）")
+    parser.add_argument("--years", type=float, default=5, help="合成历史覆盖的年数")
+    parser.add_argument("--backends", nargs="+", choices=STORE_BACKENDS, default=STORE_BACKENDS, help="存储后端")
+    parser.add_argument("--operations", nargs="+", choices=OPERATIONS, default=OPERATIONS, help="测量的操作")
+    parser.add_argument("--timeout", type=float, default=1800, help="单次测量超时（秒）")
+    parser.add_argument("--work-dir", default=None, help="合成数据目录（默认临时目录，结束后删除）")
+    parser.add_argument("--json", action="store_true", help="以JSON输出结果")
+    args = parser.parse_args()
+
+    results = []
+    for rows in args.rows:
+        work_dir = os.path.join(args.work_dir, str(rows)) if args.work_dir else tempfile.mkdtemp(prefix="history_bench_")
+        os.makedirs(work_dir, exist_ok=True)
+        start = time.time()
+        dataset = build_stores(work_dir, rows, args.years)
+        if not args.json:
+            print(
+                f"📦 {dataset['rows']:,} 行（{dataset['days']}个交易日 x 每月{dataset['strikes_per_month']}档），"
+                f"CSV {dataset['csv_mb']:.1f}MB / Parquet {dataset['parquet_mb']:.1f}MB，生成耗时 {time.time() - start:.1f} 秒"
+            )
+        for backend in args.backends:
+            for operation in args.operations:
+                result = {'rows': dataset['rows'], 'backend': backend, 'operation': operation,
+                          **measure(backend, operation, dataset, args.timeout)}
+                results.append(result)
+                if not args.json:
+                    if 'error' in result:
+                        print(f"  {backend:<8} {operation:<14} ❌ {result['error']}")
+                    else:
+                        detail = f"  请求体{result['payload_mb']}MB" if 'payload_mb' in result else ""
+                        if result.get('payload_mb', 0) > GITHUB_FILE_LIMIT_MB:
+                            detail += f" ⚠️ 超过GitHub单文件{GITHUB_FILE_LIMIT_MB}MB上限"
+                        print(f"  {backend:<8} {operation:<14} {result['ms']:>10.1f}ms  峰值内存+{result['peak_mb']:>8.1f}MB{detail}")
+        if not args.work_dir:
+            shutil.rmtree(work_dir, ignore_errors=True)
+
+    if args.json:
+        print(json.dumps(results, ensure_ascii=False, indent=2))
+
+
+if __name__ == "__main__":
+    main()
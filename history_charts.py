@@ -0,0 +1,70 @@
+# 历史走势图的数据准备
+# 图表点数按像素宽度限制：单个行权价的序列用LTTB降采样，
+# 全部行权价的视图使用日度汇总表（premium_rollup.py）中的最小值/中位数/最大值和平值贴水，
+# 超过图表宽度时再按时间桶合并。
+import numpy as np
+import pandas as pd
+
+
+def lttb_downsample(x, y, threshold):
+    """Largest-Triangle-Three-Buckets降采样，返回保留点的下标
+
+    x, y为等长的一维数组（x需升序），threshold为目标点数。
+    """
+    n = len(x)
+    if threshold >= n or threshold < 3:
+        return np.arange(n)
+
+    x = np.asarray(x, dtype=float)
+    y = np.asarray(y, dtype=float)
+    selected = np.empty(threshold, dtype=int)
+    selected[0] = 0
+    selected[-1] = n - 1
+
+    # 中间n-2个点平均分到threshold-2个桶
+    bucket_edges = np.linspace(1, n - 1, threshold - 1).astype(int)
+    previous = 0
+    for i in range(threshold - 2):
+        start, end = bucket_edges[i], bucket_edges[i + 1]
+        # 下一个桶的平均点（最后一个桶用终点）
+        next_start, next_end = bucket_edges[i + 1], bucket_edges[i + 2] if i + 2 < len(bucket_edges) else n
+        avg_x = x[next_start:next_end].mean()
+        avg_y = y[next_start:next_end].mean()
+        # 与上一个选中点和下一个桶平均点构成的三角形面积最大的点
+        areas = np.abs(
+            (x[previous] - avg_x) * (y[start:end] - y[previous])
+            - (x[previous] - x[start:end]) * (avg_y - y[previous])
+        )
+        previous = start + int(np.argmax(areas))
+        selected[i + 1] = previous
+    return selected
+
+
+def downsample_rollup(rollup, max_points):
+    """日度汇总超过max_points天时，把相邻日期合并到同一个时间桶"""
+    rollup = rollup.sort_values('记录日期')
+    # 旧数据没有ETF价格，平值贴水全部为空时不画这条线
+    columns = ['最小值', '中位数', '最大值']
+    if '平值年化贴水率' in rollup.columns and rollup['平值年化贴水率'].notna().any():
+        columns.append('平值年化贴水率')
+    if len(rollup) <= max_points:
+        return rollup.set_index('记录日期')[columns].astype(float)
+    bucket = np.arange(len(rollup)) * max_points // len(rollup)
+    grouped = rollup.groupby(bucket)
+    result = pd.DataFrame({
+        '记录日期': grouped['记录日期'].first(),
+        '最小值': grouped['最小值'].min(),
+        '中位数': grouped['中位数'].median(),
+        '最大值': grouped['最大值'].max(),
+    })
+    if '平值年化贴水率' in columns:
+        result['平值年化贴水率'] = grouped['平值年化贴水率'].median()
+    return result.set_index('记录日期').astype(float)
+
+
+def downsample_strike_series(series_df, max_points):
+    """单个行权价的年化贴水率序列用LTTB降采样到max_points个点"""
+    series_df = series_df.sort_values('记录日期')
+    x = pd.to_datetime(series_df['记录日期']).to_numpy(dtype='datetime64[s]').astype(np.int64)
+    keep = lttb_downsample(x, series_df['年化贴水率'].to_numpy(dtype=float), max_points)
+    return series_df.iloc[keep].set_index('记录日期')[['年化贴水率']]
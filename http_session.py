@@ -0,0 +1,109 @@
+# 共享HTTP连接池
+# 所有上游请求（GitHub API、akshare行情接口）共用一个带keep-alive的Session，
+# 避免每次调用都重新进行TCP+TLS握手，并统一设置超时
+import sys
+import threading
+
+import requests
+from requests.adapters import HTTPAdapter
+
+# 默认超时：(连接超时, 读取超时)，单位秒
+DEFAULT_TIMEOUT = (5, 15)
+
+# 默认连接池大小；应不小于同时发请求的线程总数（页面按各线程池的大小调用configure_http_pool），
+# 否则超出的连接用完即关闭，无法复用
+DEFAULT_POOL_MAXSIZE = 20
+
+_session = None
+_session_lock = threading.Lock()
+_pool_maxsize = DEFAULT_POOL_MAXSIZE
+
+# 请求计数（用于统计连接复用率）
+_request_count = [0]
+_count_lock = threading.Lock()
+
+
+class _TimeoutSession(requests.Session):
+    """未显式指定timeout的请求自动使用默认超时"""
+
+    def request(self, method, url, **kwargs):
+        if kwargs.get('timeout') is None:
+            kwargs['timeout'] = DEFAULT_TIMEOUT
+        with _count_lock:
+            _request_count[0] += 1
+        return super().request(method, url, **kwargs)
+
+
+def configure_http_pool(pool_maxsize):
+    """根据抓取并发数设置连接池大小，大小变化时重建Session"""
+    global _session, _pool_maxsize
+    with _session_lock:
+        if pool_maxsize == _pool_maxsize and _session is not None:
+            return
+        _pool_maxsize = pool_maxsize
+        if _session is not None:
+            _session.close()
+            _session = None
+
+
+def get_http_session():
+    """获取进程内共享的Session（线程安全，懒加载）"""
+    global _session
+    if _session is None:
+        with _session_lock:
+            if _session is None:
+                session = _TimeoutSession()
+                # 每个主机一个连接池，池内最多保留pool_maxsize个keep-alive连接
+                adapter = HTTPAdapter(pool_connections=8, pool_maxsize=_pool_maxsize, pool_block=False)
+                session.mount("https://", adapter)
+                session.mount("http://", adapter)
+                _session = session
+    return _session
+
+
+class _PooledRequestsModule:
+    """替换akshare模块中的requests引用，get/post走共享连接池，其余属性透传"""
+
+    def get(self, url, **kwargs):
+        return get_http_session().get(url, **kwargs)
+
+    def post(self, url, **kwargs):
+        return get_http_session().post(url, **kwargs)
+
+    def request(self, method, url, **kwargs):
+        return get_http_session().request(method, url, **kwargs)
+
+    def __getattr__(self, name):
+        return getattr(requests, name)
+
+
+def install_akshare_http_pool(*functions):
+    """让指定akshare函数所在模块的requests调用走共享连接池"""
+    shim = _PooledRequestsModule()
+    for func in functions:
+        module = sys.modules.get(getattr(func, '__module__', ''), None)
+        if module is not None and getattr(module, 'requests', None) is requests:
+            module.requests = shim
+
+
+def get_http_pool_stats():
+    """统计连接复用情况：请求总数、新建连接数、复用率"""
+    session = _session
+    new_connections = 0
+    if session is not None:
+        for adapter in set(session.adapters.values()):
+            pools = adapter.poolmanager.pools
+            for key in list(pools.keys()):
+                try:
+                    new_connections += pools[key].num_connections
+                except KeyError:
+                    continue
+    with _count_lock:
+        total_requests = _request_count[0]
+    reuse_rate = 1 - new_connections / total_requests if total_requests > 0 else 0.0
+    return {
+        'requests': total_requests,
+        'connections': new_connections,
+        'reuse_rate': max(reuse_rate, 0.0),
+        'pool_maxsize': _pool_maxsize,
+    }
@@ -0,0 +1,162 @@
+# 盘中统计
+# 每个(ETF类型, 合约月份, 行权价)分配一个数组下标，年化贴水率的开盘/最高/最低/最新、EWMA和昨收
+# 保存在NumPy数组中；每个新快照只按下标向量化更新一次，开销与当天已刷新的次数无关，
+# 不需要保存或重算盘中历史。新交易日的第一个快照清空统计，并从贴水日志读取一次昨收
+# （未在刷新截止时间内读取完成时，之后的快照再取，取到后补填已有的行权价）。
+import os
+import threading
+
+import numpy as np
+import pandas as pd
+
+from save_queue import expand_history
+
+INTRADAY_EWMA_ALPHA = float(os.environ.get("INTRADAY_EWMA_ALPHA", "0.2"))
+INITIAL_CAPACITY = 1024
+
+STATS_KEY = ['ETF类型', '合约月份', '行权价']
+STATS_COLUMNS = ['开盘', '最高', '最低', '最新', 'EWMA', '昨收', '较昨收']
+_ARRAY_NAMES = ['open', 'high', 'low', 'last', 'ewma', 'prev_close']
+
+
+def _keys(df):
+    """统计的键：合约月份统一为字符串，行权价保留4位小数"""
+    return list(zip(df['ETF类型'], df['合约月份'].astype(str), df['行权价'].astype(float).round(4)))
+
+
+def previous_close_from_history(history, previous_trade_date, display_names):
+    """贴水日志中上一个交易日的年化贴水率，返回{(ETF类型, 合约月份, 行权价): 值}
+
+    日志只保存变化的行并带删除标记，先用expand_history还原到每个记录日期，再取previous_trade_date
+    当天的行（已下架的合约没有该行，剩余天数和年化贴水率按当天换算）；当天没有保存过时返回空。
+    日志中的ETF类型是简称，按display_names（ETF类型 -> 简称）换回ETF类型。
+    """
+    if history is None or history.empty:
+        return {}
+    day = previous_trade_date.isoformat()
+    history = history[history['记录日期'].astype(str) <= day]
+    if history.empty:
+        return {}
+    expanded = expand_history(history)
+    expanded = expanded[expanded['记录日期'] == day]
+    etf_types = {display: etf_type for etf_type, display in display_names.items()}
+    expanded = expanded.assign(ETF类型=expanded['ETF类型'].map(etf_types).fillna(expanded['ETF类型']))
+    return dict(zip(_keys(expanded), expanded['年化贴水率']))
+
+
+class IntradayStats:
+    """按交易日累计的逐行权价盘中统计"""
+
+    def __init__(self, alpha=INTRADAY_EWMA_ALPHA, capacity=INITIAL_CAPACITY):
+        self.alpha = alpha
+        self.trading_date = None
+        self.snapshots = 0
+        self._index = {}
+        self._previous_close = {}
+        self.previous_close_loaded = False
+        self._arrays = {name: np.full(capacity, np.nan) for name in _ARRAY_NAMES}
+
+    def _indices(self, keys):
+        """键对应的数组下标，新键追加到末尾（同时填入昨收），容量不够时翻倍"""
+        new_keys = [key for key in dict.fromkeys(keys) if key not in self._index]
+        if new_keys:
+            start = len(self._index)
+            size = start + len(new_keys)
+            capacity = len(self._arrays['open'])
+            if size > capacity:
+                while capacity < size:
+                    capacity *= 2
+                for name, values in self._arrays.items():
+                    grown = np.full(capacity, np.nan)
+                    grown[:len(values)] = values
+                    self._arrays[name] = grown
+            for offset, key in enumerate(new_keys):
+                self._index[key] = start + offset
+            self._arrays['prev_close'][start:size] = [self._previous_close.get(key, np.nan) for key in new_keys]
+        return np.fromiter((self._index[key] for key in keys), dtype=np.int64, count=len(keys))
+
+    def reset(self, trading_date):
+        """新交易日：清空统计、下标（已到期的合约不再占用数组）和昨收"""
+        for values in self._arrays.values():
+            values.fill(np.nan)
+        self._index = {}
+        self._previous_close = {}
+        self.previous_close_loaded = False
+        self.trading_date = trading_date
+        self.snapshots = 0
+
+    def set_previous_close(self, previous_close):
+        """设置昨收（{键: 昨收}），已有的行权价立即补填"""
+        self._previous_close = previous_close
+        self.previous_close_loaded = True
+        if self._index:
+            keys = list(self._index)
+            index = np.fromiter(self._index.values(), dtype=np.int64, count=len(keys))
+            self._arrays['prev_close'][index] = [previous_close.get(key, np.nan) for key in keys]
+
+    def update(self, df):
+        """用一个快照的年化贴水率更新统计（每个行权价O(1)）"""
+        if df.empty:
+            return
+        index = self._indices(_keys(df))
+        values = df['年化贴水率'].to_numpy(dtype=float)
+        arrays = self._arrays
+        first = np.isnan(arrays['open'][index])
+        arrays['open'][index] = np.where(first, values, arrays['open'][index])
+        arrays['high'][index] = np.fmax(arrays['high'][index], values)
+        arrays['low'][index] = np.fmin(arrays['low'][index], values)
+        arrays['last'][index] = values
+        ewma = self.alpha * values + (1 - self.alpha) * arrays['ewma'][index]
+        arrays['ewma'][index] = np.where(first, values, ewma)
+        self.snapshots += 1
+
+    def lookup(self, df):
+        """df各行的统计，索引与df相同"""
+        index = self._indices(_keys(df))
+        arrays = self._arrays
+        stats = pd.DataFrame({
+            '开盘': arrays['open'][index],
+            '最高': arrays['high'][index],
+            '最低': arrays['low'][index],
+            '最新': arrays['last'][index],
+            'EWMA': arrays['ewma'][index],
+            '昨收': arrays['prev_close'][index],
+        }, index=df.index)
+        stats['较昨收'] = stats['最新'] - stats['昨收']
+        return stats
+
+
+_lock = threading.Lock()
+_stats = IntradayStats()
+
+
+def update_intraday_stats(premium_df, trading_date, load_previous_close):
+    """用新快照更新进程内的盘中统计，返回premium_df各行的统计
+
+    trading_date为当前行情所属的交易日；昨收还没有读取时调用load_previous_close(trading_date)，返回None表示暂时读取不到，下一个快照再取；
+    未在截止时间内完成的行（过期，显示的是上一次的值）不参与更新。
+    """
+    with _lock:
+        if _stats.trading_date != trading_date:
+            _stats.reset(trading_date)
+        need_previous_close = not _stats.previous_close_loaded
+    # 读取昨收可能较慢，不占用锁
+    previous_close = load_previous_close(trading_date) if need_previous_close else None
+    with _lock:
+        if previous_close is not None and _stats.trading_date == trading_date:
+            _stats.set_previous_close(previous_close)
+        fresh = premium_df
+        if '过期' in premium_df.columns:
+            fresh = premium_df[~premium_df['过期'].fillna(False).astype(bool)]
+        _stats.update(fresh)
+        return _stats.lookup(premium_df)
+
+
+def get_intraday_stats_status():
+    """盘中统计状态，用于调试信息显示"""
+    with _lock:
+        return {
+            'trading_date': _stats.trading_date,
+            'strikes': len(_stats._index),
+            'snapshots': _stats.snapshots,
+        }
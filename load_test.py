@@ -0,0 +1,521 @@
+# 多会话压力测试
+# 每个看板会话运行在独立的进程中（相当于多个部署实例），用Streamlit的AppTest执行真实的页面脚本，
+# 全部进程共用同一个本地HTTP桩服务（akshare接口和GitHub API，可设置延迟）：
+#   - 自动刷新：交易时间判断固定为"交易中"，刷新间隔缩短为--auto-interval秒，保持自动刷新开关打开，
+#     到期后重跑页面，由数据状态片段按刷新节奏请求后台刷新（与线上自动刷新的路径相同）
+#   - 手动刷新：点击"🔄 手动刷新数据"
+#   - 刷新并保存：点击"🔄💾 刷新并保存"，各进程的保存队列并发提交到同一个桩仓库，冲突是真实的
+# 页面运行只提交刷新请求，刷新延迟计到后台快照线程完成该请求为止。各进程完成首次打开后在桩服务上
+# 等齐再开始计时，统计上游请求数、刷新延迟p50/p99、每会话（进程）内存和保存冲突率随N的变化。
+#
+# 用法: python load_test.py --sessions 1 5 10 20 --cycles 3 --latency-ms 30
+import argparse
+import base64
+import datetime
+import hashlib
+import json
+import os
+import random
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import types
+from collections import Counter
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlparse, parse_qs
+
+APP_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "All_SSE_ETF_Option.py")
+
+# 桩服务中的期权品种：期权板块名称 -> (标的代码, 标的现价, 交易所, 标的名称)
+# 创业板ETF期权不在注册表中，只出现在深交所的合约列表里，用来检查按标的筛选
+STUB_UNDERLYINGS = {
+    "华泰柏瑞沪深300ETF期权": ("510300", 3.95, "SSE", "沪深300ETF"),
+    "南方中证500ETF期权": ("510500", 5.80, "SSE", "中证500ETF"),
+    "华夏上证50ETF期权": ("510050", 2.75, "SSE", "上证50ETF"),
+    "华夏科创50ETF期权": ("588000", 1.05, "SSE", "科创50ETF"),
+    "易方达科创50ETF期权": ("588080", 1.02, "SSE", "科创板50ETF"),
+    "嘉实沪深300ETF期权": ("159919", 4.05, "SZSE", "嘉实沪深300ETF"),
+    "易方达创业板ETF期权": ("159915", 2.10, "SZSE", "易方达创业板ETF"),
+}
+# 与akshare一样，只有这个品种名称返回深交所合约列表（全部标的，只按两位月份过滤），其他深交所品种返回空表
+STUB_SZSE_LIST_SYMBOL = "嘉实沪深300ETF期权"
+# 每个合约月份的行权价档数
+STUB_STRIKES_PER_MONTH = 15
+# 与页面中的GITHUB_FILE_PATH一致
+STUB_HISTORY_FILE = "All_SSE_ETF_Option_Premium_Log.csv"
+STUB_BRANCH = "main"
+# 与GitHub contents API一样，超过1MB的文件不返回content，需要按sha读取blob
+STUB_CONTENTS_MAX_BYTES = 1024 * 1024
+# 会话进程输出结果的行前缀（其余输出为页面和Streamlit的日志）
+RESULT_PREFIX = "LOAD_TEST_RESULT "
+
+
+class StubState:
+    """桩服务的共享状态：合成期权数据、GitHub文件内容和请求计数"""
+
+    def __init__(self, latency):
+        self.latency = latency
+        self.lock = threading.Lock()
+        self.counts = Counter()
+        # 分支最新提交中的文件：路径 -> 内容；贴水日志预置表头，其他文件（如日度汇总表）首次保存时创建
+        self.github_files = {
+            STUB_HISTORY_FILE: "\ufeffETF类型,合约月份,行权价,贴水价值,年化贴水率,剩余天数,记录日期\n",
+        }
+        # git对象：blob sha -> 内容，树sha -> {路径: 内容}，提交sha -> (树sha, 父提交)
+        self.blobs = {}
+        self.trees = {'tree-0': self.github_files}
+        self.commits = {'commit-0': ('tree-0', None)}
+        self.head = 'commit-0'
+        self.contracts = self._build_contracts()
+        # 会话进程的起跑线：每轮测试一个名称 -> 已到达的进程数
+        self.barrier = threading.Condition()
+        self.arrived = Counter()
+
+    @staticmethod
+    def _sha(content):
+        return hashlib.sha1(content.encode('utf-8')).hexdigest()
+
+    def _build_contracts(self):
+        """为未来12个月生成合约，security_id从10000001开始编号"""
+        contracts = []
+        today = datetime.date.today()
+        security_id = 10000001
+        for board_symbol, (code, spot, exchange, underlying_name) in STUB_UNDERLYINGS.items():
+            for offset in range(12):
+                year = today.year + (today.month - 1 + offset) // 12
+                month = (today.month - 1 + offset) % 12 + 1
+                month_code = f"{year % 100:02d}{month:02d}"
+                step = round(spot * 0.025, 3)
+                for i in range(STUB_STRIKES_PER_MONTH):
+                    strike = round(spot + (i - STUB_STRIKES_PER_MONTH // 2) * step, 3)
+                    for option_type in ('C', 'P'):
+                        intrinsic = max(spot - strike, 0) if option_type == 'C' else max(strike - spot, 0)
+                        contracts.append({
+                            'board_symbol': board_symbol,
+                            'exchange': exchange,
+                            'underlying_name': underlying_name,
+                            'month': month_code,
+                            'expiry': datetime.date(year, month, 22).isoformat(),
+                            'option_type': option_type,
+                            'code': f"{code}{option_type}{month_code}M{int(strike * 1000):05d}",
+                            'security_id': str(security_id),
+                            'strike': strike,
+                            'price': round(intrinsic + 0.01 + 0.03 * spot * (offset + 1) / 12, 4),
+                        })
+                        security_id += 1
+        return contracts
+
+    def count(self, endpoint):
+        with self.lock:
+            self.counts[endpoint] += 1
+
+    def reset_counts(self):
+        with self.lock:
+            self.counts.clear()
+
+
+def _make_handler(state):
+    class StubHandler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            time.sleep(state.latency)
+            parsed = urlparse(self.path)
+            params = {key: values[0] for key, values in parse_qs(parsed.query).items()}
+            path = parsed.path
+
+            if path == '/load/barrier':
+                # 等到本轮的全部会话进程都完成首次打开，再一起开始计时
+                with state.barrier:
+                    state.arrived[params['name']] += 1
+                    state.barrier.notify_all()
+                    ready = state.barrier.wait_for(
+                        lambda: state.arrived[params['name']] >= int(params['n']), float(params['timeout'])
+                    )
+                self._json(200, {'ready': ready})
+            elif path == '/ak/board':
+                state.count('akshare.option_finance_board')
+                rows = []
+                exchange = STUB_UNDERLYINGS.get(params['symbol'], (None, None, None))[2]
+                for c in state.contracts:
+                    if exchange == 'SZSE':
+                        # 深交所合约列表：全部标的，只按两位月份过滤；合约编码、标的名称、类型、行权价、期权行权日，没有当前价
+                        if params['symbol'] != STUB_SZSE_LIST_SYMBOL or c['exchange'] != 'SZSE' or c['month'][-2:] != params['month'][-2:]:
+                            continue
+                        rows.append({
+                            '合约编码': c['security_id'], '标的名称': c['underlying_name'],
+                            '类型': '认购' if c['option_type'] == 'C' else '认沽',
+                            '行权价': c['strike'], '期权行权日': c['expiry'],
+                        })
+                    elif c['board_symbol'] == params['symbol'] and c['month'] == params['month']:
+                        rows.append({'合约交易代码': c['code'], '当前价': c['price'], '行权价': c['strike']})
+                self._json(200, rows)
+            elif path == '/ak/risk':
+                state.count('akshare.option_risk_indicator_sse')
+                rows = [
+                    {'SECURITY_ID': c['security_id'], 'CONTRACT_ID': c['code'], 'CONTRACT_SYMBOL': c['code']}
+                    for c in state.contracts if c['exchange'] == 'SSE'
+                ]
+                self._json(200, rows)
+            elif path == '/ak/quote':
+                state.count('akshare.option_sse_spot_price_sina')
+                price = next((c['price'] for c in state.contracts if c['security_id'] == params['id']), 0.0)
+                spread = max(round(price * 0.02, 4), 0.0001)
+                self._json(200, {
+                    '买量': random.randint(1, 50), '买价': round(price - spread / 2, 4), '最新价': price,
+                    '卖价': round(price + spread / 2, 4), '卖量': random.randint(1, 50),
+                })
+            elif path == '/ak/underlying':
+                state.count('akshare.option_sse_underlying_spot_price_sina')
+                code = params['symbol'][2:]
+                spot = next((s for c, s, _, _ in STUB_UNDERLYINGS.values() if c == code), 0.0)
+                self._json(200, {'最近成交价': round(spot * (1 + random.uniform(-0.001, 0.001)), 4)})
+            elif path == '/ak/trade_dates':
+                state.count('akshare.tool_trade_date_hist_sina')
+                start = datetime.date.today() - datetime.timedelta(days=60)
+                days = [start + datetime.timedelta(days=i) for i in range(120)]
+                self._json(200, [d.isoformat() for d in days if d.weekday() < 5])
+            elif '/contents/' in path:
+                state.count('github.contents.get')
+                file_path = path.split('/contents/', 1)[-1]
+                with state.lock:
+                    commit = params.get('ref', state.head)
+                    files = state.trees[state.commits[commit][0]] if commit in state.commits else {}
+                    content = files.get(file_path)
+                if content is None:
+                    self._json(404, {'message': 'Not Found'})
+                    return
+                size = len(content.encode('utf-8'))
+                with state.lock:
+                    state.blobs[state._sha(content)] = content
+                self._json(200, {
+                    'sha': state._sha(content),
+                    'size': size,
+                    'content': base64.b64encode(content.encode('utf-8')).decode() if size <= STUB_CONTENTS_MAX_BYTES else '',
+                    'encoding': 'base64' if size <= STUB_CONTENTS_MAX_BYTES else 'none',
+                    'download_url': f"http://{self.headers['Host']}/raw/{file_path}",
+                })
+            elif '/git/blobs/' in path:
+                state.count('github.git.blob.get')
+                with state.lock:
+                    content = state.blobs.get(path.rsplit('/', 1)[-1])
+                if content is None:
+                    self._json(404, {'message': 'Not Found'})
+                    return
+                self._json(200, {'content': base64.b64encode(content.encode('utf-8')).decode(), 'encoding': 'base64'})
+            elif '/git/ref/heads/' in path:
+                state.count('github.git.ref.get')
+                with state.lock:
+                    self._json(200, {'object': {'sha': state.head}})
+            elif '/git/commits/' in path:
+                with state.lock:
+                    tree_sha, parent = state.commits[path.rsplit('/', 1)[-1]]
+                self._json(200, {'tree': {'sha': tree_sha}, 'parents': [{'sha': parent}] if parent else []})
+            elif path.startswith('/repos/') and path.count('/') == 3:
+                self._json(200, {'default_branch': STUB_BRANCH})
+            elif path.startswith('/raw/'):
+                state.count('github.raw.get')
+                with state.lock:
+                    content = state.github_files.get(path[len('/raw/'):], '')
+                self._send(200, content.encode('utf-8'), "text/plain; charset=utf-8")
+            else:
+                self._json(404, {'message': 'Not Found'})
+
+        def do_POST(self):
+            """git data API：创建blob、树和提交"""
+            time.sleep(state.latency)
+            payload = json.loads(self.rfile.read(int(self.headers['Content-Length'])))
+            path = urlparse(self.path).path
+            with state.lock:
+                if path.endswith('/git/blobs'):
+                    content = base64.b64decode(payload['content']).decode('utf-8')
+                    sha = state._sha(content)
+                    state.blobs[sha] = content
+                elif path.endswith('/git/trees'):
+                    files = dict(state.trees[payload['base_tree']])
+                    files.update({item['path']: state.blobs[item['sha']] for item in payload['tree']})
+                    sha = 'tree-' + state._sha(json.dumps(files, sort_keys=True))
+                    state.trees[sha] = files
+                elif path.endswith('/git/commits'):
+                    sha = f"commit-{len(state.commits)}"
+                    state.commits[sha] = (payload['tree'], payload['parents'][0])
+                else:
+                    self._json(404, {'message': 'Not Found'})
+                    return
+            self._json(201, {'sha': sha})
+
+        def do_PATCH(self):
+            """更新分支：新提交的父提交必须是分支当前的提交（非强制更新）"""
+            time.sleep(state.latency)
+            state.count('github.git.ref.update')
+            payload = json.loads(self.rfile.read(int(self.headers['Content-Length'])))
+            with state.lock:
+                tree_sha, parent = state.commits[payload['sha']]
+                if parent != state.head:
+                    state.counts['github.git.ref.conflict'] += 1
+                    status, body = 422, {'message': 'Update is not a fast forward'}
+                else:
+                    state.head = payload['sha']
+                    state.github_files = state.trees[tree_sha]
+                    status, body = 200, {'object': {'sha': state.head}}
+            self._json(status, body)
+
+        def _json(self, status, body):
+            self._send(status, json.dumps(body, ensure_ascii=False).encode('utf-8'), "application/json")
+
+        def _send(self, status, body, content_type):
+            self.send_response(status)
+            self.send_header("Content-Type", content_type)
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, format, *args):
+            pass
+
+    return StubHandler
+
+
+def _install_stub_akshare(base_url):
+    """用指向桩服务的同名函数替换akshare模块（页面脚本import akshare时拿到的就是它）"""
+    import pandas as pd
+    import requests
+
+    # 与akshare一样通过模块级的requests发请求，这样连接池替换对桩函数同样生效
+    stub = types.ModuleType("akshare")
+    stub.requests = requests
+
+    def option_finance_board(symbol, end_month):
+        rows = stub.requests.get(f"{base_url}/ak/board", params={'symbol': symbol, 'month': end_month}).json()
+        return pd.DataFrame(rows)
+
+    def option_risk_indicator_sse(date):
+        return pd.DataFrame(stub.requests.get(f"{base_url}/ak/risk", params={'date': date}).json())
+
+    def option_sse_spot_price_sina(symbol):
+        quote = stub.requests.get(f"{base_url}/ak/quote", params={'id': symbol}).json()
+        return pd.DataFrame(list(quote.items()), columns=['字段', '值'])
+
+    def option_sse_underlying_spot_price_sina(symbol):
+        quote = stub.requests.get(f"{base_url}/ak/underlying", params={'symbol': symbol}).json()
+        return pd.DataFrame(list(quote.items()), columns=['字段', '值'])
+
+    def tool_trade_date_hist_sina():
+        return pd.DataFrame({'trade_date': stub.requests.get(f"{base_url}/ak/trade_dates").json()})
+
+    for func in [option_finance_board, option_risk_indicator_sse, option_sse_spot_price_sina,
+                 option_sse_underlying_spot_price_sina, tool_trade_date_hist_sina]:
+        func.__module__ = "akshare"
+        setattr(stub, func.__name__, func)
+    sys.modules["akshare"] = stub
+
+
+def _rss_bytes():
+    """当前进程的常驻内存（Linux读取/proc，其他平台退化为峰值RSS）"""
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError):
+        import resource
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+
+
+def _percentile(values, pct):
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, max(0, int(round(pct / 100 * (len(ordered) - 1)))))
+    return ordered[index]
+
+
+def _find_widget(widgets, label_prefix):
+    return next(w for w in widgets if w.label.startswith(label_prefix))
+
+
+def _wait_for_refresh(timeout):
+    """等待后台快照线程完成目前为止提交的全部刷新请求"""
+    import snapshot_worker
+
+    ticket = snapshot_worker.get_worker_status()['requested']
+    deadline = time.time() + timeout
+    while snapshot_worker.get_worker_status()['completed'] < ticket:
+        if time.time() > deadline:
+            raise RuntimeError("等待后台刷新超时")
+        time.sleep(0.05)
+
+
+def run_session(base_url, barrier_name, num_sessions, cycles, timeout, auto_interval):
+    """会话进程：首次打开 + 若干轮(自动刷新, 手动刷新, 刷新并保存)，返回本进程的统计结果"""
+    import requests
+
+    _install_stub_akshare(base_url)
+    # 固定为交易时间，下一次自动刷新在上一次刷新开始auto_interval秒之后
+    import trading_calendar
+    trading_calendar.is_trading_time = lambda now=None: True
+    trading_calendar.get_next_refresh_time = (
+        lambda now, last_refresh: last_refresh + datetime.timedelta(seconds=auto_interval)
+    )
+    import save_queue
+    import snapshot_worker
+    from streamlit.testing.v1 import AppTest
+
+    at = AppTest.from_file(APP_FILE, default_timeout=timeout)
+    at.secrets["GT"] = "stub-token"
+    timings = {}
+
+    def timed(kind, action):
+        start = time.perf_counter()
+        action()
+        _wait_for_refresh(timeout)
+        timings.setdefault(kind, []).append(time.perf_counter() - start)
+        if at.exception:
+            raise RuntimeError(f"{kind}出错: {at.exception[0].message}")
+
+    def auto_refresh():
+        # 等到下一次自动刷新到期，重跑页面后数据状态片段应当请求一次刷新
+        started_at = snapshot_worker.get_worker_status()['started_at'] or 0
+        time.sleep(max(started_at + auto_interval - time.time(), 0) + 0.05)
+        requested = snapshot_worker.get_worker_status()['requested']
+        at.run()
+        if snapshot_worker.get_worker_status()['requested'] == requested:
+            raise RuntimeError("自动刷新到期后页面没有请求刷新")
+
+    # 首次打开（还没有快照时数据状态片段立即请求刷新），不计入统计
+    at.run()
+    _wait_for_refresh(timeout)
+    ready = requests.get(
+        f"{base_url}/load/barrier", params={'name': barrier_name, 'n': num_sessions, 'timeout': timeout}
+    ).json()['ready']
+    if not ready:
+        raise RuntimeError("等待其他会话进程超时")
+
+    for _ in range(cycles):
+        timed('auto', auto_refresh)
+        timed('manual', lambda: _find_widget(at.button, "🔄 手动刷新数据").click().run())
+        timed('refresh_and_save', lambda: _find_widget(at.button, "🔄💾 刷新并保存").click().run())
+
+    # 等待本进程的保存队列上传完毕
+    deadline = time.time() + timeout
+    while save_queue.get_pending_count() > 0 and time.time() < deadline:
+        time.sleep(0.2)
+    return {
+        'timings': timings,
+        'rss_bytes': _rss_bytes(),
+        'pending_saves': save_queue.get_pending_count(),
+        'save_conflicts': save_queue.get_save_queue_status()['conflicts'],
+    }
+
+
+def _start_session_process(base_url, work_dir, barrier_name, num_sessions, args):
+    """启动一个会话进程；页面和各模块在import时读取环境变量，每个进程使用自己的本地目录"""
+    env = dict(
+        os.environ,
+        GITHUB_API_BASE=base_url,
+        SAVE_JOURNAL_DIR=os.path.join(work_dir, "journal"),
+        QUOTE_ARCHIVE_DIR=os.path.join(work_dir, "archive"),
+        ALERT_RULES_FILE=os.path.join(work_dir, "alert_rules.json"),
+        WARM_START_DIR=os.path.join(work_dir, "warm_start"),
+        SNAPSHOT_API_PORT="0",
+    )
+    command = [
+        sys.executable, os.path.abspath(__file__), "--session-process",
+        "--base-url", base_url, "--barrier", barrier_name, "--sessions", str(num_sessions),
+        "--cycles", str(args.cycles), "--timeout", str(args.timeout), "--auto-interval", str(args.auto_interval),
+    ]
+    return subprocess.Popen(command, env=env, stdout=subprocess.PIPE, stderr=subprocess.PIPE, text=True)
+
+
+def run_load_level(state, base_url, num_sessions, args):
+    """以num_sessions个会话进程运行一轮，返回统计结果"""
+    state.reset_counts()
+    work_dir = tempfile.mkdtemp(prefix=f"sse_load_test_{num_sessions}_")
+    barrier_name = os.path.basename(work_dir)
+    start = time.perf_counter()
+    processes = [
+        _start_session_process(base_url, os.path.join(work_dir, f"session_{i}"), barrier_name, num_sessions, args)
+        for i in range(num_sessions)
+    ]
+    sessions = []
+    for i, process in enumerate(processes):
+        stdout, stderr = process.communicate()
+        lines = [line for line in stdout.splitlines() if line.startswith(RESULT_PREFIX)]
+        if process.returncode != 0 or not lines:
+            raise RuntimeError(f"会话进程{i}失败（退出码{process.returncode}）:\n{stderr[-2000:]}")
+        sessions.append(json.loads(lines[-1][len(RESULT_PREFIX):]))
+    wall_time = time.perf_counter() - start
+
+    timings = {}
+    for session in sessions:
+        for kind, values in session['timings'].items():
+            timings.setdefault(kind, []).extend(values)
+    all_refreshes = [t for values in timings.values() for t in values]
+    with state.lock:
+        counts = dict(state.counts)
+    commits = counts.get('github.git.ref.update', 0)
+    conflicts = counts.get('github.git.ref.conflict', 0)
+    upstream = sum(v for k, v in counts.items() if k.startswith('akshare.'))
+    return {
+        'sessions': num_sessions,
+        'refreshes': len(all_refreshes),
+        'wall_s': round(wall_time, 2),
+        'p50_ms': round(_percentile(all_refreshes, 50) * 1000, 1),
+        'p99_ms': round(_percentile(all_refreshes, 99) * 1000, 1),
+        'upstream_requests': upstream,
+        'upstream_per_refresh': round(upstream / max(len(all_refreshes), 1), 1),
+        'github_commits': commits,
+        'save_conflict_rate': round(conflicts / commits, 3) if commits else 0.0,
+        'mem_per_session_mb': round(sum(s['rss_bytes'] for s in sessions) / num_sessions / 1024 / 1024, 2),
+        'pending_saves': sum(s['pending_saves'] for s in sessions),
+        'by_kind_p50_ms': {k: round(_percentile(v, 50) * 1000, 1) for k, v in timings.items()},
+        'by_endpoint': counts,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="多会话看板压力测试（桩服务）")
+    parser.add_argument("--sessions", type=int, nargs="+", default=[1, 5, 10], help="并发会话（进程）数（可多个）")
+    parser.add_argument("--cycles", type=int, default=3, help="每个会话的刷新轮数")
+    parser.add_argument("--latency-ms", type=float, default=20, help="桩服务每个请求的模拟延迟")
+    parser.add_argument("--timeout", type=float, default=300, help="单次页面运行超时（秒）")
+    parser.add_argument("--auto-interval", type=float, default=2, help="测试中的自动刷新间隔（秒）")
+    parser.add_argument("--json", action="store_true", help="以JSON输出结果")
+    # 以下参数由主进程启动会话进程时使用
+    parser.add_argument("--session-process", action="store_true", help=argparse.SUPPRESS)
+    parser.add_argument("--base-url", help=argparse.SUPPRESS)
+    parser.add_argument("--barrier", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.session_process:
+        sys.path.insert(0, os.path.dirname(APP_FILE))
+        result = run_session(
+            args.base_url, args.barrier, args.sessions[0], args.cycles, args.timeout, args.auto_interval
+        )
+        print(RESULT_PREFIX + json.dumps(result), flush=True)
+        # 页面启动的后台线程（快照、上传、快照API）不是守护线程时也不等待
+        os._exit(0)
+
+    state = StubState(args.latency_ms / 1000)
+    server = ThreadingHTTPServer(("127.0.0.1", 0), _make_handler(state))
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    base_url = f"http://127.0.0.1:{server.server_address[1]}"
+
+    results = []
+    for num_sessions in args.sessions:
+        result = run_load_level(state, base_url, num_sessions, args)
+        results.append(result)
+        if not args.json:
+            print(
+                f"N={result['sessions']:>3}  刷新{result['refreshes']:>4}次  "
+                f"p50={result['p50_ms']:>8.1f}ms  p99={result['p99_ms']:>8.1f}ms  "
+                f"上游请求{result['upstream_requests']:>6} ({result['upstream_per_refresh']}/次)  "
+                f"提交{result['github_commits']:>3}  冲突率{result['save_conflict_rate']:.3f}  "
+                f"内存/会话{result['mem_per_session_mb']:.2f}MB  未上传{result['pending_saves']}"
+            )
+    if args.json:
+        print(json.dumps(results, ensure_ascii=False, indent=2))
+    server.shutdown()
+
+
+if __name__ == "__main__":
+    main()
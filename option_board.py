@@ -0,0 +1,137 @@
+# 期权板块数据缓存
+# 每个(期权品种, 合约月份)单独缓存，缺失的键并行获取；
+# 合约集合（品种 x 合约月份，来自get_contract_months）变化时才淘汰旧键，
+# 当前价只作为实时报价失败时的后备，过期后在后台线程刷新，不阻塞页面。
+# 缺失的键最多等待调用方给出的时间（刷新的剩余时间），超时的获取在后台继续，完成后写入缓存。
+# 缓存内容可以导出/恢复，进程重启后由warm_start从本地文件加载。
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, wait
+
+import pandas as pd
+
+# 板块数据（含当前价）的后台刷新间隔（秒）
+BOARD_PRICE_TTL = 300
+# 并行获取板块数据的线程数
+BOARD_FETCH_WORKERS = 8
+
+_cache_lock = threading.Lock()
+# (期权品种, 合约月份) -> {'df': DataFrame, 'fetched_at': 时间戳}
+_board_cache = {}
+_contract_set = [None]
+_refreshing = set()
+# (期权品种, 合约月份) -> 缺失键正在执行的获取
+_fetching = {}
+_executor = ThreadPoolExecutor(max_workers=BOARD_FETCH_WORKERS, thread_name_prefix="board-fetch")
+
+
+def _store(key, df):
+    with _cache_lock:
+        # 合约集合已经变化的旧键不再写回
+        if _contract_set[0] is not None and key in _contract_set[0]:
+            _board_cache[key] = {'df': df, 'fetched_at': time.time()}
+
+
+def _background_refresh(key, fetch_board):
+    try:
+        _store(key, fetch_board(*key))
+    except Exception:
+        pass  # 后台刷新失败时继续使用旧数据，下次再试
+    finally:
+        with _cache_lock:
+            _refreshing.discard(key)
+
+
+def _finish_fetch(key, future):
+    with _cache_lock:
+        if _fetching.get(key) is future:
+            del _fetching[key]
+    if not future.cancelled() and future.exception() is None:
+        _store(key, future.result())
+
+
+def _fetch_missing(key, fetch_board):
+    """获取缺失的键；上一次的获取还在执行时直接复用"""
+    with _cache_lock:
+        future = _fetching.get(key)
+        if future is not None and not future.done():
+            return future
+        future = _executor.submit(fetch_board, *key)
+        _fetching[key] = future
+    future.add_done_callback(lambda done, key=key: _finish_fetch(key, done))
+    return future
+
+
+def get_option_board(symbols, months, fetch_board, timeout=None):
+    """获取全部(品种, 月份)的板块数据，返回(合并后的DataFrame, 获取失败的[(键, 错误)])
+
+    缺失的键最多等待timeout秒，未完成的作为TimeoutError加入获取失败列表。
+    """
+    keys = [(symbol, month) for symbol in symbols for month in months]
+    contract_set = frozenset(keys)
+    now = time.time()
+
+    with _cache_lock:
+        if _contract_set[0] != contract_set:
+            # 合约集合变化（换月、新品种）：淘汰不再需要的键
+            for key in list(_board_cache):
+                if key not in contract_set:
+                    del _board_cache[key]
+            _contract_set[0] = contract_set
+        missing = [key for key in keys if key not in _board_cache]
+        stale = [
+            key for key in keys
+            if key in _board_cache and now - _board_cache[key]['fetched_at'] > BOARD_PRICE_TTL
+            and key not in _refreshing
+        ]
+        _refreshing.update(stale)
+
+    # 过期的键在后台刷新当前价，本次直接使用缓存
+    for key in stale:
+        _executor.submit(_background_refresh, key, fetch_board)
+
+    # 缺失的键并行获取
+    errors = []
+    if missing:
+        futures = {_fetch_missing(key, fetch_board): key for key in missing}
+        done, not_done = wait(futures, timeout=timeout)
+        for future in done:
+            key = futures[future]
+            try:
+                _store(key, future.result())
+            except Exception as e:
+                errors.append((key, e))
+        for future in not_done:
+            errors.append((futures[future], TimeoutError("未在截止时间内完成，后台继续获取")))
+
+    with _cache_lock:
+        frames = [_board_cache[key]['df'] for key in keys if key in _board_cache]
+    frames = [df for df in frames if df is not None and not df.empty]
+    if not frames:
+        return pd.DataFrame(), errors
+    return pd.concat(frames, ignore_index=True), errors
+
+
+def get_board_cache_status():
+    """缓存状态，用于调试信息显示"""
+    now = time.time()
+    with _cache_lock:
+        ages = [now - entry['fetched_at'] for entry in _board_cache.values()]
+        return {
+            'keys': len(_board_cache),
+            'refreshing': len(_refreshing) + sum(1 for future in _fetching.values() if not future.done()),
+            'oldest_age': max(ages) if ages else None,
+        }
+
+
+def export_board_cache():
+    """导出缓存内容（热启动持久化用）"""
+    with _cache_lock:
+        return dict(_board_cache)
+
+
+def restore_board_cache(entries):
+    """恢复持久化的缓存，保留原来的获取时间（过期的键在下一次使用时后台刷新），已有的键不覆盖"""
+    with _cache_lock:
+        for key, entry in entries.items():
+            _board_cache.setdefault(key, entry)
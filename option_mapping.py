@@ -0,0 +1,49 @@
+# 期权代码映射缓存（CONTRACT_ID -> SECURITY_ID）
+# 进程内缓存，后台快照线程和页面脚本共用（后台线程没有Streamlit脚本上下文，不能使用st.cache_data）；
+# 手动刷新时清除以强制重新获取，进程重启后由warm_start从本地文件恢复。
+import threading
+import time
+
+# 映射的有效期（秒）
+OPTION_MAPPING_TTL = 43200
+
+_cache_lock = threading.Lock()
+_fetch_lock = threading.Lock()
+_cache = {'mapping': None, 'fetched_at': None}
+
+
+def _cached(now):
+    with _cache_lock:
+        if _cache['mapping'] and now - _cache['fetched_at'] < OPTION_MAPPING_TTL:
+            return _cache['mapping']
+    return None
+
+
+def get_option_mapping(fetch_mapping):
+    """返回缓存的映射，过期或被清除时调用fetch_mapping重新获取（获取结果为空时不缓存）"""
+    mapping = _cached(time.time())
+    if mapping is not None:
+        return mapping
+    # 同一时间只获取一次，等待中的调用直接使用获取结果
+    with _fetch_lock:
+        mapping = _cached(time.time())
+        if mapping is not None:
+            return mapping
+        mapping = fetch_mapping()
+        if mapping:
+            with _cache_lock:
+                _cache.update(mapping=mapping, fetched_at=time.time())
+        return mapping
+
+
+def clear_option_mapping():
+    """清除缓存，下一次使用时重新获取"""
+    with _cache_lock:
+        _cache.update(mapping=None, fetched_at=None)
+
+
+def restore_option_mapping(mapping, fetched_at):
+    """恢复持久化的映射，保留原来的获取时间（过期的映射在下一次使用时重新获取），已有映射时不覆盖"""
+    with _cache_lock:
+        if _cache['mapping'] is None:
+            _cache.update(mapping=mapping, fetched_at=fetched_at)
@@ -0,0 +1,145 @@
+# 贴水计算公式
+# 实时页面和离线重算（recompute_premium_history.py）共用同一套公式，
+# 修改到期日规则或买卖价选择时只需改这里
+import datetime
+
+import pandas as pd
+
+# 行情表中需要保留的报价字段
+QUOTE_FIELDS = {
+    'bid': '买价',
+    'ask': '卖价',
+    'last': '最新价',
+    'bid_size': '买量',
+    'ask_size': '卖量',
+}
+
+
+def get_expiry_date(month_code):
+    """根据合约月份（如"2506"）计算到期日：当月第4个星期三"""
+    year = 2000 + int(month_code[:2])  # 前两位是年份
+    month_num = int(month_code[2:4])   # 后两位是月份
+    first_day = datetime.date(year, month_num, 1)
+    # 计算第一个星期三
+    first_wednesday = first_day + datetime.timedelta(days=(2 - first_day.weekday()) % 7)
+    # 第四个星期三 = 第一个星期三 + 3周
+    return first_wednesday + datetime.timedelta(weeks=3)
+
+
+def split_call_put(group):
+    """从同一行权价的板块数据中取出Call和Put合约行，缺任意一边返回None"""
+    calls = group[group['合约交易代码'].str.contains('C')]
+    puts = group[group['合约交易代码'].str.contains('P')]
+    if len(calls) > 0 and len(puts) > 0:
+        return calls.iloc[0], puts.iloc[0]
+    return None
+
+
+def parse_option_quote(option_data):
+    """从新浪期权行情表（字段/值两列）中提取买卖价、最新价和买卖量"""
+    quote = {}
+    for key, field in QUOTE_FIELDS.items():
+        try:
+            quote[key] = float(option_data[option_data['字段'] == field]['值'].iloc[0])
+        except (IndexError, KeyError, ValueError):
+            quote[key] = None
+    return quote
+
+
+def select_option_price(quote, option_type):
+    """按报价选择计算用价格：Call使用卖价，Put使用买价，不可用时使用最新价"""
+    if quote is None:
+        return None
+    price = quote.get('ask') if option_type == 'C' else quote.get('bid')
+    # 报价缺失时实时接口给出None，从归档（Parquet）读回的是NaN，两者同样处理
+    if pd.isna(price) or price <= 0:  # 如果买卖价为0或不可用，使用最新价
+        price = quote.get('last')
+    if pd.isna(price) or price <= 0:
+        return None
+    return round(price, 4)  # 保留4位小数
+
+
+def calculate_two_sided(strike, call_quote, put_quote, etf_price, days_to_maturity):
+    """用同一次报价计算反向（Call买价/Put卖价）贴水和买卖价差宽度，报价不完整时为None
+
+    正向（Call卖价/Put买价）即贴水价值本身；价差宽度 = 正向贴水价值 - 反向贴水价值。
+    """
+    result = {'反向贴水价值': None, '反向年化贴水率': None, '价差宽度': None}
+    prices = [(quote or {}).get(key) for quote, key in
+              [(call_quote, 'bid'), (call_quote, 'ask'), (put_quote, 'bid'), (put_quote, 'ask')]]
+    if any(pd.isna(price) or price <= 0 for price in prices):
+        return result
+    call_bid, call_ask, put_bid, put_ask = prices
+    reverse_value = call_bid - put_ask + strike - etf_price
+    result['反向贴水价值'] = round(reverse_value, 4)
+    result['反向年化贴水率'] = round((reverse_value / etf_price) * (365 / max(days_to_maturity, 1)), 4)
+    result['价差宽度'] = round((call_ask - call_bid) + (put_ask - put_bid), 4)
+    return result
+
+
+# calculate_premium_row返回的列（没有任何结果时用于建立空表）
+PREMIUM_COLUMNS = [
+    'ETF类型', '合约月份', '行权价', '贴水价值', '年化贴水率', '剩余天数', 'ETF价格',
+    '反向贴水价值', '反向年化贴水率', '价差宽度'
+]
+
+
+def calculate_premium_row(etf_type, month, strike, call_price, put_price, etf_price, as_of=None,
+                          call_quote=None, put_quote=None):
+    """根据Call/Put价格和ETF价格计算贴水价值、年化贴水率和剩余天数
+
+    传入完整报价时同时计算反向贴水和价差宽度（见calculate_two_sided）。
+    """
+    if etf_price is None or etf_price <= 0:
+        return None  # 如果ETF价格获取失败，跳过计算
+    if as_of is None:
+        as_of = datetime.date.today()
+
+    synthetic_price = call_price - put_price + strike
+    premium_value = synthetic_price - etf_price
+
+    # 精确计算剩余天数（每月第4个星期三到期）
+    days_to_maturity = (get_expiry_date(month) - as_of).days
+
+    return {
+        'ETF类型': etf_type,
+        '合约月份': month,
+        '行权价': strike,
+        '贴水价值': round(premium_value, 4),
+        '年化贴水率': round((premium_value / etf_price) * (365 / max(days_to_maturity, 1)), 4),  # 避免除以0
+        '剩余天数': int(days_to_maturity),  # 只保留整数部分
+        'ETF价格': etf_price,
+        **calculate_two_sided(strike, call_quote, put_quote, etf_price, days_to_maturity)
+    }
+
+
+# 实时报价范围模式
+QUOTE_WINDOW_ALL = "全部行权价"
+QUOTE_WINDOW_STRIKES = "平值附近±N档"
+QUOTE_WINDOW_PERCENT = "平值附近±X%"
+QUOTE_WINDOW_MODES = [QUOTE_WINDOW_ALL, QUOTE_WINDOW_STRIKES, QUOTE_WINDOW_PERCENT]
+
+
+def get_quote_window(strikes_by_group, etf_price_by_type, mode, num_strikes=5, percent=5.0):
+    """计算每个(ETF类型, 合约月份)需要获取实时报价的行权价集合
+
+    strikes_by_group: {(ETF类型, 合约月份): 行权价列表}
+    返回 {(ETF类型, 合约月份): (行权价集合, 下限, 上限)}，全部行权价模式返回None
+    """
+    if mode == QUOTE_WINDOW_ALL:
+        return None
+    window = {}
+    for (etf_type, month), strikes in strikes_by_group.items():
+        strikes = sorted(set(strikes))
+        etf_price = etf_price_by_type.get(etf_type, 0.0)
+        if not strikes or etf_price is None or etf_price <= 0:
+            # 没有ETF价格时无法确定平值，保留全部行权价
+            selected = strikes
+        elif mode == QUOTE_WINDOW_STRIKES:
+            atm_index = min(range(len(strikes)), key=lambda i: abs(strikes[i] - etf_price))
+            selected = strikes[max(0, atm_index - num_strikes):atm_index + num_strikes + 1]
+        else:
+            lower, upper = etf_price * (1 - percent / 100), etf_price * (1 + percent / 100)
+            selected = [k for k in strikes if lower <= k <= upper]
+        window[(etf_type, month)] = (set(selected), min(selected) if selected else None, max(selected) if selected else None)
+    return window
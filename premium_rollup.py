@@ -0,0 +1,92 @@
+# 贴水日度汇总表
+# 每次保存时由完整快照计算当天每个(ETF类型, 合约月份)的汇总行，增量合并到汇总文件；
+# 历史走势、分位数等只读这张小表，不需要加载和聚合整个贴水日志。
+# 同时维护行权价索引（每个(ETF类型, 合约月份, 行权价)一行），历史走势的行权价选择只读索引，
+# 选中某个行权价后才加载贴水日志。
+import pandas as pd
+
+ROLLUP_KEY = ['ETF类型', '合约月份', '记录日期']
+ROLLUP_COLUMNS = ROLLUP_KEY + [
+    '最小值', '中位数', '最大值', '平值行权价', '平值贴水价值', '平值年化贴水率', '行权价数量'
+]
+
+
+def build_daily_rollup(df):
+    """按(ETF类型, 合约月份, 记录日期)汇总年化贴水率的最小值/中位数/最大值、平值贴水和行权价数量
+
+    df需要包含ETF价格列才能确定平值行权价（离ETF价格最近的行权价），否则平值列为空。
+    """
+    if df.empty:
+        return pd.DataFrame(columns=ROLLUP_COLUMNS)
+    df = df.reset_index(drop=True)
+    grouped = df.groupby(ROLLUP_KEY, observed=True)
+    rollup = grouped['年化贴水率'].agg(最小值='min', 中位数='median', 最大值='max')
+    rollup['行权价数量'] = grouped['行权价'].nunique()
+    rollup = rollup.reset_index()
+
+    if 'ETF价格' in df.columns and df['ETF价格'].notna().any():
+        distance = df.assign(_distance=(df['行权价'] - df['ETF价格']).abs())
+        atm = df.loc[distance.groupby(ROLLUP_KEY, observed=True)['_distance'].idxmin().dropna()]
+        atm = atm[ROLLUP_KEY + ['行权价', '贴水价值', '年化贴水率']].rename(columns={
+            '行权价': '平值行权价', '贴水价值': '平值贴水价值', '年化贴水率': '平值年化贴水率'
+        })
+        rollup = rollup.merge(atm, on=ROLLUP_KEY, how='left')
+    return rollup.reindex(columns=ROLLUP_COLUMNS).sort_values('记录日期', kind='stable')
+
+
+def merge_rollup(existing, new_rows):
+    """把新的汇总行合并到汇总表：同一(ETF类型, 合约月份, 记录日期)的旧行被替换"""
+    frames = []
+    for df in (existing, new_rows):
+        if df is not None and not df.empty:
+            # CSV读回的合约月份是整数，统一为字符串后再比较
+            frames.append(df.reindex(columns=ROLLUP_COLUMNS).assign(合约月份=df['合约月份'].astype(str)))
+    if not frames:
+        return pd.DataFrame(columns=ROLLUP_COLUMNS)
+    merged = pd.concat(frames, ignore_index=True)
+    merged = merged.drop_duplicates(ROLLUP_KEY, keep='last')
+    return merged.sort_values(['记录日期', 'ETF类型', '合约月份'], ascending=[False, True, True], kind='stable')
+
+
+STRIKE_INDEX_KEY = ['ETF类型', '合约月份', '行权价']
+STRIKE_INDEX_COLUMNS = STRIKE_INDEX_KEY + ['首次记录日期']
+
+
+def build_strike_index(df):
+    """每个(ETF类型, 合约月份, 行权价)一行，记录首次出现的日期"""
+    if df.empty:
+        return pd.DataFrame(columns=STRIKE_INDEX_COLUMNS)
+    index = df.groupby(STRIKE_INDEX_KEY, observed=True)['记录日期'].min().rename('首次记录日期').reset_index()
+    return index.reindex(columns=STRIKE_INDEX_COLUMNS)
+
+
+def merge_strike_index(existing, new_rows):
+    """把新的行权价合并到索引，已有的行权价保留最早的首次记录日期"""
+    frames = []
+    for df in (existing, new_rows):
+        if df is not None and not df.empty:
+            frames.append(df.reindex(columns=STRIKE_INDEX_COLUMNS).assign(
+                合约月份=df['合约月份'].astype(str), 行权价=df['行权价'].astype(float).round(4)
+            ))
+    if not frames:
+        return pd.DataFrame(columns=STRIKE_INDEX_COLUMNS)
+    merged = pd.concat(frames, ignore_index=True).sort_values('首次记录日期', kind='stable')
+    merged = merged.drop_duplicates(STRIKE_INDEX_KEY, keep='first')
+    return merged.sort_values(STRIKE_INDEX_KEY, kind='stable')
+
+
+def get_rollup_path(history_path):
+    """汇总表与贴水日志放在同一目录，文件名加_Daily_Rollup后缀"""
+    root, ext = history_path.rsplit('.', 1) if '.' in history_path else (history_path, 'csv')
+    return f"{root}_Daily_Rollup.{ext}"
+
+
+def get_strike_index_path(history_path):
+    """行权价索引与贴水日志放在同一目录，文件名加_Strike_Index后缀"""
+    root, ext = history_path.rsplit('.', 1) if '.' in history_path else (history_path, 'csv')
+    return f"{root}_Strike_Index.{ext}"
+
+
+def rollup_records(df):
+    """转换为可写入保存日志的记录（NaN转为None）"""
+    return df.astype(object).where(df.notna(), None).to_dict('records')
@@ -0,0 +1,180 @@
+# 原始行情归档
+# 每次刷新把计算贴水用到的原始输入（期权板块数据、逐合约买卖价、ETF现价）
+# 按天写入压缩的列式文件（Parquet + zstd），供离线重算历史使用。
+# 每次刷新每张表写一个小文件（刷新ID_表名.parquet），写入在后台线程中进行，不占用刷新时间，
+# 开销与当天已刷新的次数无关；收盘后用 python quote_archive.py --compact 把每天的小文件
+# 合并为每张表一个文件（表名.parquet，每行带有刷新ID）。读取时两种文件都支持。
+import argparse
+import datetime
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+import pandas as pd
+
+ARCHIVE_DIR = os.environ.get("QUOTE_ARCHIVE_DIR", "quote_archive")
+
+# 归档表名及对应列
+ARCHIVE_TABLES = {
+    'board': ['ETF类型', '合约月份', '合约交易代码', '行权价', '当前价'],
+    'quotes': ['ETF类型', '合约月份', '行权价', '合约交易代码', '期权类型', 'security_id', 'bid', 'ask', 'last',
+               'bid_size', 'ask_size'],
+    'spot': ['ETF类型', '标的代码', 'ETF价格'],
+}
+
+PARQUET_COMPRESSION = "zstd"
+
+_archive_lock = threading.Lock()
+_writer = [None]
+_writer_lock = threading.Lock()
+_status_lock = threading.Lock()
+_status = {'pending': 0, 'last_error': None}
+
+
+def get_archive_day_dir(day, archive_dir=None):
+    """获取某一天的归档目录"""
+    return os.path.join(archive_dir or ARCHIVE_DIR, day.strftime('%Y-%m-%d'))
+
+
+def _write_parquet(df, final_path):
+    # 先写临时文件再改名，避免重算时读到写了一半的文件
+    tmp_path = final_path + ".tmp"
+    df.to_parquet(tmp_path, compression=PARQUET_COMPRESSION, index=False)
+    os.replace(tmp_path, final_path)
+
+
+def archive_refresh(board_df, quote_records, spot_records, refresh_time, archive_dir=None):
+    """把一次刷新的原始输入写入当天归档目录中的小文件（每张表一个），返回本次刷新的ID（HHMMSSffffff）"""
+    day_dir = get_archive_day_dir(refresh_time.date(), archive_dir)
+    os.makedirs(day_dir, exist_ok=True)
+    # 精确到微秒，同一秒内的两次刷新不会混在一起
+    refresh_id = refresh_time.strftime('%H%M%S%f')
+
+    tables = {
+        'board': board_df.reindex(columns=ARCHIVE_TABLES['board']),
+        'quotes': pd.DataFrame(quote_records, columns=ARCHIVE_TABLES['quotes']),
+        'spot': pd.DataFrame(spot_records, columns=ARCHIVE_TABLES['spot']),
+    }
+    with _archive_lock:
+        for name, df in tables.items():
+            if not df.empty:
+                _write_parquet(df, os.path.join(day_dir, f"{refresh_id}_{name}.parquet"))
+    return refresh_id
+
+
+def _finish_archive(future):
+    with _status_lock:
+        _status['pending'] -= 1
+        if future.exception() is not None:
+            _status['last_error'] = str(future.exception())
+
+
+def archive_refresh_in_background(board_df, quote_records, spot_records, refresh_time, archive_dir=None):
+    """在后台归档线程中执行archive_refresh并立即返回（失败原因见get_archive_status）"""
+    with _writer_lock:
+        if _writer[0] is None:
+            _writer[0] = ThreadPoolExecutor(max_workers=1, thread_name_prefix="quote-archive")
+        writer = _writer[0]
+    with _status_lock:
+        _status['pending'] += 1
+    future = writer.submit(archive_refresh, board_df, list(quote_records), list(spot_records), refresh_time, archive_dir)
+    future.add_done_callback(_finish_archive)
+    return future
+
+
+def get_archive_status():
+    """后台归档的状态：等待写入的刷新数和最近一次失败的原因（读取后清除）"""
+    with _status_lock:
+        status = dict(_status)
+        _status['last_error'] = None
+    return status
+
+
+def compact_archive_day(day, archive_dir=None):
+    """把某一天的小文件合并为每张表一个文件（表名.parquet），返回合并的小文件数"""
+    day_dir = get_archive_day_dir(day, archive_dir)
+    if not os.path.isdir(day_dir):
+        return 0
+    with _archive_lock:
+        parts = {name: [] for name in ARCHIVE_TABLES}
+        for file_name in sorted(os.listdir(day_dir)):
+            refresh_id, _, table = file_name[:-len('.parquet')].partition('_')
+            if file_name.endswith('.parquet') and table in parts:
+                parts[table].append((refresh_id, os.path.join(day_dir, file_name)))
+        for name, files in parts.items():
+            if not files:
+                continue
+            final_path = os.path.join(day_dir, f"{name}.parquet")
+            frames = [pd.read_parquet(final_path)] if os.path.exists(final_path) else []
+            frames += [pd.read_parquet(path).assign(刷新ID=refresh_id) for refresh_id, path in files]
+            _write_parquet(pd.concat(frames, ignore_index=True), final_path)
+            for _, path in files:
+                os.remove(path)
+    return sum(len(files) for files in parts.values())
+
+
+def list_archive_days(archive_dir=None, start=None, end=None):
+    """列出归档中所有日期（可按起止日期过滤）"""
+    root = archive_dir or ARCHIVE_DIR
+    if not os.path.isdir(root):
+        return []
+    days = []
+    for name in sorted(os.listdir(root)):
+        try:
+            day = datetime.datetime.strptime(name, '%Y-%m-%d').date()
+        except ValueError:
+            continue
+        if start is not None and day < start:
+            continue
+        if end is not None and day > end:
+            continue
+        days.append(day)
+    return days
+
+
+def load_archive_day(day, archive_dir=None):
+    """读取某一天的全部归档，返回 {表名: DataFrame}，每行带有刷新ID"""
+    day_dir = get_archive_day_dir(day, archive_dir)
+    frames = {name: [] for name in ARCHIVE_TABLES}
+    if os.path.isdir(day_dir):
+        for file_name in sorted(os.listdir(day_dir)):
+            if not file_name.endswith('.parquet'):
+                continue
+            stem = file_name[:-len('.parquet')]
+            if stem in frames:
+                frames[stem].append(pd.read_parquet(os.path.join(day_dir, file_name)))
+                continue
+            # 未合并的小文件（刷新ID_表名.parquet），刷新ID在文件名中
+            refresh_id, _, table = stem.partition('_')
+            if table not in frames:
+                continue
+            df = pd.read_parquet(os.path.join(day_dir, file_name))
+            df['刷新ID'] = refresh_id
+            frames[table].append(df)
+    return {
+        name: pd.concat(parts, ignore_index=True) if parts else pd.DataFrame(columns=ARCHIVE_TABLES[name] + ['刷新ID'])
+        for name, parts in frames.items()
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="原始行情归档维护")
+    parser.add_argument("--compact", action="store_true", help="把每天的小文件合并为每张表一个文件")
+    parser.add_argument("--archive-dir", default=ARCHIVE_DIR, help="归档目录")
+    parser.add_argument("--include-today", action="store_true", help="同时合并今天的归档（默认只合并今天之前的）")
+    args = parser.parse_args()
+
+    if not args.compact:
+        parser.print_help()
+        return
+    today = datetime.date.today()
+    for day in list_archive_days(args.archive_dir):
+        if day >= today and not args.include_today:
+            continue
+        merged = compact_archive_day(day, args.archive_dir)
+        if merged:
+            print(f"✅ {day}: 合并 {merged} 个文件")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,115 @@
+# 从原始行情归档离线重算贴水历史
+# 用法: python recompute_premium_history.py --start 2026-01-01 --end 2026-06-30 --workers 8
+# 每天的归档由进程池中的一个进程独立重算，公式来自option_premium.py
+import argparse
+import datetime
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+import pandas as pd
+
+from option_premium import split_call_put, select_option_price, calculate_premium_row
+from quote_archive import ARCHIVE_DIR, list_archive_days, load_archive_day
+from underlying_registry import get_display_names
+
+OUTPUT_COLUMNS = ['ETF类型', '合约月份', '行权价', '贴水价值', '年化贴水率', '剩余天数', '记录日期', '记录时间']
+
+
+def recompute_day(day, archive_dir):
+    """重算某一天归档中每次刷新的贴水数据"""
+    tables = load_archive_day(day, archive_dir)
+    board, quotes, spot = tables['board'], tables['quotes'], tables['spot']
+    if board.empty:
+        return pd.DataFrame(columns=OUTPUT_COLUMNS + ['刷新ID'])
+
+    # 按刷新ID建立报价和ETF价格的直接查找表
+    quote_lookup = {
+        (row['刷新ID'], row['合约交易代码']): {'bid': row['bid'], 'ask': row['ask'], 'last': row['last']}
+        for row in quotes.to_dict('records')
+    }
+    spot_lookup = {(row['刷新ID'], row['ETF类型']): row['ETF价格'] for row in spot.to_dict('records')}
+
+    results = []
+    grouped = board.groupby(['刷新ID', 'ETF类型', '合约月份', '行权价'])
+    for (refresh_id, etf_type, month, strike), group in grouped:
+        pair = split_call_put(group)
+        if pair is None:
+            continue
+        call_row, put_row = pair
+
+        call_price = select_option_price(quote_lookup.get((refresh_id, call_row['合约交易代码'])), 'C')
+        if call_price is None:
+            call_price = call_row['当前价']  # fallback到板块数据
+        put_price = select_option_price(quote_lookup.get((refresh_id, put_row['合约交易代码'])), 'P')
+        if put_price is None:
+            put_price = put_row['当前价']  # fallback到板块数据
+
+        result = calculate_premium_row(
+            etf_type, month, strike, call_price, put_price,
+            spot_lookup.get((refresh_id, etf_type)), as_of=day
+        )
+        if result is not None:
+            result['记录日期'] = day.strftime('%Y-%m-%d')
+            result['记录时间'] = f"{refresh_id[:2]}:{refresh_id[2:4]}:{refresh_id[4:6]}"
+            result['刷新ID'] = refresh_id
+            results.append(result)
+
+    # 刷新ID只用于--last-only选出每天最后一次刷新，不写入输出文件
+    return pd.DataFrame(results, columns=OUTPUT_COLUMNS + ['刷新ID'])
+
+
+def recompute_history(days, archive_dir, max_workers=None, last_only=False):
+    """使用进程池并行重算多天的贴水历史"""
+    day_frames = []
+    with ProcessPoolExecutor(max_workers=max_workers) as executor:
+        future_to_day = {executor.submit(recompute_day, day, archive_dir): day for day in days}
+        for future in as_completed(future_to_day):
+            day = future_to_day[future]
+            try:
+                day_df = future.result()
+            except Exception as e:
+                print(f"⚠️ 重算 {day} 失败: {str(e)}")
+                continue
+            if last_only and not day_df.empty:
+                # 与保存到GitHub的日志一致：每天只保留最后一次刷新
+                day_df = day_df[day_df['刷新ID'] == day_df['刷新ID'].max()]
+            day_frames.append(day_df)
+            print(f"✅ {day}: {len(day_df)} 条记录")
+
+    if not day_frames:
+        return pd.DataFrame(columns=OUTPUT_COLUMNS)
+
+    history = pd.concat(day_frames, ignore_index=True)
+    history['ETF类型'] = history['ETF类型'].map(get_display_names()).fillna(history['ETF类型'])
+    return history.sort_values(['记录日期', '记录时间'], ascending=False)
+
+
+def parse_date(value):
+    return datetime.datetime.strptime(value, '%Y-%m-%d').date()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="从原始行情归档重算贴水历史")
+    parser.add_argument("--archive-dir", default=ARCHIVE_DIR, help="归档目录")
+    parser.add_argument("--start", type=parse_date, default=None, help="起始日期 YYYY-MM-DD")
+    parser.add_argument("--end", type=parse_date, default=None, help="结束日期 YYYY-MM-DD")
+    parser.add_argument("--workers", type=int, default=os.cpu_count(), help="进程数")
+    parser.add_argument("--last-only", action="store_true", help="每天只保留最后一次刷新（与日志格式一致）")
+    parser.add_argument("--output", default="All_SSE_ETF_Option_Premium_Recomputed.csv", help="输出CSV文件")
+    args = parser.parse_args()
+
+    days = list_archive_days(args.archive_dir, args.start, args.end)
+    if not days:
+        print("📂 归档中没有符合条件的日期")
+        return
+
+    start_time = time.time()
+    history = recompute_history(days, args.archive_dir, args.workers, args.last_only)
+    columns = OUTPUT_COLUMNS[:-1] if args.last_only else OUTPUT_COLUMNS
+    history[columns].to_csv(args.output, index=False, encoding='utf-8-sig')
+    print(f"📝 共重算 {len(days)} 天，{len(history)} 条记录，耗时 {time.time() - start_time:.1f} 秒 -> {args.output}")
+
+
+if __name__ == "__main__":
+    main()
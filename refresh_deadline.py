@@ -0,0 +1,186 @@
+# 刷新截止时间
+# 一次刷新从开始起最多REFRESH_DEADLINE_SECONDS：期权代码映射、板块数据、ETF现价、贴水计算和昨收
+# 各步骤共用同一个截止时间，每一步只能使用剩余的时间。贴水计算任务提交到进程内常驻的线程池，
+# 每个标的还有自己的预算（underlyings.json中的refresh_budget_seconds）；
+# 其他步骤在单独的步骤线程池中执行。
+# 各标的的任务轮流提交，每个标的同时执行的任务数不超过线程数按标的平分的份额，
+# 慢的标的不会占满线程池、让其他标的的任务排不上；还没有结果或结果最旧的行权价先提交。
+# 已提交但超时的任务不取消，继续在后台执行，完成后写入"最近一次结果"；本次刷新用最近一次结果代替并标记为过期，
+# 超时时还没提交的任务不再提交。下一次刷新时如果该任务仍在执行则直接复用，不重复提交，
+# 复用的结果是用上一次刷新的参数计算的，回调时标记为复用。
+# 最近一次结果按分组（贴水计算、ETF现价、刷新步骤）分别保存，贴水计算的结果随合约到期或下架清理。
+import os
+import threading
+import time
+from collections import Counter, deque
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+
+REFRESH_DEADLINE_SECONDS = float(os.environ.get("REFRESH_DEADLINE_SECONDS", "40"))
+DEFAULT_UNDERLYING_BUDGET_SECONDS = float(os.environ.get("UNDERLYING_BUDGET_SECONDS", "30"))
+DEFAULT_FETCH_WORKERS = 10
+# 刷新步骤（期权代码映射、ETF现价、昨收）线程池的大小
+REFRESH_STAGE_WORKERS = 8
+
+# 分组：贴水计算任务使用贴水线程池，其他分组使用步骤线程池
+PREMIUM_GROUP = 'premium'
+STAGE_GROUP = 'stage'
+
+_executor = [None]
+_executor_workers = [DEFAULT_FETCH_WORKERS]
+_stage_executor = [None]
+_executor_lock = threading.Lock()
+_state_lock = threading.Lock()
+# (分组, 键) -> 执行中的Future
+_in_flight = {}
+# (分组, 键) -> (最近一次结果, 完成时间)
+_last_known = {}
+
+
+def configure_fetch_pool(max_workers=DEFAULT_FETCH_WORKERS):
+    """创建常驻线程池（每个进程一个，重复调用无副作用）"""
+    with _executor_lock:
+        if _executor[0] is None:
+            _executor[0] = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="premium-fetch")
+            _executor_workers[0] = max_workers
+        return _executor[0]
+
+
+def _get_pool(group):
+    if group == PREMIUM_GROUP:
+        return configure_fetch_pool()
+    with _executor_lock:
+        if _stage_executor[0] is None:
+            _stage_executor[0] = ThreadPoolExecutor(max_workers=REFRESH_STAGE_WORKERS, thread_name_prefix="refresh-stage")
+        return _stage_executor[0]
+
+
+def _pool_workers(group):
+    return _executor_workers[0] if group == PREMIUM_GROUP else REFRESH_STAGE_WORKERS
+
+
+def _remember(state_key, future):
+    """任务完成（包括刷新结束后才完成的）时记录结果"""
+    with _state_lock:
+        if _in_flight.get(state_key) is future:
+            del _in_flight[state_key]
+        if not future.cancelled() and future.exception() is None and future.result() is not None:
+            _last_known[state_key] = (future.result(), time.time())
+
+
+def _submit(group, key, worker, payload):
+    """提交任务，返回(Future, 是否复用)；同一个键上一次的任务还在执行时直接复用（不使用新的payload）"""
+    state_key = (group, key)
+    with _state_lock:
+        future = _in_flight.get(state_key)
+        if future is not None and not future.done():
+            return future, True
+        future = _get_pool(group).submit(worker, payload)
+        _in_flight[state_key] = future
+    future.add_done_callback(lambda done, state_key=state_key: _remember(state_key, done))
+    return future, False
+
+
+def run_with_deadline(tasks, worker, budgets=None, deadline=REFRESH_DEADLINE_SECONDS, on_done=None, group=PREMIUM_GROUP):
+    """在截止时间内执行全部任务
+
+    tasks: [(键, 参数)]，键的第一个元素为ETF类型，用于在budgets中查找该标的的预算（秒）
+    on_done(键, Future, 是否复用): 每个任务在截止时间内完成时在调用线程中回调（用于更新进度）；
+    复用上一次刷新仍在执行的任务时"是否复用"为True，结果是用上一次的参数计算的
+    返回(未在截止时间内完成的键列表, 各标的超时的任务数)
+    """
+    budgets = budgets or {}
+
+    def budget(etf_type):
+        return min(budgets.get(etf_type) or DEFAULT_UNDERLYING_BUDGET_SECONDS, deadline)
+
+    # 每个标的一个队列，还没有结果或结果最旧的行权价排在前面，预算不够时各行权价轮流得到更新
+    with _state_lock:
+        fetched_at = {key: _last_known.get((group, key), (None, 0.0))[1] for key, _ in tasks}
+    queues = {}
+    for key, payload in sorted(tasks, key=lambda task: fetched_at[task[0]]):
+        queues.setdefault(key[0], deque()).append((key, payload))
+
+    start = time.monotonic()
+    workers = _pool_workers(group)
+    running = {}  # Future -> (键, 是否复用)
+    timed_out = []
+
+    while queues or running:
+        elapsed = time.monotonic() - start
+        # 超过自身预算的标的不再等待：已提交的任务继续在后台执行，未提交的不再提交
+        for etf_type in set(queues) | {key[0] for key, _ in running.values()}:
+            if elapsed >= budget(etf_type):
+                timed_out.extend(key for key, _ in queues.pop(etf_type, ()))
+                expired = [future for future, (key, _) in running.items() if key[0] == etf_type]
+                timed_out.extend(running.pop(future)[0] for future in expired)
+
+        # 轮流提交各标的的任务，每个标的同时执行的任务数不超过平分的份额
+        active = set(queues) | {key[0] for key, _ in running.values()}
+        limit = max(1, workers // max(len(active), 1))
+        running_count = Counter(key[0] for key, _ in running.values())
+        while queues:
+            submitted = False
+            for etf_type in list(queues):
+                if running_count[etf_type] >= limit:
+                    continue
+                key, payload = queues[etf_type].popleft()
+                if not queues[etf_type]:
+                    del queues[etf_type]
+                future, reused = _submit(group, key, worker, payload)
+                running[future] = (key, reused)
+                running_count[etf_type] += 1
+                submitted = True
+            if not submitted:
+                break
+
+        if not running:
+            continue
+        next_expiry = min(budget(key[0]) for key, _ in running.values())
+        done, _ = wait(list(running), timeout=max(next_expiry - elapsed, 0), return_when=FIRST_COMPLETED)
+        for future in done:
+            key, reused = running.pop(future)
+            if on_done is not None:
+                on_done(key, future, reused)
+
+    timed_out_by_etf = {}
+    for key in timed_out:
+        timed_out_by_etf[key[0]] = timed_out_by_etf.get(key[0], 0) + 1
+    return timed_out, timed_out_by_etf
+
+
+def run_stage(name, func, timeout):
+    """在timeout秒内执行一个刷新步骤，返回(结果, 是否超时)
+
+    超时时步骤在后台继续执行，返回该步骤最近一次成功（结果不为None）的结果，没有时为None；
+    步骤本身抛出的异常原样抛出。
+    """
+    future, _ = _submit(STAGE_GROUP, name, lambda _payload: func(), None)
+    done, _ = wait([future], timeout=max(timeout, 0))
+    if done:
+        return future.result(), False
+    return get_last_known(name, STAGE_GROUP)[0], True
+
+
+def get_last_known(key, group=PREMIUM_GROUP):
+    """最近一次成功的结果及其完成时间，没有时返回(None, None)"""
+    with _state_lock:
+        return _last_known.get((group, key), (None, None))
+
+
+def prune_last_known(active_keys, group=PREMIUM_GROUP):
+    """删除该分组中不在active_keys里的最近结果（已到期或下架的合约），返回删除的数量"""
+    active_keys = set(active_keys)
+    with _state_lock:
+        stale = [state_key for state_key in _last_known if state_key[0] == group and state_key[1] not in active_keys]
+        for state_key in stale:
+            del _last_known[state_key]
+    return len(stale)
+
+
+def get_fetch_status():
+    """后台任务状态，用于调试信息显示"""
+    with _state_lock:
+        return {
+            'in_flight': sum(1 for future in _in_flight.values() if not future.done()),
+            'last_known': sum(1 for group, _key in _last_known if group == PREMIUM_GROUP),
+        }
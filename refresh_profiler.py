@@ -0,0 +1,142 @@
+# 单次刷新的性能分析
+# 采样式CPU分析：后台线程定时抓取刷新线程及其线程池的调用栈（sys._current_frames），
+# 统计各函数的自身/累计采样数，并输出折叠调用栈（可直接用flamegraph.pl或speedscope查看）；
+# 同时用tracemalloc记录刷新期间的内存分配热点。
+import collections
+import datetime
+import io
+import os
+import sys
+import threading
+import time
+import tracemalloc
+
+# 采样间隔（秒）
+SAMPLE_INTERVAL = 0.005
+# 输出的热点数量
+TOP_N = 20
+# 除发起刷新的线程外，只采样这些线程池的工作线程（不采样Streamlit服务线程和空闲的后台线程）
+PROFILED_THREAD_PREFIXES = ("ThreadPoolExecutor", "premium-fetch", "board-fetch", "refresh-stage")
+
+
+def _frame_label(frame):
+    code = frame.f_code
+    return f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})"
+
+
+class SamplingProfiler:
+    """定时采样刷新相关线程调用栈的简易CPU分析器"""
+
+    def __init__(self, target_thread_id, interval=SAMPLE_INTERVAL):
+        self.target_thread_id = target_thread_id
+        self.interval = interval
+        self.stacks = collections.Counter()
+        self.self_counts = collections.Counter()
+        self.total_counts = collections.Counter()
+        self.samples = 0
+        self._stop = threading.Event()
+        self._thread = None
+
+    def _run(self):
+        while not self._stop.is_set():
+            worker_ids = {
+                thread.ident for thread in threading.enumerate()
+                if thread.name.startswith(PROFILED_THREAD_PREFIXES)
+            }
+            for thread_id, frame in sys._current_frames().items():
+                if thread_id != self.target_thread_id and thread_id not in worker_ids:
+                    continue
+                labels = []
+                while frame is not None:
+                    labels.append(_frame_label(frame))
+                    frame = frame.f_back
+                if not labels:
+                    continue
+                labels.reverse()
+                self.stacks[";".join(labels)] += 1
+                self.self_counts[labels[-1]] += 1
+                for label in set(labels):
+                    self.total_counts[label] += 1
+                self.samples += 1
+            time.sleep(self.interval)
+
+    def start(self):
+        self._thread = threading.Thread(target=self._run, name="refresh-profiler", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+
+    def top_functions(self, limit=TOP_N):
+        """按自身采样数排序的热点函数"""
+        rows = []
+        for label, self_count in self.self_counts.most_common(limit):
+            rows.append({
+                '函数': label,
+                '自身占比%': round(self_count / self.samples * 100, 2) if self.samples else 0.0,
+                '累计占比%': round(self.total_counts[label] / self.samples * 100, 2) if self.samples else 0.0,
+                '采样数': self_count,
+            })
+        return rows
+
+    def collapsed_stacks(self):
+        """折叠调用栈格式：每行"栈;帧 次数" """
+        return "\n".join(f"{stack} {count}" for stack, count in self.stacks.most_common())
+
+
+def profile_refresh(func, *args, **kwargs):
+    """执行一次func并同时采集CPU和内存分配数据，返回(函数返回值, 分析报告)"""
+    started_tracemalloc = not tracemalloc.is_tracing()
+    if started_tracemalloc:
+        tracemalloc.start(10)
+    before = tracemalloc.take_snapshot()
+    profiler = SamplingProfiler(threading.get_ident())
+    profiler.start()
+    start_time = time.perf_counter()
+    try:
+        result = func(*args, **kwargs)
+    finally:
+        elapsed = time.perf_counter() - start_time
+        profiler.stop()
+        after = tracemalloc.take_snapshot()
+        current, peak = tracemalloc.get_traced_memory()
+        if started_tracemalloc:
+            tracemalloc.stop()
+
+    allocation_rows = []
+    for stat in after.compare_to(before, 'lineno')[:TOP_N]:
+        frame = stat.traceback[0]
+        allocation_rows.append({
+            '位置': f"{os.path.basename(frame.filename)}:{frame.lineno}",
+            '新增KB': round(stat.size_diff / 1024, 1),
+            '新增块数': stat.count_diff,
+        })
+
+    report = {
+        'created_at': datetime.datetime.now().strftime('%Y%m%d_%H%M%S'),
+        'elapsed': elapsed,
+        'samples': profiler.samples,
+        'peak_kb': round(peak / 1024, 1),
+        'top_functions': profiler.top_functions(),
+        'top_allocations': allocation_rows,
+        'collapsed_stacks': profiler.collapsed_stacks(),
+    }
+    return result, report
+
+
+def format_profile_artifact(report):
+    """把分析报告整理为可下载的文本文件"""
+    out = io.StringIO()
+    out.write(f"# 刷新耗时: {report['elapsed']:.2f}秒, 采样数: {report['samples']}, 内存峰值: {report['peak_kb']}KB\n")
+    out.write("\n# 热点函数（自身占比%, 累计占比%, 函数）\n")
+    for row in report['top_functions']:
+        out.write(f"{row['自身占比%']:6.2f} {row['累计占比%']:6.2f}  {row['函数']}\n")
+    out.write("\n# 内存分配热点（新增KB, 新增块数, 位置）\n")
+    for row in report['top_allocations']:
+        out.write(f"{row['新增KB']:10.1f} {row['新增块数']:8d}  {row['位置']}\n")
+    out.write("\n# 折叠调用栈（flamegraph.pl / speedscope）\n")
+    out.write(report['collapsed_stacks'])
+    out.write("\n")
+    return out.getvalue()
@@ -0,0 +1,475 @@
+# 后台保存队列
+# 保存请求先追加写入本地日志文件（fsync后即视为已确认），页面立即返回；
+# 后台上传线程把所有待上传的保存合并成一次GitHub提交（git data API：贴水日志、日度汇总表和行权价索引
+# 在同一个提交中更新），分支在读取后被其他写入者推进时带退避重试。
+# 同一进程内只有一个上传线程，多个进程之间通过文件锁串行化上传。
+# 写入历史时只保留贴水价值相对上一次存储值变化超过阈值的行，读取时用expand_history前向填充还原；
+# 上一次存储时仍有效、但已不在本次获取的板块合约列表中（下架）的合约写入删除标记（贴水价值为空的行），
+# 前向填充到此为止；只是本次没有贴水（超时、报价失败）的合约不写，读取时继续前向填充。
+# 每次保存同时由完整快照计算日度汇总行和行权价索引（premium_rollup.py），与日志一起上传。
+import base64
+import datetime
+import json
+import os
+import threading
+import time
+from contextlib import contextmanager
+from io import StringIO
+
+import numpy as np
+import pandas as pd
+
+from http_session import get_http_session
+from premium_rollup import (
+    ROLLUP_COLUMNS, STRIKE_INDEX_COLUMNS, build_daily_rollup, merge_rollup, build_strike_index, merge_strike_index,
+    get_rollup_path, get_strike_index_path, rollup_records
+)
+
+try:
+    import fcntl
+except ImportError:  # Windows本地开发时没有fcntl，退化为仅进程内加锁
+    fcntl = None
+
+JOURNAL_DIR = os.environ.get("SAVE_JOURNAL_DIR", ".save_journal")
+JOURNAL_FILE = os.path.join(JOURNAL_DIR, "journal.jsonl")
+JOURNAL_LOCK_FILE = os.path.join(JOURNAL_DIR, "journal.lock")
+UPLOAD_LOCK_FILE = os.path.join(JOURNAL_DIR, "upload.lock")
+
+GITHUB_API_BASE = os.environ.get("GITHUB_API_BASE", "https://api.github.com")
+
+# 收到保存请求后等待一小段时间，把短时间内的多次保存合并为一次提交
+BATCH_WINDOW_SECONDS = 2
+# 没有新请求时也定期检查日志（处理进程重启前遗留的待上传数据）
+IDLE_CHECK_SECONDS = 30
+# 上传失败时的指数退避
+RETRY_BASE_SECONDS = 1
+RETRY_MAX_SECONDS = 60
+MAX_ATTEMPTS_PER_BATCH = 6
+
+HISTORY_COLUMNS = ['ETF类型', '合约月份', '行权价', '贴水价值', '年化贴水率', '剩余天数', '记录日期']
+HISTORY_KEY = ['ETF类型', '合约月份', '行权价']
+# 贴水价值变化不超过该阈值的行不写入历史（0表示只去掉完全不变的行）
+DEDUP_TOLERANCE = float(os.environ.get("HISTORY_DEDUP_TOLERANCE", "0.0005"))
+
+_config = {}
+_wakeup = threading.Event()
+_thread_lock = threading.Lock()
+_uploader_thread = [None]
+_journal_thread_lock = threading.Lock()
+
+_status_lock = threading.Lock()
+_status = {
+    'uploading': False,
+    'last_success': None,
+    'last_error': None,
+    'last_batch_size': 0,
+    'conflicts': 0,
+}
+
+
+def configure_save_queue(owner, repo, file_path, token):
+    """设置GitHub仓库信息（页面每次重跑都会调用，重复调用无副作用）"""
+    _config.update({
+        'owner': owner, 'repo': repo, 'file_path': file_path, 'token': token,
+        'rollup_path': get_rollup_path(file_path),
+        'strike_index_path': get_strike_index_path(file_path),
+    })
+
+
+@contextmanager
+def _file_lock(path):
+    """进程内 + 进程间的排他锁"""
+    os.makedirs(JOURNAL_DIR, exist_ok=True)
+    with open(path, 'a') as lock_file:
+        if fcntl is not None:
+            fcntl.flock(lock_file.fileno(), fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            if fcntl is not None:
+                fcntl.flock(lock_file.fileno(), fcntl.LOCK_UN)
+
+
+@contextmanager
+def _journal_lock():
+    with _journal_thread_lock:
+        with _file_lock(JOURNAL_LOCK_FILE):
+            yield
+
+
+def _to_native(value):
+    """把numpy标量转换为JSON可序列化的Python类型"""
+    if hasattr(value, 'item'):
+        return value.item()
+    return str(value)
+
+
+def enqueue_save(data_to_save, record_date, listed=None):
+    """把一次保存追加到本地日志并立即返回，后台线程负责上传
+
+    data_to_save带有ETF价格列时，日度汇总表中会包含平值贴水。
+    listed为本次获取到的板块合约键[(ETF类型简称, 合约月份, 行权价)]，用于判断合约是否下架（见dedup_rows）。
+    """
+    entry = {
+        'record_date': record_date,
+        'queued_at': datetime.datetime.now().isoformat(timespec='seconds'),
+        'rows': data_to_save[HISTORY_COLUMNS].to_dict('records'),
+        # 汇总行基于去重前的完整快照计算
+        'rollup': rollup_records(build_daily_rollup(data_to_save.assign(记录日期=record_date))),
+        'strikes': rollup_records(build_strike_index(data_to_save.assign(记录日期=record_date))),
+        'listed': listed,
+    }
+    line = json.dumps(entry, ensure_ascii=False, default=_to_native) + "\n"
+    with _journal_lock():
+        with open(JOURNAL_FILE, 'a', encoding='utf-8') as journal:
+            journal.write(line)
+            journal.flush()
+            os.fsync(journal.fileno())
+    start_uploader()
+    _wakeup.set()
+    return get_pending_count()
+
+
+def _read_pending():
+    """读取日志中所有待上传的保存，返回(保存列表, 已读取的字节数)"""
+    with _journal_lock():
+        if not os.path.exists(JOURNAL_FILE):
+            return [], 0
+        with open(JOURNAL_FILE, 'rb') as journal:
+            data = journal.read()
+    # 只处理完整的行，最后一行可能正在写入
+    complete = data[:data.rfind(b"\n") + 1]
+    entries = []
+    for raw_line in complete.splitlines():
+        if raw_line.strip():
+            entries.append(json.loads(raw_line.decode('utf-8')))
+    return entries, len(complete)
+
+
+def _consume_pending(consumed_bytes):
+    """上传成功后从日志中移除已上传的部分，保留期间新追加的保存"""
+    with _journal_lock():
+        with open(JOURNAL_FILE, 'rb') as journal:
+            remaining = journal.read()[consumed_bytes:]
+        tmp_path = JOURNAL_FILE + ".tmp"
+        with open(tmp_path, 'wb') as tmp:
+            tmp.write(remaining)
+            tmp.flush()
+            os.fsync(tmp.fileno())
+        os.replace(tmp_path, JOURNAL_FILE)
+
+
+def get_pending_count():
+    """待上传的保存批数"""
+    entries, _ = _read_pending()
+    return len(entries)
+
+
+def _key_frame(df):
+    """统一键的类型（CSV读回的合约月份是整数，新保存的是字符串）"""
+    return pd.DataFrame({
+        'ETF类型': df['ETF类型'].astype(str).to_numpy(),
+        '合约月份': df['合约月份'].astype(str).to_numpy(),
+        '行权价': df['行权价'].astype(float).round(4).to_numpy(),
+    })
+
+
+def dedup_rows(existing_data, new_rows, record_date, tolerance=DEDUP_TOLERANCE, listed=None):
+    """只保留贴水价值相对该合约上一次存储值（早于record_date）变化超过阈值的行
+
+    上一次存储的值仍在有效期内、new_rows中没有、并且已经下架的合约追加一行删除标记：
+    贴水价值、年化贴水率和剩余天数为空，读取时不再向后填充。listed为本次获取到的板块合约键，
+    所在(ETF类型, 合约月份)的板块已获取但其中没有该合约才算下架；listed为None时不写删除标记。
+    """
+    if existing_data.empty or new_rows.empty:
+        return new_rows
+    earlier = existing_data[existing_data['记录日期'] < record_date]
+    if earlier.empty:
+        return new_rows
+    # 每个合约最近一次存储的贴水价值（删除标记为NaN）
+    earlier = earlier.sort_values('记录日期', kind='stable')
+    last_stored = _key_frame(earlier).assign(
+        上次贴水价值=earlier['贴水价值'].to_numpy(dtype=float),
+        上次到期日=(
+            pd.to_datetime(earlier['记录日期']) + pd.to_timedelta(pd.to_numeric(earlier['剩余天数'], errors='coerce'), unit='D')
+        ).to_numpy(),
+    )
+    last_stored = last_stored.drop_duplicates(HISTORY_KEY, keep='last')
+    new_keys = _key_frame(new_rows)
+    previous = new_keys.merge(last_stored, on=HISTORY_KEY, how='left')['上次贴水价值'].to_numpy()
+    keep = np.isnan(previous) | (np.abs(new_rows['贴水价值'].to_numpy(dtype=float) - previous) > tolerance + 1e-9)
+    if not keep.any():
+        keep[0] = True  # 全部未变化时保留一行，读取时才知道该日期有记录
+
+    if listed is None:
+        return new_rows[keep]
+    # 仍有效（不是删除标记且未到期）、本次没有且已下架的合约写入删除标记
+    alive = last_stored[last_stored['上次贴水价值'].notna() & (last_stored['上次到期日'] >= pd.Timestamp(record_date))]
+    listed_keys = _key_frame(pd.DataFrame(listed, columns=HISTORY_KEY)).drop_duplicates()
+    missing = alive[HISTORY_KEY]
+    for present in [new_keys.drop_duplicates(), listed_keys]:
+        missing = missing.merge(present, on=HISTORY_KEY, how='left', indicator=True)
+        missing = missing.loc[missing['_merge'] == 'left_only', HISTORY_KEY]
+    # 所在板块本次没有获取到（获取失败、超时）时无法判断是否下架
+    missing = missing.merge(listed_keys[['ETF类型', '合约月份']].drop_duplicates(), on=['ETF类型', '合约月份'])
+    if missing.empty:
+        return new_rows[keep]
+    tombstones = pd.DataFrame({
+        **{column: missing[column].to_numpy() for column in HISTORY_KEY},
+        '贴水价值': np.nan, '年化贴水率': np.nan, '剩余天数': np.nan, '记录日期': record_date,
+    }).reindex(columns=new_rows.columns)
+    return pd.concat([new_rows[keep], tombstones], ignore_index=True)
+
+
+def merge_history(existing_data, entries, tolerance=DEDUP_TOLERANCE):
+    """按顺序把保存合并到历史数据中：同一记录日期的旧数据被新数据替换，未变化的行不写入"""
+    final_data = existing_data
+    for entry in entries:
+        new_rows = pd.DataFrame(entry['rows'], columns=HISTORY_COLUMNS)
+        if not final_data.empty and '记录日期' in final_data.columns:
+            final_data = final_data[final_data['记录日期'] != entry['record_date']]
+            new_rows = dedup_rows(final_data, new_rows, entry['record_date'], tolerance, entry.get('listed'))
+        final_data = pd.concat([final_data, new_rows], ignore_index=True) if not final_data.empty else new_rows
+    if '剩余天数' in final_data.columns:
+        # 删除标记的剩余天数为空，其余仍按整数写入CSV
+        final_data = final_data.assign(剩余天数=pd.to_numeric(final_data['剩余天数']).astype('Int64'))
+    # 按日期排序
+    return final_data.sort_values('记录日期', ascending=False, kind='stable')
+
+
+def expand_history(history):
+    """把去重存储的历史还原为每个记录日期的完整序列
+
+    每个合约从首次出现起到到期日为止，每个记录日期都有一行：缺失的日期沿用上一次存储的
+    贴水价值，剩余天数按日历日递减，年化贴水率按剩余天数等比例换算（假设ETF价格不变）。
+    遇到删除标记（贴水价值为空的行）时停止填充，合约重新出现后从新的存储值继续。
+    """
+    if history.empty:
+        return history
+    history = history.assign(_date=pd.to_datetime(history['记录日期'])).sort_values('_date', kind='stable')
+    dates = np.sort(history['_date'].unique())
+
+    # 每个合约需要还原的日期范围：[首次出现, 到期日]（删除标记没有剩余天数，不参与计算）
+    history['_expiry'] = history['_date'] + pd.to_timedelta(pd.to_numeric(history['剩余天数'], errors='coerce'), unit='D')
+    spans = history[history['贴水价值'].notna()].groupby(HISTORY_KEY, sort=False).agg(
+        _first=('_date', 'min'), _expiry=('_expiry', 'max')
+    ).reset_index()
+    start = np.searchsorted(dates, spans['_first'].to_numpy())
+    end = np.searchsorted(dates, spans['_expiry'].to_numpy(), side='right')
+    counts = np.maximum(end - start, 0)
+    offsets = np.arange(counts.sum()) - np.repeat(np.cumsum(counts) - counts, counts)
+    grid = spans.loc[np.repeat(spans.index.to_numpy(), counts), HISTORY_KEY].reset_index(drop=True)
+    grid['_date'] = dates[np.repeat(start, counts) + offsets]
+
+    # 每个日期取该合约最近一次存储的值
+    stored = history[HISTORY_KEY + ['_date', '贴水价值', '年化贴水率', '剩余天数']].assign(_source=history['_date'])
+    full = pd.merge_asof(grid.sort_values('_date'), stored, on='_date', by=HISTORY_KEY, direction='backward')
+    # 最近一次存储的是删除标记：该日期合约不在快照中
+    full = full[full['贴水价值'].notna()]
+    elapsed = (full['_date'] - full['_source']).dt.days.to_numpy()
+    source_days = full['剩余天数'].to_numpy(dtype=int)
+    full['剩余天数'] = np.maximum(source_days - elapsed, 0)
+    full['年化贴水率'] = (
+        full['年化贴水率'] * np.maximum(source_days, 1) / np.maximum(full['剩余天数'], 1)
+    ).round(4)
+    full['记录日期'] = full['_date'].dt.strftime('%Y-%m-%d')
+    columns = [column for column in HISTORY_COLUMNS if column in full.columns]
+    return full[columns].sort_values('记录日期', ascending=False, kind='stable').reset_index(drop=True)
+
+
+def _repo_url(path=""):
+    return f"{GITHUB_API_BASE}/repos/{_config['owner']}/{_config['repo']}{path}"
+
+
+def _contents_url(file_path=None):
+    return _repo_url(f"/contents/{file_path or _config['file_path']}")
+
+
+def _headers():
+    return {"Authorization": f"token {_config['token']}"}
+
+
+def _decode_file(session, file_info):
+    """contents API返回的文件内容；超过1MB的文件不带content，按sha读取blob
+
+    不使用download_url：raw.githubusercontent.com有CDN缓存，内容可能比sha旧。
+    """
+    content = file_info.get('content')
+    if not content and file_info.get('sha'):
+        response = session.get(_repo_url(f"/git/blobs/{file_info['sha']}"), headers=_headers())
+        response.raise_for_status()
+        content = response.json().get('content', '')
+    return base64.b64decode((content or '').replace('\n', '')).decode('utf-8-sig')
+
+
+def fetch_history(file_path=None, ref=None):
+    """从GitHub读取历史CSV（默认为贴水日志），返回(DataFrame, sha)；文件不存在时返回(空DataFrame, None)
+
+    ref为提交的sha时读取该提交中的版本（上传时各文件基于同一个提交合并）。
+    """
+    session = get_http_session()
+    response = session.get(_contents_url(file_path), headers=_headers(), params={'ref': ref} if ref else None)
+    if response.status_code == 404:
+        return pd.DataFrame(), None
+    response.raise_for_status()
+    file_info = response.json()
+    content = _decode_file(session, file_info)
+
+    if not content or content.strip() == "":
+        return pd.DataFrame(), file_info.get('sha')
+    try:
+        return pd.read_csv(StringIO(content.lstrip('\ufeff'))), file_info.get('sha')
+    except pd.errors.EmptyDataError:
+        return pd.DataFrame(), file_info.get('sha')
+
+
+def _get_head():
+    """默认分支及其最新提交的(分支, 提交sha, 树sha)"""
+    session = get_http_session()
+    if 'branch' not in _config:
+        response = session.get(_repo_url(), headers=_headers())
+        response.raise_for_status()
+        _config['branch'] = response.json()['default_branch']
+    branch = _config['branch']
+    response = session.get(_repo_url(f"/git/ref/heads/{branch}"), headers=_headers())
+    response.raise_for_status()
+    commit_sha = response.json()['object']['sha']
+    response = session.get(_repo_url(f"/git/commits/{commit_sha}"), headers=_headers())
+    response.raise_for_status()
+    return branch, commit_sha, response.json()['tree']['sha']
+
+
+def commit_files(files, message, branch, parent_sha, base_tree_sha):
+    """把多个CSV（{路径: DataFrame}）作为parent_sha之后的一个提交写入分支，返回更新分支的HTTP响应
+
+    分支已经不在parent_sha（其他写入者先提交了）时更新失败（422），不会覆盖对方的提交。
+    """
+    session = get_http_session()
+    tree = []
+    for file_path, data in files.items():
+        csv_content = data.to_csv(index=False, encoding='utf-8-sig')
+        response = session.post(_repo_url("/git/blobs"), headers=_headers(), json={
+            "content": base64.b64encode(csv_content.encode('utf-8-sig')).decode(), "encoding": "base64",
+        })
+        response.raise_for_status()
+        tree.append({"path": file_path, "mode": "100644", "type": "blob", "sha": response.json()['sha']})
+    response = session.post(_repo_url("/git/trees"), headers=_headers(), json={"base_tree": base_tree_sha, "tree": tree})
+    response.raise_for_status()
+    response = session.post(_repo_url("/git/commits"), headers=_headers(), json={
+        "message": message, "tree": response.json()['sha'], "parents": [parent_sha],
+    })
+    response.raise_for_status()
+    return session.patch(
+        _repo_url(f"/git/refs/heads/{branch}"), headers=_headers(), json={"sha": response.json()['sha'], "force": False}
+    )
+
+
+def fetch_rollup(ref=None):
+    """从GitHub读取日度汇总表，返回(DataFrame, sha)"""
+    return fetch_history(_config['rollup_path'], ref)
+
+
+def _merge_rollup_entries(existing_rollup, entries, rollup_sha, history):
+    """把保存中的汇总行合并到汇总表；汇总文件还不存在时先由完整历史日志history生成"""
+    if rollup_sha is None and not history.empty:
+        existing_rollup = build_daily_rollup(expand_history(history))
+    new_rows = [row for entry in entries for row in entry.get('rollup', [])]
+    return merge_rollup(existing_rollup, pd.DataFrame(new_rows, columns=ROLLUP_COLUMNS))
+
+
+def fetch_strike_index(ref=None):
+    """从GitHub读取行权价索引，返回(DataFrame, sha)"""
+    return fetch_history(_config['strike_index_path'], ref)
+
+
+def _merge_strike_index_entries(existing_index, entries, index_sha, history):
+    """把保存中的行权价合并到索引；索引文件还不存在时先由完整历史日志history生成"""
+    if index_sha is None and not history.empty:
+        existing_index = build_strike_index(history)
+    new_rows = [row for entry in entries for row in entry.get('strikes', [])]
+    return merge_strike_index(existing_index, pd.DataFrame(new_rows, columns=STRIKE_INDEX_COLUMNS))
+
+
+def _set_status(**kwargs):
+    with _status_lock:
+        _status.update(kwargs)
+
+
+def get_save_queue_status():
+    """后台保存队列的状态，用于界面显示"""
+    with _status_lock:
+        status = dict(_status)
+    status['pending'] = get_pending_count()
+    return status
+
+
+def upload_pending():
+    """上传日志中所有待上传的保存（贴水日志、日度汇总表和行权价索引在同一次提交中更新），返回是否成功"""
+    with _file_lock(UPLOAD_LOCK_FILE):
+        entries, consumed_bytes = _read_pending()
+        if not entries:
+            return True
+
+        _set_status(uploading=True)
+        try:
+            dates = sorted({entry['record_date'] for entry in entries})
+            message = f"Update {_config['file_path']} via API - {', '.join(dates)}"
+            delay = RETRY_BASE_SECONDS
+            for attempt in range(MAX_ATTEMPTS_PER_BATCH):
+                try:
+                    # 每次尝试都重新读取分支的最新提交，三个文件都基于该提交中的版本合并
+                    branch, head_sha, tree_sha = _get_head()
+                    history, _ = fetch_history(ref=head_sha)
+                    rollup, rollup_sha = fetch_rollup(head_sha)
+                    strike_index, index_sha = fetch_strike_index(head_sha)
+                    files = {
+                        _config['file_path']: merge_history(history, entries),
+                        _config['rollup_path']: _merge_rollup_entries(rollup, entries, rollup_sha, history),
+                        _config['strike_index_path']: _merge_strike_index_entries(strike_index, entries, index_sha, history),
+                    }
+                    response = commit_files(files, message, branch, head_sha, tree_sha)
+                    if response.status_code not in [200, 201]:
+                        if response.status_code in [409, 422]:
+                            # 分支冲突：其他写入者先提交了，重新读取后重试
+                            with _status_lock:
+                                _status['conflicts'] += 1
+                        _set_status(last_error=f"{response.status_code} - {response.text[:200]}")
+                    else:
+                        _consume_pending(consumed_bytes)
+                        _set_status(
+                            last_success=datetime.datetime.now().isoformat(timespec='seconds'),
+                            last_error=None,
+                            last_batch_size=len(entries)
+                        )
+                        return True
+                except Exception as e:
+                    _set_status(last_error=str(e))
+                time.sleep(delay)
+                delay = min(delay * 2, RETRY_MAX_SECONDS)
+            return False
+        finally:
+            _set_status(uploading=False)
+
+
+def _uploader_loop():
+    while True:
+        triggered = _wakeup.wait(IDLE_CHECK_SECONDS)
+        if triggered:
+            time.sleep(BATCH_WINDOW_SECONDS)
+        _wakeup.clear()
+        if not _config:
+            continue
+        try:
+            upload_pending()
+        except Exception as e:
+            _set_status(last_error=str(e))
+
+
+def start_uploader():
+    """启动后台上传线程（每个进程只启动一个）"""
+    with _thread_lock:
+        thread = _uploader_thread[0]
+        if thread is None or not thread.is_alive():
+            thread = threading.Thread(target=_uploader_loop, name="github-save-uploader", daemon=True)
+            thread.start()
+            _uploader_thread[0] = thread
@@ -0,0 +1,180 @@
+# 只读快照API
+# 在Streamlit进程内启动一个轻量HTTP服务，直接从内存中的最新快照提供数据：
+#   GET /snapshot.json?etf=50ETF&month=2606
+#   GET /snapshot.arrow?etf=50ETF
+# 支持ETag/If-None-Match，轮询方在数据未变化时只收到304。
+# 每个(格式, 过滤条件)的编码结果按快照版本缓存，不会重复计算。
+# 默认只监听本机；监听其他地址需设置SNAPSHOT_API_PUBLIC=1明确开启，
+# 设置SNAPSHOT_API_TOKEN后请求需带 Authorization: Bearer <token>（/health除外）。
+import hashlib
+import hmac
+import ipaddress
+import json
+import os
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlparse, parse_qs
+
+import pyarrow as pa
+
+from underlying_registry import get_display_names
+
+SNAPSHOT_API_HOST = os.environ.get("SNAPSHOT_API_HOST", "127.0.0.1")
+SNAPSHOT_API_PORT = int(os.environ.get("SNAPSHOT_API_PORT", "8502"))
+SNAPSHOT_API_PUBLIC = os.environ.get("SNAPSHOT_API_PUBLIC", "0") == "1"
+SNAPSHOT_API_TOKEN = os.environ.get("SNAPSHOT_API_TOKEN", "")
+
+_snapshot_lock = threading.Lock()
+_snapshot = {
+    'df': None,
+    'version': None,
+    'updated_at': None,
+    'encoded': {},
+}
+_server = [None]
+_server_error = [None]
+_server_lock = threading.Lock()
+
+
+def publish_snapshot(premium_df, updated_at):
+    """发布新的快照（刷新完成后调用），旧版本的编码缓存随之失效"""
+    df = premium_df.copy()
+    df['ETF简称'] = df['ETF类型'].map(get_display_names()).fillna(df['ETF类型'])
+    df['合约月份'] = df['合约月份'].astype(str)
+    digest = hashlib.sha1(df.to_csv(index=False).encode('utf-8')).hexdigest()[:16]
+    with _snapshot_lock:
+        if digest == _snapshot['version']:
+            return
+        _snapshot.update(df=df, version=digest, updated_at=updated_at.isoformat(timespec='seconds'), encoded={})
+
+
+def _filter_snapshot(df, etf, month):
+    if etf:
+        df = df[(df['ETF简称'] == etf) | (df['ETF类型'] == etf)]
+    if month:
+        df = df[df['合约月份'] == month]
+    return df
+
+
+def _encode(fmt, etf, month):
+    """返回(ETag, 内容类型, 响应体)，按快照版本缓存"""
+    with _snapshot_lock:
+        df, version, updated_at, encoded = (
+            _snapshot['df'], _snapshot['version'], _snapshot['updated_at'], _snapshot['encoded']
+        )
+        cache_key = (fmt, etf, month)
+        if cache_key in encoded:
+            return encoded[cache_key]
+
+    filtered = _filter_snapshot(df, etf, month)
+    if fmt == 'arrow':
+        table = pa.Table.from_pandas(filtered, preserve_index=False)
+        table = table.replace_schema_metadata({**(table.schema.metadata or {}), b'updated_at': updated_at.encode()})
+        sink = pa.BufferOutputStream()
+        with pa.ipc.new_stream(sink, table.schema) as writer:
+            writer.write_table(table)
+        body = sink.getvalue().to_pybytes()
+        content_type = "application/vnd.apache.arrow.stream"
+    else:
+        body = json.dumps({
+            'updated_at': updated_at,
+            'version': version,
+            'rows': json.loads(filtered.to_json(orient='records', force_ascii=False)),
+        }, ensure_ascii=False).encode('utf-8')
+        content_type = "application/json; charset=utf-8"
+
+    etag = f'"{version}-{hashlib.sha1(repr(cache_key).encode()).hexdigest()[:8]}"'
+    result = (etag, content_type, body)
+    with _snapshot_lock:
+        # 编码期间快照可能已更新，只缓存到对应版本
+        if _snapshot['version'] == version:
+            _snapshot['encoded'][cache_key] = result
+    return result
+
+
+def _is_loopback(host):
+    if host == 'localhost':
+        return True
+    try:
+        return ipaddress.ip_address(host).is_loopback
+    except ValueError:
+        return False
+
+
+class _SnapshotHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        parsed = urlparse(self.path)
+        formats = {'/snapshot.json': 'json', '/snapshot': 'json', '/snapshot.arrow': 'arrow'}
+        if parsed.path == '/health':
+            self._send(200, "text/plain", b"ok")
+            return
+        if SNAPSHOT_API_TOKEN and not hmac.compare_digest(
+            self.headers.get('Authorization', '').encode('utf-8'), f"Bearer {SNAPSHOT_API_TOKEN}".encode('utf-8')
+        ):
+            self._send(401, "text/plain", b"unauthorized")
+            return
+        if parsed.path not in formats:
+            self._send(404, "text/plain", b"not found")
+            return
+        if _snapshot['version'] is None:
+            self._send(503, "text/plain", "暂无快照数据".encode('utf-8'))
+            return
+
+        params = parse_qs(parsed.query)
+        etf = params.get('etf', [None])[0]
+        month = params.get('month', [None])[0]
+        etag, content_type, body = _encode(formats[parsed.path], etf, month)
+
+        if_none_match = [tag.strip() for tag in self.headers.get('If-None-Match', '').split(',')]
+        if etag in if_none_match or '*' in if_none_match:
+            self._send(304, None, b"", etag)
+        else:
+            self._send(200, content_type, body, etag)
+
+    def _send(self, status, content_type, body, etag=None):
+        self.send_response(status)
+        if content_type:
+            self.send_header("Content-Type", content_type)
+        if etag:
+            self.send_header("ETag", etag)
+            self.send_header("Cache-Control", "no-cache")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        if body:
+            self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass  # 轮询请求很频繁，不输出访问日志
+
+
+def start_snapshot_api(host=SNAPSHOT_API_HOST, port=SNAPSHOT_API_PORT, public=SNAPSHOT_API_PUBLIC):
+    """启动快照API服务（每个进程只启动一次）；监听非本机地址但未开启public、或端口被占用时返回False"""
+    with _server_lock:
+        if _server[0] is not None:
+            return True
+        if not public and not _is_loopback(host):
+            _server_error[0] = f"监听{host}需设置SNAPSHOT_API_PUBLIC=1"
+            return False
+        try:
+            server = ThreadingHTTPServer((host, port), _SnapshotHandler)
+        except OSError as e:
+            _server_error[0] = f"无法监听{host}:{port}: {e}"
+            return False
+        server.daemon_threads = True
+        threading.Thread(target=server.serve_forever, name="snapshot-api", daemon=True).start()
+        _server[0] = server
+        return True
+
+
+def get_snapshot_api_address():
+    """快照API的监听地址，未启动时返回None"""
+    server = _server[0]
+    if server is None:
+        return None
+    host, port = server.server_address[:2]
+    return f"http://{host}:{port}"
+
+
+def get_snapshot_api_error():
+    """快照API未启动的原因，已启动时返回None"""
+    return None if _server[0] is not None else _server_error[0]
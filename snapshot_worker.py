@@ -0,0 +1,100 @@
+# 后台快照计算（stale-while-revalidate）
+# 数据获取和贴水计算在进程内的一个后台线程中执行，页面脚本只读取最新的快照立即显示：
+# 请求刷新只是把参数交给后台线程，正在计算时到达的请求合并为计算完成后的下一次，不会重复获取；
+# 每个请求有递增的编号，快照记录它包含了哪些编号之前的请求，页面据此判断自己请求的刷新是否已完成。
+import threading
+import time
+
+_lock = threading.Lock()
+_wakeup = threading.Event()
+_worker_thread = [None]
+_state = {
+    'compute': None,       # compute(参数, 进度回调) -> 快照dict
+    'snapshot': None,      # 最新快照
+    'version': 0,          # 快照版本，每次替换加1
+    'pending': None,       # 等待执行的刷新参数
+    'requested': 0,        # 最新的请求编号
+    'completed': 0,        # 已完成（成功或失败）的请求编号
+    'running': False,
+    'started_at': None,
+    'progress': (0, ''),   # (百分比, 当前步骤)
+    'last_error': None,
+}
+
+
+def configure_snapshot_worker(compute):
+    """设置快照计算函数（页面脚本每次运行都会重新定义，使用最新的一个）"""
+    with _lock:
+        _state['compute'] = compute
+
+
+def seed_snapshot(snapshot):
+    """设置初始快照（热启动），已有快照时不覆盖"""
+    with _lock:
+        if _state['snapshot'] is None:
+            _state['snapshot'] = snapshot
+            _state['version'] += 1
+
+
+def request_refresh(params, save=False, profile=False):
+    """请求一次后台刷新并立即返回请求编号
+
+    计算尚未开始的请求合并为一次（使用最新的参数），save/profile只要有一个请求需要就执行
+    """
+    with _lock:
+        pending = _state['pending'] or {'save': False, 'profile': False}
+        _state['pending'] = {
+            **params,
+            'save': pending['save'] or save,
+            'profile': pending['profile'] or profile,
+        }
+        _state['requested'] += 1
+        ticket = _state['requested']
+    _wakeup.set()
+    return ticket
+
+
+def _set_progress(percent, text):
+    with _lock:
+        _state['progress'] = (percent, text)
+
+
+def get_worker_status():
+    """最新快照和后台计算状态"""
+    with _lock:
+        return dict(_state)
+
+
+def _worker_loop():
+    while True:
+        _wakeup.wait()
+        with _lock:
+            _wakeup.clear()
+            params, compute = _state['pending'], _state['compute']
+            if params is None or compute is None:
+                continue
+            _state['pending'] = None
+            # 本次计算包含开始之前的全部请求
+            ticket = _state['requested']
+            _state.update(running=True, started_at=time.time(), progress=(0, ''))
+        snapshot, error = None, None
+        try:
+            snapshot = compute(params, _set_progress)
+            snapshot['ticket'] = ticket
+        except Exception as e:
+            error = str(e)
+        with _lock:
+            if snapshot is not None:
+                _state['snapshot'] = snapshot
+                _state['version'] += 1
+            _state.update(running=False, completed=ticket, last_error=error)
+
+
+def start_snapshot_worker():
+    """启动后台计算线程（每个进程只启动一个）"""
+    with _lock:
+        thread = _worker_thread[0]
+        if thread is None or not thread.is_alive():
+            thread = threading.Thread(target=_worker_loop, name="snapshot-worker", daemon=True)
+            thread.start()
+            _worker_thread[0] = thread
@@ -0,0 +1,34 @@
+# 告警规则：加载时校验规则，冷却状态只保留当前快照中的合约
+import datetime
+
+import pandas as pd
+import pytest
+
+from alert_rules import AlertEngine
+
+RULE = {'id': 'deep', 'etf': '*', 'month': '*', 'metric': '年化贴水率', 'op': '<', 'threshold': -0.03}
+
+
+def snapshot(strikes):
+    return pd.DataFrame({
+        'ETF类型': '华夏上证50ETF期权', '合约月份': '2612', '行权价': strikes,
+        '年化贴水率': -0.05, '贴水价值': -0.01,
+    })
+
+
+def test_rule_without_id_is_rejected_at_load():
+    with pytest.raises(ValueError, match='第2条缺少id'):
+        AlertEngine([RULE, {k: v for k, v in RULE.items() if k != 'id'}], [])
+    with pytest.raises(ValueError, match='id重复'):
+        AlertEngine([RULE, RULE], [])
+
+
+def test_cooldown_state_is_pruned_to_contracts_in_snapshot():
+    engine = AlertEngine([RULE], [])
+    now = datetime.datetime(2026, 10, 19, 10, 0)
+    assert len(engine.evaluate(snapshot([2.7, 2.8]), now)) == 2
+    assert len(engine.last_fired) == 2
+
+    # 2.7下架后不再保留它的冷却状态；仍在快照中的2.8在冷却时间内不重复告警
+    assert engine.evaluate(snapshot([2.8]), now + datetime.timedelta(minutes=1)) == []
+    assert [key[3] for key in engine.last_fired] == [2.8]
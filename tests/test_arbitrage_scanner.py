@@ -0,0 +1,34 @@
+# 套利扫描：分红调整合约（合约单位非标准）不与标准合约组合
+import datetime
+
+from arbitrage_scanner import scan_arbitrage
+
+AS_OF = datetime.date(2026, 10, 19)
+
+
+def quote(strike, option_type, bid, ask, code):
+    return {
+        'ETF类型': '华夏上证50ETF期权', '合约月份': '2612', '行权价': strike,
+        '期权类型': option_type, 'bid': bid, 'ask': ask, '合约交易代码': code,
+    }
+
+
+# 标准合约报价无套利；调整合约的价格按非标准合约单位计，与标准合约放在一起会违反蝶式凸性
+QUOTES = [
+    quote(2.7, 'C', 0.1500, 0.1510, '510050C2612M02700'),
+    quote(2.7, 'P', 0.0500, 0.0510, '510050P2612M02700'),
+    quote(2.8, 'C', 0.0900, 0.0910, '510050C2612M02800'),
+    quote(2.8, 'P', 0.0900, 0.0910, '510050P2612M02800'),
+    quote(2.751, 'C', 0.1600, 0.1610, '510050C2612A02751'),
+    quote(2.751, 'P', 0.0400, 0.0410, '510050P2612A02751'),
+]
+
+
+def test_adjusted_contracts_are_not_paired_with_standard_ones():
+    mixed, _ = scan_arbitrage([{k: v for k, v in q.items() if k != '合约交易代码'} for q in QUOTES], as_of=AS_OF)
+    assert not mixed.empty
+
+    violations, stats = scan_arbitrage(QUOTES, as_of=AS_OF)
+    assert violations.empty
+    assert stats['adjusted'] == 2
+    assert stats['pairs'] == 1
@@ -0,0 +1,53 @@
+# 昨收：从去重存储的贴水日志中取上一个交易日的值
+import datetime
+
+import pandas as pd
+
+import trading_calendar
+from intraday_stats import previous_close_from_history
+from save_queue import HISTORY_COLUMNS, merge_history
+
+DISPLAY_NAMES = {'华泰柏瑞沪深300ETF期权': '300ETF'}
+
+
+def entry(record_date, strikes):
+    days = (pd.Timestamp('2026-06-24') - pd.Timestamp(record_date)).days
+    return {
+        'record_date': record_date,
+        'listed': [['300ETF', '2606', strike] for strike in strikes],
+        'rows': [
+            {'ETF类型': '300ETF', '合约月份': '2606', '行权价': strike, '贴水价值': value,
+             '年化贴水率': round(value / 4 * 365 / days, 4), '剩余天数': days, '记录日期': record_date}
+            for strike, value in strikes.items()
+        ],
+    }
+
+
+def history_of(entries):
+    history = pd.DataFrame(columns=HISTORY_COLUMNS)
+    for e in entries:
+        history = merge_history(history, [e])
+    return history
+
+
+def test_previous_close_uses_expanded_previous_trade_date():
+    history = history_of([
+        entry('2026-04-27', {3.9: 0.01, 4.0: 0.02}),
+        entry('2026-04-28', {3.9: 0.01}),
+        entry('2026-04-29', {3.9: 0.03}),
+    ])
+    closes = previous_close_from_history(history, datetime.date(2026, 4, 28), DISPLAY_NAMES)
+    # 3.9未变化（没有存储行）按4-28的剩余天数换算；4.0在4-28已下架
+    days = (pd.Timestamp('2026-06-24') - pd.Timestamp('2026-04-28')).days
+    assert list(closes) == [('华泰柏瑞沪深300ETF期权', '2606', 3.9)]
+    assert closes[('华泰柏瑞沪深300ETF期权', '2606', 3.9)] == round(0.01 / 4 * 365 / days, 4)
+
+
+def test_current_trade_date_before_open_is_previous_trade_date(monkeypatch):
+    monkeypatch.setattr(trading_calendar, '_get_trade_calendar', lambda: (None, None))  # 按工作日判断
+    tz = trading_calendar.BEIJING_TZ
+    monday = datetime.date(2026, 4, 27)
+    assert trading_calendar.get_current_trade_date(datetime.datetime(2026, 4, 27, 9, 0, tzinfo=tz)) == datetime.date(2026, 4, 24)
+    assert trading_calendar.get_current_trade_date(datetime.datetime(2026, 4, 27, 9, 30, tzinfo=tz)) == monday
+    assert trading_calendar.get_current_trade_date(datetime.datetime(2026, 4, 27, 20, 0, tzinfo=tz)) == monday
+    assert trading_calendar.get_current_trade_date(datetime.datetime(2026, 4, 26, 12, 0, tzinfo=tz)) == datetime.date(2026, 4, 24)
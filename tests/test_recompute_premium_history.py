@@ -0,0 +1,96 @@
+# 离线重算与实时页面的一致性：归档读回的报价要算出与实时路径相同的贴水
+import datetime
+
+import pandas as pd
+
+from option_premium import select_option_price, calculate_premium_row
+from quote_archive import archive_refresh, compact_archive_day, load_archive_day
+from recompute_premium_history import recompute_day
+
+DAY = datetime.date(2026, 6, 1)
+ETF_TYPE = "华泰柏瑞沪深300ETF期权"
+ETF_PRICE = 3.95
+
+BOARD = pd.DataFrame([
+    {'ETF类型': ETF_TYPE, '合约月份': '2606', '合约交易代码': '510300C2606M03900', '行权价': 3.9, '当前价': 0.120},
+    {'ETF类型': ETF_TYPE, '合约月份': '2606', '合约交易代码': '510300P2606M03900', '行权价': 3.9, '当前价': 0.060},
+    {'ETF类型': ETF_TYPE, '合约月份': '2606', '合约交易代码': '510300C2606M04000', '行权价': 4.0, '当前价': 0.070},
+    {'ETF类型': ETF_TYPE, '合约月份': '2606', '合约交易代码': '510300P2606M04000', '行权价': 4.0, '当前价': 0.110},
+])
+
+# 报价中卖价/买价缺失（None）时，实时路径退回最新价
+QUOTES = {
+    '510300C2606M03900': {'bid': 0.094, 'ask': None, 'last': 0.095, 'bid_size': 3.0, 'ask_size': None},
+    '510300P2606M03900': {'bid': None, 'ask': 0.041, 'last': 0.040, 'bid_size': None, 'ask_size': 5.0},
+    '510300C2606M04000': {'bid': 0.051, 'ask': 0.052, 'last': 0.052, 'bid_size': 8.0, 'ask_size': 2.0},
+}
+
+
+def live_premium():
+    """按实时页面的方式计算：有报价时用select_option_price，否则用板块当前价"""
+    rows = []
+    for strike, group in BOARD.groupby('行权价'):
+        call_row = group[group['合约交易代码'].str.contains('C')].iloc[0]
+        put_row = group[group['合约交易代码'].str.contains('P')].iloc[0]
+        call_price = select_option_price(QUOTES.get(call_row['合约交易代码']), 'C')
+        put_price = select_option_price(QUOTES.get(put_row['合约交易代码']), 'P')
+        if call_price is None:
+            call_price = call_row['当前价']
+        if put_price is None:
+            put_price = put_row['当前价']
+        rows.append(calculate_premium_row(ETF_TYPE, '2606', strike, call_price, put_price, ETF_PRICE, as_of=DAY))
+    return pd.DataFrame(rows)
+
+
+def archive(tmp_path, hour, minute, second, microsecond=0):
+    quote_records = []
+    for code, quote in QUOTES.items():
+        board_row = BOARD[BOARD['合约交易代码'] == code].iloc[0]
+        quote_records.append({
+            'ETF类型': ETF_TYPE, '合约月份': '2606', '行权价': board_row['行权价'], '合约交易代码': code,
+            '期权类型': 'C' if 'C' in code else 'P', 'security_id': code[-5:], **quote
+        })
+    spot_records = [{'ETF类型': ETF_TYPE, '标的代码': 'sh510300', 'ETF价格': ETF_PRICE}]
+    refresh_time = datetime.datetime.combine(DAY, datetime.time(hour, minute, second, microsecond))
+    return archive_refresh(BOARD, quote_records, spot_records, refresh_time, str(tmp_path))
+
+
+def test_missing_quote_side_falls_back_to_last_price():
+    assert select_option_price({'ask': None, 'last': 0.095}, 'C') == 0.095
+    assert select_option_price({'ask': float('nan'), 'last': 0.095}, 'C') == 0.095
+    assert select_option_price({'bid': float('nan'), 'last': float('nan')}, 'P') is None
+
+
+def test_recompute_matches_live(tmp_path):
+    archive(tmp_path, 10, 0, 0)
+    live = live_premium().sort_values('行权价').reset_index(drop=True)
+    recomputed = recompute_day(DAY, str(tmp_path)).sort_values('行权价').reset_index(drop=True)
+
+    assert len(recomputed) == len(live)
+    for column in ['行权价', '贴水价值', '年化贴水率', '剩余天数']:
+        assert recomputed[column].astype(float).tolist() == live[column].astype(float).tolist(), column
+
+
+def test_refreshes_write_parts_and_compact_to_one_file_per_day(tmp_path):
+    first = archive(tmp_path, 10, 0, 0, 1)
+    second = archive(tmp_path, 10, 0, 0, 2)  # 同一秒内的第二次刷新不会覆盖第一次
+    assert first != second
+
+    day_dir = tmp_path / DAY.strftime('%Y-%m-%d')
+    assert len(list(day_dir.iterdir())) == 6
+    before = recompute_day(DAY, str(tmp_path))
+
+    assert compact_archive_day(DAY, str(tmp_path)) == 6
+    assert sorted(f.name for f in day_dir.iterdir()) == ['board.parquet', 'quotes.parquet', 'spot.parquet']
+    tables = load_archive_day(DAY, str(tmp_path))
+    assert set(tables['board']['刷新ID']) == {first, second}
+    assert len(tables['quotes']) == 2 * len(QUOTES)
+    after = recompute_day(DAY, str(tmp_path))
+    assert after['刷新ID'].nunique() == 2
+    assert len(after) == len(before)
+
+    # 合并后继续写入的小文件与合并文件一起读取，再次合并时追加到合并文件
+    third = archive(tmp_path, 10, 5, 0, 0)
+    assert set(load_archive_day(DAY, str(tmp_path))['board']['刷新ID']) == {first, second, third}
+    assert compact_archive_day(DAY, str(tmp_path)) == 3
+    assert set(load_archive_day(DAY, str(tmp_path))['board']['刷新ID']) == {first, second, third}
@@ -0,0 +1,43 @@
+# 刷新截止时间：慢标的不占满线程池，复用上一次刷新的任务时标记为复用
+import threading
+import time
+
+import refresh_deadline
+
+
+def test_slow_underlying_does_not_starve_others():
+    refresh_deadline.configure_fetch_pool(4)
+
+    def worker(seconds):
+        time.sleep(seconds)
+        return seconds
+
+    # 慢标的的任务排在前面，按提交顺序执行时快标的会等到超时
+    tasks = [(('slow', i), 0.5) for i in range(20)] + [(('fast', i), 0.01) for i in range(10)]
+    done = []
+    timed_out, timed_out_by_etf = refresh_deadline.run_with_deadline(
+        tasks, worker, {'slow': 0.8, 'fast': 0.8}, 1.0, lambda key, future, reused: done.append(key[0])
+    )
+    assert done.count('fast') == 10
+    assert set(timed_out_by_etf) == {'slow'}
+
+
+def test_reused_in_flight_task_is_flagged():
+    release = threading.Event()
+
+    def worker(payload):
+        release.wait(2)
+        return payload
+
+    key = ('reuse', '2606', 3.9)
+    first, _ = refresh_deadline.run_with_deadline([(key, 'old')], worker, deadline=0.05)
+    assert first == [key]
+    results = []
+    # 第二次刷新提交之后才让任务完成
+    threading.Timer(0.1, release.set).start()
+    refresh_deadline.run_with_deadline(
+        [(key, 'new')], worker, deadline=1.0,
+        on_done=lambda done_key, future, reused: results.append((future.result(), reused))
+    )
+    # 上一次刷新的任务仍在执行，复用其结果（按上一次的参数计算）
+    assert results == [('old', True)]
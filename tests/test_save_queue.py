@@ -0,0 +1,104 @@
+# 去重存储的贴水日志：合并保存 -> CSV -> expand_history 的往返
+from io import StringIO
+
+import pandas as pd
+
+from save_queue import HISTORY_COLUMNS, merge_history, expand_history
+
+
+def entry(record_date, strikes, listed=None):
+    """一次保存：strikes为{行权价: 贴水价值}，剩余天数按6月24日到期计算
+
+    listed为板块中的行权价，默认与strikes相同（没有贴水的合约都已下架）
+    """
+    days = (pd.Timestamp('2026-06-24') - pd.Timestamp(record_date)).days
+    listed = strikes if listed is None else listed
+    return {
+        'listed': [['300ETF', '2606', strike] for strike in listed],
+        'record_date': record_date,
+        'rows': [
+            {'ETF类型': '300ETF', '合约月份': '2606', '行权价': strike, '贴水价值': value,
+             '年化贴水率': round(value / 4 * 365 / days, 4), '剩余天数': days, '记录日期': record_date}
+            for strike, value in strikes.items()
+        ],
+    }
+
+
+def save_and_reload(entries):
+    """逐次合并并写成CSV再读回，与GitHub上的存储方式相同"""
+    history = pd.DataFrame(columns=HISTORY_COLUMNS)
+    for e in entries:
+        history = merge_history(history, [e])
+        history = pd.read_csv(StringIO(history.to_csv(index=False)))
+    return history
+
+
+def dates_by_strike(expanded):
+    return {
+        strike: sorted(group['记录日期'])
+        for strike, group in expanded.groupby('行权价')
+    }
+
+
+def test_unchanged_strike_is_forward_filled():
+    history = save_and_reload([
+        entry('2026-04-27', {3.9: 0.01, 4.0: 0.02}),
+        entry('2026-04-28', {3.9: 0.01, 4.0: 0.02}),
+        entry('2026-04-29', {3.9: 0.01, 4.0: 0.03}),
+    ])
+    expanded = expand_history(history)
+    assert dates_by_strike(expanded) == {
+        3.9: ['2026-04-27', '2026-04-28', '2026-04-29'],
+        4.0: ['2026-04-27', '2026-04-28', '2026-04-29'],
+    }
+    filled = expanded[(expanded['行权价'] == 3.9) & (expanded['记录日期'] == '2026-04-29')].iloc[0]
+    assert filled['剩余天数'] == 56
+    assert filled['贴水价值'] == 0.01
+
+
+def test_disappeared_strike_is_not_forward_filled():
+    history = save_and_reload([
+        entry('2026-04-27', {3.9: 0.01, 4.0: 0.02}),
+        entry('2026-04-28', {3.9: 0.01}),
+        entry('2026-04-29', {3.9: 0.01}),
+    ])
+    # 4.0只在第一天出现，第二天写入一行删除标记，第三天不再重复
+    tombstones = history[history['贴水价值'].isna()]
+    assert tombstones[['行权价', '记录日期']].values.tolist() == [[4.0, '2026-04-28']]
+    assert dates_by_strike(expand_history(history)) == {
+        3.9: ['2026-04-27', '2026-04-28', '2026-04-29'],
+        4.0: ['2026-04-27'],
+    }
+
+
+def test_reappeared_strike_resumes_from_new_value():
+    history = save_and_reload([
+        entry('2026-04-27', {3.9: 0.01, 4.0: 0.02}),
+        entry('2026-04-28', {3.9: 0.01}),
+        entry('2026-04-29', {3.9: 0.01, 4.0: 0.02}),
+        entry('2026-04-30', {3.9: 0.01, 4.0: 0.02}),
+    ])
+    expanded = expand_history(history)
+    assert dates_by_strike(expanded)[4.0] == ['2026-04-27', '2026-04-29', '2026-04-30']
+    assert history['剩余天数'].dropna().astype(float).apply(float.is_integer).all()
+
+
+def test_strike_still_on_board_is_forward_filled():
+    # 4.0仍在板块中，只是本次没有贴水（超时、范围外），不写删除标记
+    history = save_and_reload([
+        entry('2026-04-27', {3.9: 0.01, 4.0: 0.02}),
+        entry('2026-04-28', {3.9: 0.01}, listed=[3.9, 4.0]),
+        entry('2026-04-29', {3.9: 0.01}, listed=[3.9, 4.0]),
+    ])
+    assert history['贴水价值'].notna().all()
+    assert dates_by_strike(expand_history(history))[4.0] == ['2026-04-27', '2026-04-28', '2026-04-29']
+
+
+def test_unloaded_board_writes_no_tombstone():
+    # 2607月份的板块本次没有获取到（不在listed中），无法判断其中的合约是否下架
+    first = entry('2026-04-27', {3.9: 0.01})
+    first['rows'] += [dict(row, 合约月份='2607') for row in entry('2026-04-27', {4.0: 0.02})['rows']]
+    first['listed'] += [['300ETF', '2607', 4.0]]
+    history = save_and_reload([first, entry('2026-04-28', {3.9: 0.01})])
+    assert history['贴水价值'].notna().all()
+    assert dates_by_strike(expand_history(history))[4.0] == ['2026-04-27', '2026-04-28']
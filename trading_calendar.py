@@ -0,0 +1,161 @@
+# 交易日历与刷新调度
+# 交易日来自akshare的交易日历（含节假日），连续竞价时段排除午间休市，
+# 自动刷新按时段使用不同的刷新间隔（开盘和收盘附近更频繁）
+import datetime
+import threading
+import time
+
+BEIJING_TZ = datetime.timezone(datetime.timedelta(hours=8))
+
+# 交易时段（北京时间）：上午9:30-11:30，下午13:00-15:00
+TRADING_SESSIONS = [
+    (datetime.time(9, 30), datetime.time(11, 30)),
+    (datetime.time(13, 0), datetime.time(15, 0)),
+]
+
+# 各时段的自动刷新间隔（秒）：(开始, 结束, 间隔)
+REFRESH_CADENCE = [
+    (datetime.time(9, 30), datetime.time(10, 0), 60),    # 开盘后30分钟，每1分钟
+    (datetime.time(10, 0), datetime.time(11, 30), 300),  # 上午盘中，每5分钟
+    (datetime.time(13, 0), datetime.time(14, 30), 300),  # 下午盘中，每5分钟
+    (datetime.time(14, 30), datetime.time(15, 0), 60),   # 收盘前30分钟，每1分钟
+]
+
+# 交易日历加载失败后的重试间隔（秒），连续失败时翻倍，最长1小时
+TRADE_DATES_RETRY_SECONDS = 60
+TRADE_DATES_RETRY_MAX_SECONDS = 3600
+
+# 交易日历缓存（每天最多重新加载一次），以及日历中的最后一个交易日（加载时计算一次）
+_trade_dates = None
+_trade_dates_max = None
+_trade_dates_loaded_on = None
+_trade_dates_lock = threading.Lock()
+# 加载失败后在此之前不再重试（time.monotonic），以及当前的重试间隔
+_trade_dates_retry = {'at': 0.0, 'delay': TRADE_DATES_RETRY_SECONDS}
+
+
+def _load_trade_dates():
+    """从akshare加载交易日历，失败时返回None（回退为工作日规则）"""
+    try:
+        import akshare as ak
+        trade_date_df = ak.tool_trade_date_hist_sina()
+        return set(trade_date_df['trade_date'].astype(str).map(datetime.date.fromisoformat))
+    except Exception:
+        return None
+
+
+def _get_trade_calendar():
+    """获取(交易日集合, 最后一个交易日)（进程内缓存，每天刷新一次）"""
+    global _trade_dates, _trade_dates_max, _trade_dates_loaded_on
+    today = datetime.datetime.now(BEIJING_TZ).date()
+    with _trade_dates_lock:
+        if _trade_dates_loaded_on != today and time.monotonic() >= _trade_dates_retry['at']:
+            trade_dates = _load_trade_dates()
+            if trade_dates:
+                _trade_dates = trade_dates
+                _trade_dates_max = max(trade_dates)
+                _trade_dates_loaded_on = today
+                _trade_dates_retry['delay'] = TRADE_DATES_RETRY_SECONDS
+            else:
+                # 加载失败时保留之前的日历（没有时按工作日判断），退避一段时间后再重试
+                _trade_dates_retry['at'] = time.monotonic() + _trade_dates_retry['delay']
+                _trade_dates_retry['delay'] = min(_trade_dates_retry['delay'] * 2, TRADE_DATES_RETRY_MAX_SECONDS)
+        return _trade_dates, _trade_dates_max
+
+
+def get_trade_dates():
+    """获取交易日集合（进程内缓存，每天刷新一次）"""
+    return _get_trade_calendar()[0]
+
+
+def is_trade_date(day):
+    """判断某天是否为交易日，无法获取日历时按工作日判断"""
+    trade_dates, last_trade_date = _get_trade_calendar()
+    if trade_dates is None or day > last_trade_date:
+        return day.weekday() < 5
+    return day in trade_dates
+
+
+def get_previous_trade_dates(num_days, before=None):
+    """获取指定日期之前的最近若干个交易日（不含当天）"""
+    day = before or datetime.datetime.now(BEIJING_TZ).date()
+    dates = []
+    # 最多向前查找一年，防止日历异常时死循环
+    for _ in range(366):
+        if len(dates) >= num_days:
+            break
+        day -= datetime.timedelta(days=1)
+        if is_trade_date(day):
+            dates.append(day)
+    return dates
+
+
+def get_current_trade_date(now=None):
+    """当前行情所属的交易日：交易日开盘（第一个交易时段开始）后为当天，否则为上一个交易日"""
+    now = now or datetime.datetime.now(BEIJING_TZ)
+    today = now.date()
+    if is_trade_date(today) and now.time() >= TRADING_SESSIONS[0][0]:
+        return today
+    return get_previous_trade_dates(1, before=today)[0]
+
+
+def get_trading_session(now):
+    """返回当前所处交易时段的(开始, 结束)，不在交易时段返回None"""
+    if not is_trade_date(now.date()):
+        return None
+    current = now.time()
+    for start, end in TRADING_SESSIONS:
+        if start <= current < end:
+            return start, end
+    return None
+
+
+def is_trading_time(now=None):
+    """检查当前是否为交易时间（交易日且处于连续交易时段，北京时间）"""
+    now = now or datetime.datetime.now(BEIJING_TZ)
+    return get_trading_session(now) is not None
+
+
+def get_refresh_interval(now):
+    """当前时段的自动刷新间隔（秒），不在交易时段返回None"""
+    if get_trading_session(now) is None:
+        return None
+    current = now.time()
+    for start, end, interval in REFRESH_CADENCE:
+        if start <= current < end:
+            return interval
+    return None
+
+
+def get_next_session_open(now):
+    """下一个交易时段的开始时间（严格晚于now）"""
+    day = now.date()
+    for _ in range(366):
+        if is_trade_date(day):
+            for start, _end in TRADING_SESSIONS:
+                session_open = datetime.datetime.combine(day, start, tzinfo=now.tzinfo)
+                if session_open > now:
+                    return session_open
+        day += datetime.timedelta(days=1)
+    return None
+
+
+def get_next_refresh_time(now, last_refresh):
+    """根据交易日历和刷新节奏计算下一次自动刷新时间"""
+    interval = get_refresh_interval(now)
+    if interval is None:
+        # 休市期间：下一个交易时段开盘时刷新
+        return get_next_session_open(now)
+
+    next_refresh = last_refresh + datetime.timedelta(seconds=interval)
+    _start, end = get_trading_session(now)
+    session_end = datetime.datetime.combine(now.date(), end, tzinfo=now.tzinfo)
+    if next_refresh >= session_end:
+        # 本时段内已无刷新机会，顺延到下一个交易时段开盘
+        return get_next_session_open(session_end - datetime.timedelta(microseconds=1))
+    return next_refresh
+
+
+def describe_trading_sessions():
+    """交易时段的文字描述，用于界面显示"""
+    return "、".join(f"{start.strftime('%H:%M')}-{end.strftime('%H:%M')}" for start, end in TRADING_SESSIONS)
@@ -0,0 +1,136 @@
+# 期权标的注册表
+# 全部ETF期权品种集中配置在underlyings.json中（期权板块名称、标的现价代码、简称、交易所），
+# 进程内只加载一次并预先建立字典查找表；新增品种只需修改配置文件，无需改代码
+# （配置文件修改后，在下一次刷新开始时由reload_registry重新加载）。
+import json
+import os
+import threading
+
+import pandas as pd
+
+UNDERLYINGS_FILE = os.environ.get(
+    "UNDERLYINGS_FILE", os.path.join(os.path.dirname(os.path.abspath(__file__)), "underlyings.json")
+)
+
+# 深交所期权板块数据的默认列名（可在配置中用board_columns覆盖）
+SZSE_BOARD_COLUMNS = {
+    'security_id': '合约编码',
+    'underlying': '标的名称',
+    'option_type': '类型',
+    'strike': '行权价',
+    'expiry': '期权行权日',
+}
+
+_registry = {'mtime': None, 'value': None}
+_registry_lock = threading.Lock()
+
+
+def _build_registry(underlyings):
+    """根据配置建立各种直接查找表"""
+    underlyings = [u for u in underlyings if u.get('enabled', True)]
+    return {
+        'underlyings': underlyings,
+        # 期权板块名称 -> 完整配置
+        'by_board_symbol': {u['board_symbol']: u for u in underlyings},
+        # 期权板块名称 -> 标的现价代码
+        'spot_code': {u['board_symbol']: u['spot_code'] for u in underlyings},
+        # 期权板块名称 -> 简称（同时支持简称查自身）
+        'display_names': {
+            **{u['short_name']: u['short_name'] for u in underlyings},
+            **{u['board_symbol']: u['short_name'] for u in underlyings},
+        },
+        # 标的现价代码 -> 简称
+        'spot_names': {u['spot_code']: u['short_name'] for u in underlyings},
+        # 期权板块名称 -> 每次刷新的等待预算（秒，可选）
+        'refresh_budgets': {
+            u['board_symbol']: u['refresh_budget_seconds'] for u in underlyings if u.get('refresh_budget_seconds')
+        },
+    }
+
+
+def reload_registry():
+    """配置文件修改过时重新加载注册表（每次刷新开始时调用一次，不在逐个合约的查找中检查文件）"""
+    mtime = os.path.getmtime(UNDERLYINGS_FILE)
+    with _registry_lock:
+        if _registry['mtime'] != mtime:
+            with open(UNDERLYINGS_FILE, encoding='utf-8') as f:
+                config = json.load(f)
+            _registry.update(mtime=mtime, value=_build_registry(config['underlyings']))
+        return _registry['value']
+
+
+def get_registry():
+    """获取已加载的注册表（首次调用时加载，之后不再访问文件和锁）"""
+    registry = _registry['value']
+    if registry is None:
+        registry = reload_registry()
+    return registry
+
+
+def get_board_symbols():
+    """全部期权板块名称"""
+    return [u['board_symbol'] for u in get_registry()['underlyings']]
+
+
+def get_spot_codes():
+    """全部标的现价代码 -> 简称"""
+    return get_registry()['spot_names']
+
+
+def get_spot_code(board_symbol):
+    """期权板块名称对应的标的现价代码"""
+    return get_registry()['spot_code'].get(board_symbol)
+
+
+def get_display_names():
+    """期权板块名称 -> 简称"""
+    return get_registry()['display_names']
+
+
+def get_refresh_budgets():
+    """期权板块名称 -> 刷新等待预算（秒），未配置的品种使用默认预算"""
+    return get_registry()['refresh_budgets']
+
+
+def normalize_board(option_data, board_symbol, month=None):
+    """把不同交易所的期权板块数据统一为上交所格式（合约交易代码、当前价、行权价）
+
+    深交所接口返回的是全部标的、按两位月份过滤的合约列表：按标的名称（配置中的
+    board_underlying_keywords，默认为标的代码）和到期年月（month，如"2606"）筛选出本品种的合约。
+    深交所板块数据没有上交所格式的合约交易代码，按"标的代码+C/P+年月+M+行权价"合成，
+    并直接携带合约编码作为security_id（新浪行情可直接用合约编码查询）。
+    筛选后没有合约时抛出ValueError，不把其他标的的合约当作本品种。
+    """
+    spec = get_registry()['by_board_symbol'][board_symbol]
+    if spec.get('exchange', 'SSE') != 'SZSE':
+        return option_data
+
+    columns = {**SZSE_BOARD_COLUMNS, **spec.get('board_columns', {})}
+    underlying_code = spec['spot_code'][2:]
+    if columns['underlying'] not in option_data.columns:
+        raise ValueError(f"{board_symbol} 板块数据缺少{columns['underlying']}列，无法区分标的")
+    keywords = spec.get('board_underlying_keywords') or [underlying_code]
+    underlying = option_data[columns['underlying']].astype(str)
+    option_data = option_data[underlying.apply(lambda name: any(keyword in name for keyword in keywords))]
+
+    expiry = pd.to_datetime(option_data[columns['expiry']].astype(str))
+    if month is not None:
+        in_month = (expiry.dt.strftime('%y%m') == month).to_numpy()
+        option_data, expiry = option_data[in_month], expiry[in_month]
+    if option_data.empty:
+        raise ValueError(f"{board_symbol} 板块数据中没有标的为{'/'.join(keywords)}的{month or ''}月合约")
+
+    is_call = option_data[columns['option_type']].astype(str).str.contains('购|C', regex=True)
+    strike = pd.to_numeric(option_data[columns['strike']], errors='coerce')
+
+    normalized = pd.DataFrame({
+        '合约交易代码': (
+            underlying_code + is_call.map({True: 'C', False: 'P'}) + expiry.dt.strftime('%y%m')
+            + 'M' + (strike * 1000).round().astype('Int64').astype(str).str.zfill(5)
+        ),
+        # 深交所合约列表没有当前价，实时报价失败（或在报价范围外）的行权价没有后备价格
+        '当前价': pd.to_numeric(option_data['当前价'], errors='coerce') if '当前价' in option_data.columns else float('nan'),
+        '行权价': strike,
+        'security_id': option_data[columns['security_id']].astype(str),
+    })
+    return normalized.dropna(subset=['行权价'])
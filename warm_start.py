@@ -0,0 +1,95 @@
+# 进程重启后的热启动
+# 每次刷新完成后把最新快照（Parquet + zstd）、期权代码映射和板块数据缓存（pickle）写到本地目录；
+# 进程启动后第一次读取时加载回来：页面先显示上一次的快照，板块缓存和期权代码映射保留原来的获取时间，
+# 过期的照常重新获取，不必等待完整获取。
+import datetime
+import os
+import pickle
+import threading
+import time
+
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+from option_board import export_board_cache, restore_board_cache
+from option_mapping import restore_option_mapping
+
+WARM_START_DIR = os.environ.get("WARM_START_DIR", ".warm_start")
+SNAPSHOT_FILE = "premium_snapshot.parquet"
+OPTION_MAPPING_FILE = "option_mapping.pkl"
+BOARD_CACHE_FILE = "board_cache.pkl"
+PARQUET_COMPRESSION = "zstd"
+
+_lock = threading.Lock()
+_loaded = [False]
+
+
+def _path(name):
+    return os.path.join(WARM_START_DIR, name)
+
+
+def _write_atomic(name, write):
+    """先写临时文件再改名，进程在写入中途退出时不会留下损坏的文件"""
+    os.makedirs(WARM_START_DIR, exist_ok=True)
+    final_path = _path(name)
+    tmp_path = final_path + ".tmp"
+    write(tmp_path)
+    os.replace(tmp_path, final_path)
+
+
+def _dump_pickle(name, obj):
+    def write(tmp_path):
+        with open(tmp_path, 'wb') as f:
+            pickle.dump(obj, f, protocol=pickle.HIGHEST_PROTOCOL)
+    _write_atomic(name, write)
+
+
+def _load_pickle(name):
+    try:
+        with open(_path(name), 'rb') as f:
+            return pickle.load(f)
+    except Exception:
+        return None  # 文件不存在或已损坏时当作没有热启动数据
+
+
+def _load_snapshot():
+    try:
+        table = pq.read_table(_path(SNAPSHOT_FILE))
+    except Exception:
+        return None, None
+    refreshed_at = (table.schema.metadata or {}).get(b'refreshed_at')
+    refreshed_at = datetime.datetime.fromisoformat(refreshed_at.decode()) if refreshed_at else None
+    return table.to_pandas(), refreshed_at
+
+
+def load_warm_start():
+    """进程启动后第一次调用时读取磁盘上的快照，并恢复期权代码映射和板块缓存
+
+    返回(快照DataFrame, 刷新时间)；没有热启动数据或不是第一次调用时返回(None, None)
+    """
+    with _lock:
+        if _loaded[0]:
+            return None, None
+        _loaded[0] = True
+    mapping = _load_pickle(OPTION_MAPPING_FILE)
+    if mapping:
+        restore_option_mapping(mapping['mapping'], mapping['saved_at'])
+    board_cache = _load_pickle(BOARD_CACHE_FILE)
+    if board_cache:
+        restore_board_cache(board_cache)
+    return _load_snapshot()
+
+
+def save_option_mapping(mapping):
+    """保存期权代码映射"""
+    _dump_pickle(OPTION_MAPPING_FILE, {'saved_at': time.time(), 'mapping': mapping})
+
+
+def save_warm_start(premium_df, refreshed_at):
+    """刷新完成后保存最新快照和板块缓存"""
+    table = pa.Table.from_pandas(premium_df, preserve_index=False)
+    table = table.replace_schema_metadata({
+        **(table.schema.metadata or {}), b'refreshed_at': refreshed_at.isoformat().encode()
+    })
+    _write_atomic(SNAPSHOT_FILE, lambda tmp_path: pq.write_table(table, tmp_path, compression=PARQUET_COMPRESSION))
+    _dump_pickle(BOARD_CACHE_FILE, export_board_cache())